@@ -10,10 +10,15 @@ import re
 import json
 import time
 import threading
+import sys
 from datetime import datetime, timedelta
 from pathlib import Path
 from collections import defaultdict, deque
 
+# 允许从 archive 目录直接运行
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from augment_tools_core.patch_logging import SUMMARY_PREFIX, parse_summary_lines
+
 class RuntimeMonitoringSystem:
     """运行时监控系统"""
     
@@ -23,6 +28,7 @@ class RuntimeMonitoringSystem:
         self.statistics = defaultdict(int)
         self.alerts = []
         self.start_time = None
+        self.seen_summaries = set()  # 已计入的 (session, seq)，避免重复读取日志时重复计数
         
         # VSCode 日志路径
         self.vscode_log_paths = [
@@ -144,8 +150,18 @@ class RuntimeMonitoringSystem:
         }
         
         lines = content.split('\n')
+        
+        # 补丁活动以汇总行输出，直接累加其中的计数器
+        summary = parse_summary_lines(lines, self.seen_summaries)
+        for category, count in summary['counts'].items():
+            tag = category.split(':')[0].strip().lower().replace(' ', '_')
+            self.statistics[f'patch_{tag}'] += count
+        if summary['summaries']:
+            self._log_event('PATCH', f"补丁汇总: {summary['summaries']} 条, {summary['events']} 个事件")
+        
         for line in lines[-100:]:  # 只分析最后100行
-            timestamp = datetime.now().strftime('%H:%M:%S')
+            if SUMMARY_PREFIX in line:
+                continue
             
             # 检查补丁活动
             for pattern_name, pattern in patch_patterns.items():
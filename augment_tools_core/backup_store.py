@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+内容寻址备份仓库
+按 sha256 存储备份内容（相同内容只保存一份），清单记录 (路径, 时间戳) → 哈希，
+并支持按保留策略进行垃圾回收
+
+清单分为两部分：manifest.json 是垃圾回收时写出的快照，之后的每次备份只向
+manifest.jsonl 追加一行，不再重写整个清单；读取时合并两者。清单读写和对象入库都在
+进程间文件锁（manifest.lock）内进行，GUI 备份与命令行 backup-gc 同时运行也不会丢失记录。
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from .common_utils import (
+    print_info, print_success, print_warning, print_error,
+    copy_file_with_hash, hash_file, get_tool_data_dir
+)
+
+# 默认保留策略：每个路径保留最近 5 份，超过 30 天的旧备份会被清理（最新一份始终保留）
+DEFAULT_KEEP_LAST = 5
+DEFAULT_MAX_AGE_DAYS = 30
+
+MANIFEST_VERSION = 1
+
+# 同一仓库目录在进程内共享一把锁，保证清单读写的一致性
+_store_locks: Dict[str, threading.Lock] = {}
+_store_locks_guard = threading.Lock()
+
+
+def _get_store_lock(root: Path) -> threading.Lock:
+    key = str(root)
+    with _store_locks_guard:
+        lock = _store_locks.get(key)
+        if lock is None:
+            lock = threading.Lock()
+            _store_locks[key] = lock
+        return lock
+
+
+@contextmanager
+def _file_lock(lock_path: Path):
+    """进程间排他锁（POSIX 使用 flock，Windows 使用 msvcrt.locking）"""
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK 重试约 10 秒后失败，继续等待
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class BackupStore:
+    """内容寻址备份仓库"""
+
+    def __init__(self, root: Optional[Union[str, Path]] = None):
+        self.root = Path(root) if root else get_tool_data_dir() / "backup_store"
+        self.objects_dir = self.root / "objects"
+        self.manifest_path = self.root / "manifest.json"
+        self.journal_path = self.root / "manifest.jsonl"
+        self.lock_path = self.root / "manifest.lock"
+        self._lock = _get_store_lock(self.root)
+
+    @contextmanager
+    def _locked(self):
+        """进程内线程锁 + 进程间文件锁"""
+        with self._lock, _file_lock(self.lock_path):
+            yield
+
+    # --- 对象存储 ---
+
+    def blob_path(self, digest: str) -> Path:
+        """返回摘要对应的对象文件路径"""
+        return self.objects_dir / digest[:2] / digest
+
+    def has_blob(self, digest: str) -> bool:
+        """检查对象是否已存在"""
+        return self.blob_path(digest).exists()
+
+    def store_file(self, file_path: Union[str, Path], digest: Optional[str] = None,
+                   record_as: Optional[Union[str, Path]] = None) -> Optional[str]:
+        """
+        将文件内容存入仓库并在清单中记录
+
+        内容已存在时只需一次哈希计算，不再复制数据。
+
+        Args:
+            file_path: 要备份的文件
+            digest: 已知的文件摘要（可省去一次哈希计算）
+            record_as: 在清单中记录的原始路径（file_path 为临时快照时使用）
+
+        Returns:
+            内容摘要，失败时返回 None
+        """
+        source = Path(file_path)
+        try:
+            if digest is None:
+                digest = hash_file(source)
+
+            # 入库和记录在同一把锁内，垃圾回收不会在两者之间删除尚未记录的对象
+            with self._locked():
+                if not self.has_blob(digest):
+                    digest = self._ingest(source)
+                    if not digest:
+                        return None
+
+                self._record(Path(record_as) if record_as else source, digest, source.stat().st_size)
+            return digest
+        except Exception as e:
+            print_error(f"写入备份仓库失败 {source}: {e}")
+            return None
+
+    def _ingest(self, source: Path) -> Optional[str]:
+        """复制文件到仓库（优先 reflink），校验后以摘要命名"""
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        temp_path = self.objects_dir / f".incoming-{os.getpid()}-{threading.get_ident()}"
+        digest = copy_file_with_hash(source, temp_path)
+        if not digest:
+            return None
+
+        blob = self.blob_path(digest)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        if blob.exists():
+            # 并发写入了相同内容
+            temp_path.unlink()
+        else:
+            os.replace(temp_path, blob)
+        return digest
+
+    def materialize(self, digest: str, dest: Union[str, Path]) -> bool:
+        """
+        在目标位置生成备份副本，优先使用硬链接（不占用额外空间）
+
+        目标文件会先被删除再重新链接，不会写穿仓库中的对象。
+        """
+        blob = self.blob_path(digest)
+        dest_path = Path(dest)
+        if not blob.exists():
+            print_error(f"备份对象不存在: {digest}")
+            return False
+
+        try:
+            if dest_path.exists() or dest_path.is_symlink():
+                dest_path.unlink()
+            try:
+                os.link(blob, dest_path)
+                return True
+            except OSError:
+                pass  # 跨文件系统或不支持硬链接时回退为复制
+
+            copied = copy_file_with_hash(blob, dest_path)
+            if copied != digest:
+                print_error(f"备份对象校验失败: {digest}")
+                return False
+            return True
+        except Exception as e:
+            print_error(f"生成备份副本失败 {dest_path}: {e}")
+            return False
+
+    def restore(self, file_path: Union[str, Path], digest: Optional[str] = None) -> bool:
+        """
+        从仓库恢复文件（默认恢复该路径最近一次的备份）
+
+        使用复制而不是硬链接，避免之后对原文件的就地写入破坏仓库对象。
+        """
+        target = Path(file_path)
+        if digest is None:
+            entry = self.latest(target)
+            if not entry:
+                print_warning(f"备份仓库中没有该文件的记录: {target}")
+                return False
+            digest = entry["sha256"]
+
+        blob = self.blob_path(digest)
+        if not blob.exists():
+            print_error(f"备份对象不存在: {digest}")
+            return False
+
+        temp_path = target.with_name(f".{target.name}.restore-{os.getpid()}")
+        copied = copy_file_with_hash(blob, temp_path)
+        if copied != digest:
+            print_error(f"备份对象校验失败: {digest}")
+            return False
+        os.replace(temp_path, target)
+        print_success(f"已从备份仓库恢复: {target} (sha256: {digest[:12]})")
+        return True
+
+    # --- 清单 ---
+
+    def _load_manifest(self) -> List[dict]:
+        """读取清单快照并合并追加日志中的记录"""
+        entries = []
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            entries = data.get("entries", [])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print_warning(f"备份清单无法读取，将重新创建: {e}")
+
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # 写入中断留下的半行
+                        continue
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print_warning(f"备份清单日志无法读取: {e}")
+        return entries
+
+    def _save_manifest(self, entries: List[dict]) -> None:
+        """写出完整的清单快照并清空追加日志"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        temp_path = self.manifest_path.with_suffix(f".json.tmp-{os.getpid()}")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": MANIFEST_VERSION, "entries": entries}, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, self.manifest_path)
+        try:
+            self.journal_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _record(self, source: Path, digest: str, size: int) -> None:
+        """向清单日志追加一条记录（调用方须持有 _locked）"""
+        entry = {
+            "path": str(source.resolve()),
+            "timestamp": time.time(),
+            "sha256": digest,
+            "size": size,
+        }
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def entries(self, file_path: Optional[Union[str, Path]] = None) -> List[dict]:
+        """列出清单记录（可按路径过滤），按时间从新到旧排序"""
+        with self._locked():
+            entries = self._load_manifest()
+        if file_path is not None:
+            key = str(Path(file_path).resolve())
+            entries = [e for e in entries if e.get("path") == key]
+        return sorted(entries, key=lambda e: e.get("timestamp", 0), reverse=True)
+
+    def latest(self, file_path: Union[str, Path]) -> Optional[dict]:
+        """返回该路径最近一次的备份记录"""
+        entries = self.entries(file_path)
+        return entries[0] if entries else None
+
+    # --- 垃圾回收 ---
+
+    def garbage_collect(self, keep_last: int = DEFAULT_KEEP_LAST,
+                        max_age_days: Optional[float] = DEFAULT_MAX_AGE_DAYS) -> Dict[str, int]:
+        """
+        按保留策略清理清单并删除不再被引用的对象
+
+        每个路径最多保留最近 keep_last 份，其中超过 max_age_days 的也会被清理，
+        但每个路径最新的一份始终保留。
+
+        Returns:
+            dict: entries_removed / blobs_removed / bytes_freed
+        """
+        stats = {"entries_removed": 0, "blobs_removed": 0, "bytes_freed": 0}
+        cutoff = time.time() - max_age_days * 86400 if max_age_days is not None else None
+
+        with self._locked():
+            entries = self._load_manifest()
+
+            by_path: Dict[str, List[dict]] = {}
+            for entry in entries:
+                by_path.setdefault(entry.get("path", ""), []).append(entry)
+
+            kept = []
+            for path_entries in by_path.values():
+                path_entries.sort(key=lambda e: e.get("timestamp", 0), reverse=True)
+                for rank, entry in enumerate(path_entries):
+                    if rank == 0:
+                        kept.append(entry)
+                    elif rank < keep_last and (cutoff is None or entry.get("timestamp", 0) >= cutoff):
+                        kept.append(entry)
+
+            stats["entries_removed"] = len(entries) - len(kept)
+            if stats["entries_removed"]:
+                self._save_manifest(kept)
+
+            referenced = {e.get("sha256") for e in kept}
+            if self.objects_dir.exists():
+                for bucket in self.objects_dir.iterdir():
+                    if not bucket.is_dir():
+                        continue
+                    for blob in bucket.iterdir():
+                        if blob.name in referenced:
+                            continue
+                        try:
+                            size = blob.stat().st_size
+                            blob.unlink()
+                            stats["blobs_removed"] += 1
+                            stats["bytes_freed"] += size
+                        except OSError as e:
+                            print_warning(f"无法删除备份对象 {blob}: {e}")
+
+        print_info(f"备份仓库清理完成: 移除 {stats['entries_removed']} 条记录, "
+                   f"{stats['blobs_removed']} 个对象, 释放 {stats['bytes_freed']} 字节")
+        return stats
+
+
+# 默认仓库实例
+_default_store = None
+
+
+def get_backup_store() -> BackupStore:
+    """获取默认的备份仓库实例"""
+    global _default_store
+    if _default_store is None:
+        _default_store = BackupStore()
+    return _default_store
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并发批量补丁引擎
+使用有界线程池并发补丁多个扩展文件，每个文件独立加锁、独立失败（临时文件 + os.replace，失败时原文件不变），
+进度事件通过队列汇总，供 GUI 线程或 CLI 消费。
+事务模式下所有文件通过 PatchManager.apply_patch_transaction 一起提交：任一文件失败则全部保持原样。
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .common_utils import IDEType
+from .extension_finder import ExtensionFinder
+from .patch_manager import PatchManager, PatchMode
+
+# 进度事件类型（队列元素为元组，第一个元素为事件类型）
+EVENT_PROGRESS = "progress"      # ("progress", message)
+EVENT_FILE_DONE = "file_done"    # ("file_done", ide_value, file_result)
+EVENT_IDE_DONE = "ide_done"      # ("ide_done", ide_value, success, message)
+EVENT_FINISHED = "finished"      # ("finished", results)
+
+# 同一进程内按真实路径共享的文件锁，避免同一文件被并发补丁
+_file_locks: Dict[str, threading.Lock] = {}
+_file_locks_guard = threading.Lock()
+
+
+def _get_file_lock(file_path: str) -> threading.Lock:
+    key = os.path.realpath(file_path)
+    with _file_locks_guard:
+        lock = _file_locks.get(key)
+        if lock is None:
+            lock = threading.Lock()
+            _file_locks[key] = lock
+        return lock
+
+
+def default_worker_count(job_count: int) -> int:
+    """
+    按 I/O 负载确定线程数：补丁主要耗时在读写大文件，线程数可以高于 CPU 核数，
+    但不超过任务数，并设置上限避免在网络文件系统上产生过多并发请求
+    """
+    io_workers = min(32, (os.cpu_count() or 1) * 4)
+    return max(1, min(job_count, io_workers))
+
+
+class BatchPatchJob:
+    """单个补丁任务"""
+    def __init__(self, ide_type: IDEType, file_path: str, patch_mode: PatchMode):
+        self.ide_type = ide_type
+        self.file_path = file_path
+        self.patch_mode = patch_mode
+
+
+class BatchPatcher:
+    """并发批量补丁引擎"""
+
+    def __init__(self, patch_manager: Optional[PatchManager] = None,
+                 extension_finder: Optional[ExtensionFinder] = None,
+                 max_workers: Optional[int] = None, transactional: bool = False):
+        self.patch_manager = patch_manager or PatchManager()
+        self.extension_finder = extension_finder or ExtensionFinder()
+        self.max_workers = max_workers
+        self.transactional = transactional
+        self.events: "queue.Queue[Tuple]" = queue.Queue()
+
+    def collect_jobs(self, ide_configs: Dict[IDEType, Dict]) -> Tuple[List[BatchPatchJob], List[IDEType]]:
+        """
+        对每个IDE只执行一次扩展发现，生成补丁任务
+
+        Args:
+            ide_configs: {IDEType: {'patch_mode': PatchMode, 'portable_root': Optional[str]}}
+
+        Returns:
+            (任务列表, 未找到扩展文件的IDE列表)
+        """
+        jobs = []
+        missing = []
+        seen = set()
+
+        for ide_type, config in ide_configs.items():
+            patch_mode = config.get('patch_mode', PatchMode.RANDOM)
+            portable_root = config.get('portable_root')
+            files = self.extension_finder.find_extension_files(ide_type, portable_root)
+            if not files:
+                missing.append(ide_type)
+                continue
+
+            for file_path in files:
+                real_path = os.path.realpath(file_path)
+                if real_path in seen:
+                    continue
+                seen.add(real_path)
+                jobs.append(BatchPatchJob(ide_type, file_path, patch_mode))
+
+        return jobs, missing
+
+    def _emit(self, *event) -> None:
+        self.events.put(event)
+
+    def _patch_one(self, job: BatchPatchJob) -> dict:
+        """
+        补丁单个文件；失败只影响当前文件
+
+        apply_patch 捕获所有异常并返回失败的 PatchResult，且先写入同目录临时文件再
+        os.replace，失败时原文件保持不变，因此这里无需再从备份回滚。
+        """
+        with _get_file_lock(job.file_path):
+            result = self.patch_manager.apply_patch(job.file_path, job.patch_mode)
+
+        return {
+            'path': job.file_path,
+            'success': result.success,
+            'already_patched': result.already_patched,
+            'message': result.message
+        }
+
+    def _patch_transaction(self, jobs: List[BatchPatchJob]) -> List[dict]:
+        """事务模式：按路径顺序锁定所有文件后一起暂存、一起提交"""
+        locks = sorted({os.path.realpath(job.file_path): _get_file_lock(job.file_path) for job in jobs}.items())
+        for _, lock in locks:
+            lock.acquire()
+        try:
+            patch_results = self.patch_manager.apply_patch_transaction(
+                [job.file_path for job in jobs], jobs[0].patch_mode, [job.patch_mode for job in jobs])
+        finally:
+            for _, lock in reversed(locks):
+                lock.release()
+
+        file_results = []
+        for index, job in enumerate(jobs):
+            # 事务中止时其后的文件没有结果
+            result = patch_results[index] if index < len(patch_results) else None
+            file_results.append({
+                'path': job.file_path,
+                'success': bool(result and result.success),
+                'already_patched': bool(result and result.already_patched),
+                'message': result.message if result else "事务中止，未处理",
+            })
+        return file_results
+
+    def run(self, jobs: List[BatchPatchJob]) -> Dict[str, dict]:
+        """
+        执行补丁任务（阻塞直到全部完成）：默认并发；事务模式下全部成功或全部保持原样
+
+        Returns:
+            按IDE汇总的结果: {ide_value: {'success', 'message', 'files': [...]}}
+        """
+        results: Dict[str, dict] = {}
+        remaining: Dict[str, int] = {}
+        for job in jobs:
+            ide_value = job.ide_type.value
+            remaining[ide_value] = remaining.get(ide_value, 0) + 1
+            results.setdefault(ide_value, {'success': False, 'message': "", 'files': []})
+
+        if not jobs:
+            self._emit(EVENT_FINISHED, results)
+            return results
+
+        def record(job: BatchPatchJob, file_result: dict) -> None:
+            ide_value = job.ide_type.value
+            ide_result = results[ide_value]
+            ide_result['files'].append(file_result)
+            self._emit(EVENT_FILE_DONE, ide_value, file_result)
+
+            remaining[ide_value] -= 1
+            if remaining[ide_value] == 0:
+                files = ide_result['files']
+                success_count = sum(1 for f in files if f['success'])
+                ide_result['success'] = success_count > 0
+                ide_result['message'] = f"成功补丁 {success_count}/{len(files)} 个文件"
+                self._emit(EVENT_IDE_DONE, ide_value, ide_result['success'], ide_result['message'])
+
+        if self.transactional:
+            self._emit(EVENT_PROGRESS, f"🚀 事务模式补丁 {len(jobs)} 个文件（任一失败则全部保持原样）")
+            for job, file_result in zip(jobs, self._patch_transaction(jobs)):
+                record(job, file_result)
+            self._emit(EVENT_FINISHED, results)
+            return results
+
+        workers = self.max_workers or default_worker_count(len(jobs))
+        self._emit(EVENT_PROGRESS, f"🚀 使用 {workers} 个线程并发补丁 {len(jobs)} 个文件")
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="patch") as executor:
+            futures = {executor.submit(self._patch_one, job): job for job in jobs}
+            for future in as_completed(futures):
+                record(futures[future], future.result())
+
+        self._emit(EVENT_FINISHED, results)
+        return results
+
+    def start(self, jobs: List[BatchPatchJob]) -> threading.Thread:
+        """在后台线程中执行 run()，调用方通过 iter_events() 消费进度"""
+        def _run_safely():
+            try:
+                self.run(jobs)
+            except Exception as e:
+                self._emit(EVENT_PROGRESS, f"❌ 批量补丁引擎异常: {e}")
+                self._emit(EVENT_FINISHED, {})
+
+        thread = threading.Thread(target=_run_safely, daemon=True)
+        thread.start()
+        return thread
+
+    def iter_events(self, poll_interval: float = 0.1) -> Iterator[Tuple]:
+        """持续取出进度事件，直到收到 EVENT_FINISHED（包含该事件）"""
+        while True:
+            try:
+                event = self.events.get(timeout=poll_interval)
+            except queue.Empty:
+                continue
+            yield event
+            if event[0] == EVENT_FINISHED:
+                return
@@ -6,7 +6,7 @@ import asyncio
 from enum import Enum
 from typing import Dict, Any, Optional
 from .common_utils import IDEType, get_ide_display_name, print_info, print_success, print_warning, print_error
-from .database_manager import clean_ide_database
+from .database_manager import clean_ide_database_enhanced
 from .file_cleaner import FileCleaner
 from .process_manager import ProcessManager
 
@@ -24,18 +24,21 @@ class CleanupOptions:
                  keyword: str = "augment",
                  force_delete: bool = False,
                  kill_processes: bool = False,
-                 skip_process_check: bool = False):
+                 skip_process_check: bool = False,
+                 compact_database: bool = True):
         self.mode = mode
         self.keyword = keyword
         self.force_delete = force_delete
         self.kill_processes = kill_processes
         self.skip_process_check = skip_process_check
+        self.compact_database = compact_database
 
 class CleanupResult:
     """清理结果"""
     def __init__(self):
         self.database_cleaned = False
         self.database_entries_removed = 0
+        self.database_bytes_reclaimed = 0
         self.files_deleted = 0
         self.global_storage_files = 0
         self.workspace_storage_files = 0
@@ -57,6 +60,8 @@ class CleanupResult:
         
         if self.database_cleaned:
             summary.append(f"数据库清理: 移除 {self.database_entries_removed} 个条目")
+            if self.database_bytes_reclaimed > 0:
+                summary.append(f"  - 压缩回收: {self.database_bytes_reclaimed / 1024:.1f} KB")
         
         if self.files_deleted > 0:
             summary.append(f"文件删除: {self.files_deleted} 个文件")
@@ -156,14 +161,16 @@ class CleanupStrategy:
         print_info("执行数据库内容清理...")
         
         try:
-            success = clean_ide_database(ide_type, options.keyword)
-            if success:
+            db_result = clean_ide_database_enhanced(ide_type, options.keyword,
+                                                    compact=options.compact_database)
+            if db_result["success"]:
                 result.database_cleaned = True
-                # 注意：这里无法获取具体删除的条目数，需要修改database_manager.py来返回这个信息
-                result.database_entries_removed = 1  # 占位符
+                result.database_entries_removed = db_result["entries_removed"]
+                if db_result.get("compaction"):
+                    result.database_bytes_reclaimed = db_result["compaction"]["bytes_reclaimed"]
                 print_success("数据库清理完成")
             else:
-                error_msg = "数据库清理失败"
+                error_msg = f"数据库清理失败: {db_result['error_message']}"
                 print_error(error_msg)
                 result.add_error(error_msg)
         except Exception as e:
@@ -212,7 +219,8 @@ class CleanupStrategy:
             keyword=options.keyword,
             force_delete=True,
             kill_processes=True,
-            skip_process_check=False
+            skip_process_check=False,
+            compact_database=options.compact_database
         )
         
         # 强制终止进程
@@ -58,20 +58,47 @@ def main_cli(language):
         language_manager = get_language_manager(config_manager)
         language_manager.set_language(language)
 
+    # 回滚上次异常退出时未完成的补丁事务
+    try:
+        from .patch_transaction import recover_pending_transactions
+        recover_pending_transactions()
+    except Exception as e:
+        print_warning(f"恢复未完成的补丁事务失败: {e}")
+
+def _resolve_keywords(keyword, pattern) -> list:
+    """--keyword 可重复；未指定关键字和正则时默认使用 augment"""
+    if isinstance(keyword, str):
+        keyword = [keyword]
+    keywords = list(keyword or ())
+    if not keywords and not pattern:
+        keywords = ['augment']
+    return keywords
+
 @main_cli.command("clean-db")
 @click.option('--ide', default='vscode', show_default=True,
               help=get_text("cli.ide_option_help"))
-@click.option('--keyword', default='augment', show_default=True,
-              help=get_text("cli.keyword_option_help"))
-def clean_db_command(ide: str, keyword: str):
-    """Cleans the specified IDE's state database by removing entries matching the keyword."""
+@click.option('--keyword', multiple=True,
+              help=get_text("cli.keyword_option_help") + " (repeatable, default: augment)")
+@click.option('--pattern', multiple=True,
+              help='Regular expression matched against keys (case-insensitive, repeatable)')
+@click.option('--lock-timeout', default=30.0, show_default=True, type=click.FloatRange(min=0),
+              help='Seconds to keep retrying while the IDE holds the database lock')
+@click.option('--wait-for-exit', is_flag=True,
+              help='While waiting for the lock, watch the IDE processes and retry as soon as they exit')
+def clean_db_command(ide: str, keyword, pattern=(), lock_timeout=30.0, wait_for_exit=False):
+    """Cleans the specified IDE's state database by removing entries matching the keywords.
+
+    All keywords and patterns are removed with a single backup and a single table scan.
+    """
     try:
         ide_type = parse_ide_type(ide)
         ide_name = get_ide_display_name(ide_type)
+        keywords = _resolve_keywords(keyword, pattern)
+        label = ", ".join([f"'{k}'" for k in keywords] + [f"/{p}/" for p in pattern])
 
-        print_info(get_text("cli.executing", operation=f"{ide_name} Database Cleaning (keyword: '{keyword}')"))
+        print_info(get_text("cli.executing", operation=f"{ide_name} Database Cleaning (keyword: {label})"))
 
-        if clean_ide_database(ide_type, keyword):
+        if clean_ide_database(ide_type, keywords, list(pattern), lock_timeout, wait_for_exit):
             print_info(get_text("cli.finished"))
         else:
             print_error(get_text("cli.errors"))
@@ -103,29 +130,42 @@ def modify_ids_command(ide: str):
 @main_cli.command("run-all")
 @click.option('--ide', default='vscode', show_default=True,
               help=get_text("cli.ide_option_help"))
-@click.option('--keyword', default='augment', show_default=True,
-              help=get_text("cli.keyword_clean_help"))
-@click.pass_context
-def run_all_command(ctx, ide: str, keyword: str):
-    """Runs all available tools for the specified IDE: clean-db and then modify-ids."""
+@click.option('--keyword', multiple=True,
+              help=get_text("cli.keyword_clean_help") + " (repeatable, default: augment)")
+@click.option('--pattern', multiple=True,
+              help='Regular expression matched against keys (case-insensitive, repeatable)')
+def run_all_command(ide: str, keyword, pattern):
+    """Runs all available tools for the specified IDE: clean-db and then modify-ids.
+
+    Paths are resolved once, all touched files are snapshotted once up front and the
+    database connection is shared between the steps.
+    """
+    from .session import MaintenanceSession
+
     try:
         ide_type = parse_ide_type(ide)
         ide_name = get_ide_display_name(ide_type)
+        keywords = _resolve_keywords(keyword, pattern)
 
         print_info(get_text("cli.executing", operation=f"Run All Tools for {ide_name}"))
 
-        print_info(get_text("cli.step", step="1", operation=f"{ide_name} Database Cleaning"))
-        try:
-            ctx.invoke(clean_db_command, ide=ide, keyword=keyword)
-        except Exception as e:
-            print_error(get_text("cli.error_occurred", step="database cleaning", error=str(e)))
-            print_warning(get_text("cli.proceeding"))
+        with MaintenanceSession(ide_type, keywords, pattern) as session:
+            session.snapshot()
 
-        print_info(get_text("cli.step", step="2", operation=f"{ide_name} Telemetry ID Modification"))
-        try:
-            ctx.invoke(modify_ids_command, ide=ide)
-        except Exception as e:
-            print_error(get_text("cli.error_occurred", step="telemetry ID modification", error=str(e)))
+            print_info(get_text("cli.step", step="1", operation=f"{ide_name} Database Cleaning"))
+            try:
+                if not session.clean_database()["success"]:
+                    print_warning(get_text("cli.proceeding"))
+            except Exception as e:
+                print_error(get_text("cli.error_occurred", step="database cleaning", error=str(e)))
+                print_warning(get_text("cli.proceeding"))
+
+            print_info(get_text("cli.step", step="2", operation=f"{ide_name} Telemetry ID Modification"))
+            try:
+                if not session.modify_telemetry_ids():
+                    print_error(get_text("cli.errors"))
+            except Exception as e:
+                print_error(get_text("cli.error_occurred", step="telemetry ID modification", error=str(e)))
 
         print_success(get_text("cli.all_finished", ide_name=ide_name))
 
@@ -140,7 +180,7 @@ def clean_vscode_db_command(keyword: str):
     """[DEPRECATED] Use 'clean-db --ide vscode' instead."""
     print_warning("This command is deprecated. Use 'clean-db --ide vscode' instead.")
     ctx = click.get_current_context()
-    ctx.invoke(clean_db_command, ide='vscode', keyword=keyword)
+    ctx.invoke(clean_db_command, ide='vscode', keyword=(keyword,))
 
 @main_cli.command("modify-vscode-ids", hidden=True)
 def modify_vscode_ids_command():
@@ -307,5 +347,231 @@ def file_cleanup_command(ide, force):
     except Exception as e:
         print_error(f"文件清理失败: {e}")
 
+@main_cli.command("backup-gc")
+@click.option('--keep', default=5, show_default=True, help='Backups to keep per file')
+@click.option('--max-age-days', default=30.0, show_default=True, help='Drop older backups (the newest one per file is always kept)')
+def backup_gc_command(keep, max_age_days):
+    """Garbage-collect the content-addressed backup store."""
+    from .backup_store import get_backup_store
+
+    try:
+        store = get_backup_store()
+        print_info(f"备份仓库: {store.root}")
+        stats = store.garbage_collect(keep_last=keep, max_age_days=max_age_days)
+        print_success(f"清理完成，释放 {stats['bytes_freed']} 字节")
+    except Exception as e:
+        print_error(f"备份仓库清理失败: {e}")
+
+@main_cli.command("patch-plan")
+@click.option('--ide', 'ides', multiple=True, help='IDE type (vscode, cursor, windsurf); repeatable, default: all')
+@click.option('--mode', default='random', show_default=True,
+              type=click.Choice(['block', 'random', 'empty', 'stealth', 'debug']), help='Patch mode to plan')
+@click.option('--file', 'files', multiple=True, type=click.Path(), help='Plan these files instead of discovered extensions')
+@click.option('--workers', default=None, type=int, help='Parallel planning threads')
+@click.option('--json', 'as_json', is_flag=True, help='Print plans as JSON')
+def patch_plan_command(ides, mode, files, workers, as_json):
+    """Dry-run: show where patches would be injected without writing anything.
+
+    Exits with status 1 if any file could not be patched, so it can be used as a pre-flight gate.
+    """
+    import contextlib
+    import io
+    import json
+    from .extension_finder import ExtensionFinder
+    from .patch_manager import PatchMode
+    from .patch_planner import PatchPlanner, summarize_plans
+
+    try:
+        patch_mode = PatchMode(mode)
+        file_paths = list(files)
+        if not file_paths:
+            ide_types = [parse_ide_type(ide) for ide in ides] or [IDEType.VSCODE, IDEType.CURSOR, IDEType.WINDSURF]
+            finder = ExtensionFinder()
+            # JSON 输出时不混入发现过程的日志
+            with contextlib.redirect_stdout(io.StringIO()) if as_json else contextlib.nullcontext():
+                for ide_type in ide_types:
+                    file_paths.extend(finder.find_extension_files(ide_type))
+
+        plans = PatchPlanner(max_workers=workers).plan_files(file_paths, patch_mode)
+
+        if as_json:
+            click.echo(json.dumps([plan.to_dict() for plan in plans], indent=2, ensure_ascii=False))
+        else:
+            for plan in plans:
+                diff = plan.format_diff(f"patched, mode={mode}")
+                if diff:
+                    click.echo(diff, nl=False)
+            summarize_plans(plans)
+
+        if not all(plan.ok for plan in plans):
+            sys.exit(1)
+    except click.ClickException:
+        raise
+    except Exception as e:
+        print_error(f"补丁预演失败: {e}")
+        sys.exit(1)
+
+@main_cli.command("watch")
+@click.option('--ide', 'ides', multiple=True, help='IDE type (vscode, cursor, windsurf); repeatable, default: all')
+@click.option('--mode', default='random', show_default=True,
+              type=click.Choice(['block', 'random', 'empty', 'stealth', 'debug']), help='Patch mode for new extensions')
+@click.option('--backend', default='auto', show_default=True, type=click.Choice(['auto', 'inotify', 'poll']),
+              help='Change notification backend')
+@click.option('--settle', default=2.0, show_default=True, help='Seconds a file must stay unchanged before patching')
+@click.option('--interval', default=5.0, show_default=True, help='Polling interval in seconds (poll backend)')
+@click.option('--no-initial-scan', is_flag=True, help='Do not check already installed extensions at startup')
+def watch_command(ides, mode, backend, settle, interval, no_initial_scan):
+    """Watch extension directories and patch new Augment versions as soon as they are installed."""
+    from .extension_watcher import ExtensionWatcher, collect_watch_roots
+    from .patch_manager import PatchMode
+
+    try:
+        ide_types = [parse_ide_type(ide) for ide in ides] or [IDEType.VSCODE, IDEType.CURSOR, IDEType.WINDSURF]
+        roots = collect_watch_roots(ide_types)
+        watcher = ExtensionWatcher(roots, PatchMode(mode), backend=backend,
+                                   settle_seconds=settle, poll_interval=interval)
+        try:
+            watcher.run(initial_scan=not no_initial_scan)
+        except KeyboardInterrupt:
+            pass
+        stats = watcher.stats
+        print_info(f"监视结束: 事件 {stats['events']}，补丁 {stats['patched']}，"
+                   f"已补丁 {stats['already_patched']}，失败 {stats['failed']}")
+    except click.ClickException:
+        raise
+    except Exception as e:
+        print_error(f"扩展监视失败: {e}")
+        sys.exit(1)
+
+@main_cli.command("inventory-users")
+@click.option('--base', default=None, type=click.Path(), help='Directory containing user homes (default: $AUGMENT_USERS_BASE or the OS default)')
+@click.option('--ide', 'ides', multiple=True, help='IDE type (vscode, cursor, windsurf); repeatable, default: all')
+@click.option('--workers', default=None, type=int, help='Parallel scan threads')
+def inventory_users_command(base, ides, workers):
+    """Print a per-user JSON inventory of extension files, state DBs and storage.json paths."""
+    import contextlib
+    import json
+    from .multi_user import INVENTORY_IDES, scan_user_homes, summarize_inventory
+
+    try:
+        ide_types = tuple(parse_ide_type(ide) for ide in ides) or INVENTORY_IDES
+        # 进度信息写到 stderr，stdout 只输出 JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            inventories = scan_user_homes(Path(base) if base else None, ide_types, workers)
+        click.echo(json.dumps({'summary': summarize_inventory(inventories), 'users': inventories},
+                              indent=2, ensure_ascii=False))
+    except click.ClickException:
+        raise
+    except Exception as e:
+        print_error(f"多用户扫描失败: {e}")
+        sys.exit(1)
+
+@main_cli.command("db-inventory")
+@click.option('--ide', 'ides', multiple=True, help='IDE type (vscode, cursor, windsurf); repeatable, default: all')
+@click.option('--keyword', multiple=True, help='Keyword whose matches are counted (repeatable, default: augment)')
+@click.option('--pattern', multiple=True, help='Regular expression matched against keys (case-insensitive, repeatable)')
+@click.option('--no-workspaces', is_flag=True, help='Only inventory the global state DB of each IDE')
+@click.option('--top', default=20, show_default=True, type=click.IntRange(min=1), help='Key prefixes listed per database')
+@click.option('--workers', default=None, type=int, help='Parallel threads')
+def db_inventory_command(ides, keyword, pattern, no_workspaces, top, workers):
+    """Print a read-only JSON inventory of state DB keys grouped by prefix."""
+    import contextlib
+    import json
+    from .db_inventory import INVENTORY_IDES, build_inventory
+
+    try:
+        ide_types = tuple(parse_ide_type(ide) for ide in ides) or INVENTORY_IDES
+        keywords = _resolve_keywords(keyword, pattern)
+        with contextlib.redirect_stdout(sys.stderr):
+            inventory = build_inventory(ide_types, keywords, list(pattern), not no_workspaces, workers, top)
+        click.echo(json.dumps(inventory, indent=2, ensure_ascii=False))
+    except click.ClickException:
+        raise
+    except Exception as e:
+        print_error(f"数据库清单生成失败: {e}")
+        sys.exit(1)
+
+@main_cli.command("clean-workspaces")
+@click.option('--ide', default='vscode', show_default=True, help=get_text("cli.ide_option_help"))
+@click.option('--keyword', multiple=True, help='Keyword to remove (repeatable, default: augment)')
+@click.option('--pattern', multiple=True, help='Regular expression matched against keys (case-insensitive, repeatable)')
+@click.option('--workers', default=None, type=int, help='Worker processes (default: CPU count)')
+@click.option('--no-backup', is_flag=True, help='Do not snapshot databases before modifying them')
+@click.option('--json', 'as_json', is_flag=True, help='Print per-workspace results as JSON')
+def clean_workspaces_command(ide, keyword, pattern, workers, no_backup, as_json):
+    """Remove matching rows from every per-workspace state.vscdb in parallel."""
+    import contextlib
+    import json
+    from .file_cleaner import FileCleaner
+
+    try:
+        ide_type = parse_ide_type(ide)
+        keywords = _resolve_keywords(keyword, pattern)
+        with contextlib.redirect_stdout(sys.stderr) if as_json else contextlib.nullcontext():
+            summary = FileCleaner().clean_ide_workspace_databases(ide_type, keywords, list(pattern),
+                                                                  workers, backup=not no_backup)
+        if as_json:
+            click.echo(json.dumps(summary, indent=2, ensure_ascii=False))
+        if summary['errors']:
+            sys.exit(1)
+    except click.ClickException:
+        raise
+    except Exception as e:
+        print_error(f"工作区数据库清理失败: {e}")
+        sys.exit(1)
+
+@main_cli.command("scan-values")
+@click.option('--ide', default='vscode', show_default=True, help=get_text("cli.ide_option_help"))
+@click.option('--db', 'db_path', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='state.vscdb to scan (default: the IDE global state DB)')
+@click.option('--id', 'extra_ids', multiple=True, help='Additional identifier to look for (repeatable)')
+@click.option('--rewrite', is_flag=True, help='Replace every occurrence in place with a new value of the same length')
+@click.option('--chunk-size', default=1024, show_default=True, type=click.IntRange(min=4),
+              help='Read buffer per value in KiB')
+@click.option('--json', 'as_json', is_flag=True, help='Print the full report as JSON')
+def scan_values_command(ide, db_path, extra_ids, rewrite, chunk_size, as_json):
+    """Find machine/device IDs from storage.json inside ItemTable values."""
+    import contextlib
+    import json
+    from pathlib import Path
+    from .common_utils import get_ide_paths
+    from .value_scanner import (
+        BLOB_IO_SUPPORTED, BLOB_IO_UNSUPPORTED_MESSAGE, load_storage_identifiers, scan_database_values
+    )
+
+    if not BLOB_IO_SUPPORTED:
+        print_error(BLOB_IO_UNSUPPORTED_MESSAGE)
+        sys.exit(1)
+
+    try:
+        ide_type = parse_ide_type(ide)
+        with contextlib.redirect_stdout(sys.stderr) if as_json else contextlib.nullcontext():
+            paths = get_ide_paths(ide_type) or {}
+            identifiers = list(extra_ids)
+            if paths.get('storage_json'):
+                identifiers += load_storage_identifiers(paths['storage_json'])
+            if not identifiers:
+                print_error("没有可扫描的标识符（storage.json 不存在，且未指定 --id）")
+                sys.exit(1)
+
+            db = Path(db_path) if db_path else paths.get('state_db')
+            if not db or not db.exists():
+                print_error(f"数据库文件未找到: {db}")
+                sys.exit(1)
+
+            report = scan_database_values(db, identifiers, rewrite=rewrite, chunk_size=chunk_size * 1024)
+            if not as_json:
+                for entry in report['matches']:
+                    offsets = ", ".join(str(item['offset']) for item in entry['offsets'][:5])
+                    more = " …" if entry['count'] > 5 else ""
+                    print_info(f"  {entry['key']}: {entry['count']} 处 (偏移 {offsets}{more})")
+        if as_json:
+            click.echo(json.dumps(report, indent=2, ensure_ascii=False))
+    except click.ClickException:
+        raise
+    except Exception as e:
+        print_error(f"值扫描失败: {e}")
+        sys.exit(1)
+
 if __name__ == '__main__':
     main_cli()
@@ -1,9 +1,13 @@
 """
 Common utility functions for Augment Tools Core
 """
+import hashlib
+import json
 import os
 import platform
 import shutil
+import threading
+import time
 import uuid
 from pathlib import Path
 from typing import Dict, Union, Optional
@@ -56,31 +60,156 @@ def print_error(message: str) -> None:
     print_message(prefix, message, color)
 
 # --- IDE Path Functions ---
-def get_ide_paths(ide_type: IDEType) -> Optional[Dict[str, Path]]:
+def _get_appdata_dir(home: Optional[Path]) -> Optional[Path]:
+    """Roaming AppData for the current user, or under an explicit home directory."""
+    if home is not None:
+        return home / "AppData" / "Roaming"
+    appdata = os.environ.get("APPDATA")
+    return Path(appdata) if appdata else None
+
+# Resolved paths are memoized per (IDE, home) for this long; call
+# invalidate_ide_paths_cache() after installing or moving an IDE
+IDE_PATHS_CACHE_TTL = 60.0
+
+# IDEs whose layout has to be probed on disk; their resolved layout is persisted
+# to the tool data dir and revalidated on the next start with a single stat
+_PROBED_IDE_TYPES = (IDEType.WINDSURF,)
+_IDE_PATHS_FILE = "ide_paths.json"
+_IDE_PATHS_VERSION = 1
+
+_ide_paths_cache: Dict[tuple, tuple] = {}
+_ide_paths_lock = threading.Lock()
+_persisted_layouts: Optional[dict] = None
+
+def _ide_paths_file() -> Path:
+    return get_tool_data_dir() / _IDE_PATHS_FILE
+
+def _load_persisted_layouts() -> dict:
+    global _persisted_layouts
+    if _persisted_layouts is None:
+        try:
+            with open(_ide_paths_file(), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            valid = isinstance(data, dict) and data.get("version") == _IDE_PATHS_VERSION
+            _persisted_layouts = data.get("layouts", {}) if valid else {}
+        except (OSError, ValueError):
+            _persisted_layouts = {}
+    return _persisted_layouts
+
+def _save_persisted_layouts() -> None:
+    path = _ide_paths_file()
+    tmp_path = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": _IDE_PATHS_VERSION, "layouts": _persisted_layouts}, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError:
+        # The persisted layout is only an optimization
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+def _persisted_ide_paths(ide_type: IDEType) -> Optional[Dict[str, Path]]:
+    """Persisted layout of the current user, if its globalStorage directory still exists."""
+    with _ide_paths_lock:
+        layout = _load_persisted_layouts().get(ide_type.value)
+    if not isinstance(layout, dict) or not isinstance(layout.get("paths"), dict):
+        return None
+    if layout.get("home") != str(Path.home()):
+        return None
+    paths = {name: Path(value) for name, value in layout["paths"].items()}
+    state_db = paths.get("state_db")
+    if state_db is None or not state_db.parent.is_dir():
+        return None
+    return paths
+
+def _persist_ide_paths(ide_type: IDEType, paths: Dict[str, Path]) -> None:
+    with _ide_paths_lock:
+        layouts = _load_persisted_layouts()
+        entry = {"home": str(Path.home()), "paths": {name: str(value) for name, value in paths.items()}}
+        if layouts.get(ide_type.value) == entry:
+            return
+        layouts[ide_type.value] = entry
+        _save_persisted_layouts()
+
+def invalidate_ide_paths_cache(ide_type: Optional[IDEType] = None, persistent: bool = True) -> None:
+    """
+    Forgets memoized IDE paths so the next get_ide_paths() probes again.
+
+    Args:
+        ide_type: Only forget this IDE (default: all)
+        persistent: Also drop the layouts persisted in the tool data dir
+    """
+    global _persisted_layouts
+    with _ide_paths_lock:
+        for key in list(_ide_paths_cache):
+            if ide_type is None or key[0] == ide_type:
+                del _ide_paths_cache[key]
+        if persistent:
+            layouts = _load_persisted_layouts()
+            removed = [name for name in layouts if ide_type is None or name == ide_type.value]
+            for name in removed:
+                del layouts[name]
+            if removed:
+                _save_persisted_layouts()
+
+def get_ide_paths(ide_type: IDEType, home: Optional[Union[str, Path]] = None,
+                  verbose: bool = True) -> Optional[Dict[str, Path]]:
     """
     Determines and returns OS-specific paths for the specified IDE configuration files.
 
+    Results are memoized for IDE_PATHS_CACHE_TTL seconds, so repeated calls neither
+    re-probe the filesystem nor repeat the diagnostics. Probed layouts of the current
+    user are also persisted and reused on the next start after one stat.
+
     Args:
         ide_type: The IDE type to get paths for
+        home: Home directory to resolve paths under (default: the current user's)
+        verbose: Print diagnostics; multi-user scans turn this off
 
     Returns:
         A dictionary containing 'state_db' and 'storage_json' paths, or None if unsupported.
     """
+    key = (ide_type, str(Path(home)) if home is not None else None, os.environ.get("APPDATA"))
+    now = time.monotonic()
+    with _ide_paths_lock:
+        cached = _ide_paths_cache.get(key)
+    if cached is not None and now - cached[0] < IDE_PATHS_CACHE_TTL:
+        return dict(cached[1]) if cached[1] is not None else None
+
+    persist = home is None and ide_type in _PROBED_IDE_TYPES
+    paths = _persisted_ide_paths(ide_type) if persist else None
+    if paths is None:
+        paths = _resolve_ide_paths(ide_type, home, verbose)
+        if persist and paths:
+            _persist_ide_paths(ide_type, paths)
+
+    with _ide_paths_lock:
+        _ide_paths_cache[key] = (now, dict(paths) if paths is not None else None)
+    return paths
+
+def _resolve_ide_paths(ide_type: IDEType, home: Optional[Union[str, Path]],
+                       verbose: bool) -> Optional[Dict[str, Path]]:
+    """Uncached path resolution behind get_ide_paths()."""
     system = platform.system()
     paths: Dict[str, Path] = {}
+    home_dir = Path(home) if home is not None else Path.home()
 
     try:
         if ide_type == IDEType.VSCODE:
             if system == "Windows":
-                appdata = os.environ.get("APPDATA")
+                appdata = _get_appdata_dir(Path(home) if home is not None else None)
                 if not appdata:
-                    print_error("APPDATA environment variable not found. Cannot locate VS Code data.")
+                    if verbose:
+                        print_error("APPDATA environment variable not found. Cannot locate VS Code data.")
                     return None
-                base_dir = Path(appdata) / "Code" / "User"
+                base_dir = appdata / "Code" / "User"
             elif system == "Darwin":  # macOS
-                base_dir = Path.home() / "Library" / "Application Support" / "Code" / "User"
+                base_dir = home_dir / "Library" / "Application Support" / "Code" / "User"
             elif system == "Linux":
-                base_dir = Path.home() / ".config" / "Code" / "User"
+                base_dir = home_dir / ".config" / "Code" / "User"
             else:
                 print_error(f"Unsupported operating system: {system}")
                 return None
@@ -90,19 +219,20 @@ def get_ide_paths(ide_type: IDEType) -> Optional[Dict[str, Path]]:
 
         elif ide_type == IDEType.CURSOR:
             if system == "Windows":
-                appdata = os.environ.get("APPDATA")
+                appdata = _get_appdata_dir(Path(home) if home is not None else None)
                 if not appdata:
-                    print_error("APPDATA environment variable not found. Cannot locate Cursor data.")
+                    if verbose:
+                        print_error("APPDATA environment variable not found. Cannot locate Cursor data.")
                     return None
-                base_dir = Path(appdata) / "Cursor" / "User"
+                base_dir = appdata / "Cursor" / "User"
             elif system == "Darwin":  # macOS
                 # Cursor uses both locations based on your provided info
-                base_dir = Path.home() / ".cursor"
+                base_dir = home_dir / ".cursor"
                 # Also check VS Code location for settings
-                vscode_settings = Path.home() / "Library" / "Application Support" / "Code" / "User"
+                vscode_settings = home_dir / "Library" / "Application Support" / "Code" / "User"
                 paths["vscode_settings"] = vscode_settings / "settings.json"
             elif system == "Linux":
-                base_dir = Path.home() / ".cursor"
+                base_dir = home_dir / ".cursor"
             else:
                 print_error(f"Unsupported operating system: {system}")
                 return None
@@ -114,10 +244,11 @@ def get_ide_paths(ide_type: IDEType) -> Optional[Dict[str, Path]]:
 
         elif ide_type == IDEType.WINDSURF:
             # Windsurf 可能有多种路径结构，需要检测实际存在的路径
-            windsurf_paths = detect_windsurf_paths()
+            windsurf_paths = detect_windsurf_paths(home, verbose=verbose)
             if not windsurf_paths:
-                print_error("无法找到 Windsurf 数据目录。请确保 Windsurf 已正确安装。")
-                print_info("已检查标准路径和 Codeium 路径，详细信息请查看上方输出。")
+                if verbose:
+                    print_error("无法找到 Windsurf 数据目录。请确保 Windsurf 已正确安装。")
+                    print_info("已检查标准路径和 Codeium 路径，详细信息请查看上方输出。")
                 return None
 
             paths.update(windsurf_paths)
@@ -125,7 +256,8 @@ def get_ide_paths(ide_type: IDEType) -> Optional[Dict[str, Path]]:
         elif ide_type == IDEType.JETBRAINS:
             # JetBrains 产品使用不同的配置结构，不需要传统的 state_db 和 storage_json
             # 返回空字典表示支持但使用不同的处理方式
-            print_info("JetBrains 产品使用 SessionID 配置，不需要数据库清理")
+            if verbose:
+                print_info("JetBrains 产品使用 SessionID 配置，不需要数据库清理")
             return {}
 
         return paths
@@ -133,26 +265,31 @@ def get_ide_paths(ide_type: IDEType) -> Optional[Dict[str, Path]]:
         print_error(f"Failed to determine {ide_type.value} paths: {e}")
         return None
 
-def detect_windsurf_paths() -> Dict[str, Path]:
+def detect_windsurf_paths(home: Optional[Union[str, Path]] = None, verbose: bool = True) -> Dict[str, Path]:
     """
     检测 Windsurf 的实际数据路径。
     支持两种路径结构：
     1. 标准 VSCode 结构：%APPDATA%/Windsurf/ 或 ~/.config/Windsurf/
     2. Codeium 结构：~/.codeium/windsurf/
 
+    Args:
+        home: 在指定的用户主目录下检测（默认当前用户）
+        verbose: 是否输出检测过程
+
     Returns:
         包含实际存在路径的字典，如果未找到则返回空字典
     """
     import platform
 
-    home = Path.home()
+    explicit_home = Path(home) if home is not None else None
+    home = explicit_home or Path.home()
     system = platform.system()
 
     # 构建标准路径（参考项目的方式）
     if system == "Windows":
-        appdata = os.environ.get("APPDATA")
+        appdata = _get_appdata_dir(explicit_home)
         if appdata:
-            standard_base = Path(appdata) / "Windsurf"
+            standard_base = appdata / "Windsurf"
         else:
             standard_base = None
     elif system == "Darwin":  # macOS
@@ -196,7 +333,8 @@ def detect_windsurf_paths() -> Dict[str, Path]:
         else:
             path_type = "其他路径"
 
-        print_info(f"检查 Windsurf {path_type}: {base_dir}")
+        if verbose:
+            print_info(f"检查 Windsurf {path_type}: {base_dir}")
 
         for storage_path, ext_path in possible_structures:
             state_db = base_dir / storage_path / "state.vscdb"
@@ -205,10 +343,11 @@ def detect_windsurf_paths() -> Dict[str, Path]:
 
             # 检查关键文件是否存在
             if state_db.exists() or storage_json.exists():
-                print_success(f"✅ 找到 Windsurf 数据目录 ({path_type}): {base_dir}")
-                print_info(f"  - 数据库路径: {state_db} {'✅' if state_db.exists() else '❌'}")
-                print_info(f"  - 存储文件路径: {storage_json} {'✅' if storage_json.exists() else '❌'}")
-                print_info(f"  - 扩展目录: {extensions}")
+                if verbose:
+                    print_success(f"✅ 找到 Windsurf 数据目录 ({path_type}): {base_dir}")
+                    print_info(f"  - 数据库路径: {state_db} {'✅' if state_db.exists() else '❌'}")
+                    print_info(f"  - 存储文件路径: {storage_json} {'✅' if storage_json.exists() else '❌'}")
+                    print_info(f"  - 扩展目录: {extensions}")
 
                 return {
                     "state_db": state_db,
@@ -216,6 +355,9 @@ def detect_windsurf_paths() -> Dict[str, Path]:
                     "extensions": extensions
                 }
 
+    if not verbose:
+        return {}
+
     # 如果没有找到，列出实际存在的目录以帮助调试
     print_warning("❌ 未找到 Windsurf 数据文件。")
     print_info("📋 检查的路径结构:")
@@ -283,11 +425,25 @@ def get_ide_process_names(ide_type: IDEType) -> list:
     }
     return process_names.get(ide_type, [])
 
+def get_tool_data_dir() -> Path:
+    """
+    Returns the per-user data directory of the tools (backup store, journals, caches).
+    Can be overridden with the AUGMENT_TOOLS_HOME environment variable.
+    """
+    override = os.environ.get("AUGMENT_TOOLS_HOME")
+    if override:
+        return Path(override).expanduser()
+    return Path.home() / ".augment_tools"
+
 # --- File Backup Function ---
 def create_backup(file_path: Union[str, Path]) -> Union[Path, None]:
     """
     Creates a backup of the given file.
 
+    The content is recorded in the content-addressed backup store and the
+    ``.backup`` file next to the original is linked from the stored blob, so
+    identical content is only kept once.
+
     Args:
         file_path: The path to the file to be backed up.
 
@@ -301,13 +457,156 @@ def create_backup(file_path: Union[str, Path]) -> Union[Path, None]:
 
     backup_path = original_path.with_suffix(original_path.suffix + ".backup")
     try:
-        shutil.copy2(original_path, backup_path)
+        from .backup_store import get_backup_store
+        store = get_backup_store()
+        digest = store.store_file(original_path)
+        if digest and store.materialize(digest, backup_path):
+            print_success(f"Backup created successfully at: {backup_path}")
+            return backup_path
+
+        print_warning("Backup store unavailable, falling back to a plain copy.")
+        # The existing .backup may be a hardlink to a store blob: copy to a
+        # temporary file and replace it instead of writing through the link.
+        temp_path = backup_path.with_name(f".{backup_path.name}.tmp-{os.getpid()}")
+        try:
+            shutil.copy2(original_path, temp_path)
+            os.replace(temp_path, backup_path)
+        except BaseException:
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
+            raise
         print_success(f"Backup created successfully at: {backup_path}")
         return backup_path
     except Exception as e:
         print_error(f"Failed to create backup for {original_path}: {e}")
         return None
 
+# --- Hashed Copy Functions ---
+HASH_ALGORITHM = "sha256"
+COPY_BUFFER_SIZE = 1024 * 1024  # 1MB，流式复制/哈希的块大小
+_FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+_copy_buffers = threading.local()
+
+def _get_copy_buffer() -> memoryview:
+    """获取当前线程可复用的复制缓冲区（避免每个块都分配新的 bytes）"""
+    view = getattr(_copy_buffers, "view", None)
+    if view is None:
+        view = memoryview(bytearray(COPY_BUFFER_SIZE))
+        _copy_buffers.view = view
+    return view
+
+def hash_file(file_path: Union[str, Path]) -> str:
+    """
+    流式计算文件的 sha256 摘要。
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        str: 十六进制摘要
+    """
+    hasher = hashlib.new(HASH_ALGORITHM)
+    view = _get_copy_buffer()
+    with open(file_path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(view)
+            if not n:
+                break
+            hasher.update(view[:n])
+    return hasher.hexdigest()
+
+def _try_kernel_copy(src_fd: int, dst_fd: int, size: int) -> bool:
+    """
+    Linux 下优先使用 FICLONE reflink，其次 os.copy_file_range，数据不经过用户态。
+
+    Returns:
+        bool: 是否已由内核完成复制；失败时目标文件被截断并复位
+    """
+    if platform.system() != "Linux":
+        return False
+
+    try:
+        import fcntl
+        fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+        return True
+    except (ImportError, OSError):
+        pass
+
+    copy_file_range = getattr(os, "copy_file_range", None)
+    if copy_file_range is None:
+        return False
+
+    copied = 0
+    try:
+        while copied < size:
+            n = copy_file_range(src_fd, dst_fd, size - copied)
+            if n == 0:
+                break
+            copied += n
+    except OSError:
+        pass
+
+    if copied == size:
+        return True
+
+    # 回退到用户态流式复制前复位两个文件
+    os.lseek(src_fd, 0, os.SEEK_SET)
+    os.ftruncate(dst_fd, 0)
+    os.lseek(dst_fd, 0, os.SEEK_SET)
+    return False
+
+def copy_file_with_hash(src: Union[str, Path], dst: Union[str, Path]) -> Optional[str]:
+    """
+    复制文件并计算 sha256，随后对目标文件做全量哈希校验。
+
+    Linux 上优先 reflink / copy_file_range；否则通过可复用的 memoryview 缓冲区
+    单次读取源文件，在同一循环中写入目标并更新哈希。
+
+    Args:
+        src: 源文件路径
+        dst: 目标文件路径（会被覆盖）
+
+    Returns:
+        校验通过时返回源文件摘要，否则返回 None（并删除不完整的目标文件）
+    """
+    src_path = Path(src)
+    dst_path = Path(dst)
+    try:
+        with open(src_path, "rb", buffering=0) as fsrc, open(dst_path, "wb", buffering=0) as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            if _try_kernel_copy(fsrc.fileno(), fdst.fileno(), size):
+                fdst.close()
+                digest = hash_file(src_path)
+            else:
+                hasher = hashlib.new(HASH_ALGORITHM)
+                view = _get_copy_buffer()
+                while True:
+                    n = fsrc.readinto(view)
+                    if not n:
+                        break
+                    chunk = view[:n]
+                    hasher.update(chunk)
+                    fdst.write(chunk)
+                digest = hasher.hexdigest()
+
+        shutil.copystat(src_path, dst_path)
+
+        dst_digest = hash_file(dst_path)
+        if dst_digest != digest:
+            print_error(f"复制校验失败: {dst_path} (期望 {digest[:12]}, 实际 {dst_digest[:12]})")
+            dst_path.unlink()
+            return None
+        return digest
+    except Exception as e:
+        print_error(f"复制文件失败 {src_path} -> {dst_path}: {e}")
+        try:
+            dst_path.unlink()
+        except OSError:
+            pass
+        return None
+
 # --- ID Generation Functions ---
 def generate_new_machine_id() -> str:
     """Generates a new 64-character hexadecimal string for machineId."""
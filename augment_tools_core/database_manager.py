@@ -1,7 +1,14 @@
+import os
+import re
 import sqlite3
 import shutil
+import time
+from functools import lru_cache
 from pathlib import Path
+from typing import Callable, List, Optional, Sequence, Tuple, Union
 import logging
+from . import db_access
+from .db_access import DEFAULT_MAX_LOCK_WAIT, LockRetry, LockTimeout
 from .common_utils import (
     print_info, print_success, print_warning, print_error, create_backup,
     IDEType, get_ide_paths, get_ide_display_name
@@ -10,21 +17,361 @@ from .common_utils import (
 # Configure basic logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def clean_ide_database(ide_type: IDEType, keyword: str = "augment") -> bool:
+# Number of matching keys shown before deletion
+PREVIEW_LIMIT = 5
+
+# Pages copied per online-backup step; the source is only locked while a step runs
+BACKUP_PAGES_PER_STEP = 1024
+
+# progress(copied_bytes, total_bytes)
+BackupProgress = Callable[[int, int], None]
+
+# Compaction thresholds: only rebuild when the free pages are worth it, and never run a
+# full VACUUM (which rewrites the whole file and needs as much free disk) on huge databases
+COMPACT_MIN_FREE_RATIO = 0.20
+COMPACT_MIN_FREE_BYTES = 1024 * 1024
+VACUUM_MAX_DB_BYTES = 512 * 1024 * 1024
+
+# PRAGMA auto_vacuum values
+AUTO_VACUUM_INCREMENTAL = 2
+
+# SQLITE_NOTADB: the file exists but is not a SQLite database
+SQLITE_NOTADB = 26
+
+class BackupCancelled(Exception):
+    """Raised from a backup progress callback to abort the backup."""
+
+def _is_not_a_database(error: sqlite3.DatabaseError) -> bool:
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF == SQLITE_NOTADB
+    return "file is not a database" in str(error).lower()
+
+def backup_sqlite_database(db_path: Path, progress: Optional[BackupProgress] = None,
+                           pages_per_step: int = BACKUP_PAGES_PER_STEP,
+                           max_lock_wait: float = DEFAULT_MAX_LOCK_WAIT) -> Optional[Path]:
+    """
+    Backs up a SQLite database with the online-backup API.
+
+    Unlike a file copy this produces a consistent snapshot even while the IDE has the
+    database open, and it includes content still in the -wal file. The copy runs in steps
+    of `pages_per_step` pages, calling `progress` after each one; raising BackupCancelled
+    from the callback aborts the backup and is re-raised to the caller. If the database stays
+    locked for more than `max_lock_wait` seconds the backup is aborted and LockTimeout is raised.
+    The snapshot is stored in the content-addressed backup store and linked to `<db>.backup`,
+    like create_backup. Only files that are not SQLite databases fall back to create_backup;
+    lock errors are re-raised for the caller's retry/timeout handling, since a file copy of a
+    live database is exactly the inconsistent snapshot this avoids.
+
+    Returns:
+        The path to the backup file if successful, None otherwise.
+    """
+    db_path = Path(db_path)
+    if not db_path.exists():
+        print_error(f"File not found for backup: {db_path}")
+        return None
+
+    backup_path = db_path.with_suffix(db_path.suffix + ".backup")
+    snapshot_path = db_path.with_name(f".{db_path.name}.snapshot-{os.getpid()}")
+    src = dst = None
+    try:
+        src = db_access.connect(db_path)
+        page_size = src.execute("PRAGMA page_size").fetchone()[0]
+        dst = sqlite3.connect(snapshot_path)
+
+        def on_step(status, remaining, total):
+            if progress is not None:
+                progress((total - remaining) * page_size, total * page_size)
+
+        db_access.backup_database(src, dst, max_lock_wait, pages=max(1, pages_per_step), progress=on_step)
+        dst.close()
+        dst = None
+
+        from .backup_store import get_backup_store
+        store = get_backup_store()
+        digest = store.store_file(snapshot_path, record_as=db_path)
+        if digest and store.materialize(digest, backup_path):
+            snapshot_path.unlink()
+        else:
+            print_warning("Backup store unavailable, keeping the snapshot as a plain copy.")
+            os.replace(snapshot_path, backup_path)
+        print_success(f"Backup created successfully at: {backup_path}")
+        return backup_path
+    except BackupCancelled:
+        print_warning(f"Backup of {db_path} was cancelled.")
+        raise
+    except LockTimeout as e:
+        print_error(f"Backup of {db_path} aborted: {e}")
+        raise
+    except sqlite3.DatabaseError as e:
+        if db_access.is_lock_error(e):
+            print_error(f"Backup of {db_path} failed, the database is locked: {e}")
+            raise
+        if not _is_not_a_database(e):
+            print_error(f"Failed to create backup for {db_path}: {e}")
+            return None
+        print_warning(f"{db_path} is not a SQLite database ({e}), falling back to a file copy.")
+        return create_backup(db_path)
+    except Exception as e:
+        print_error(f"Failed to create backup for {db_path}: {e}")
+        return None
+    finally:
+        for conn in (dst, src):
+            if conn is not None:
+                conn.close()
+        if snapshot_path.exists():
+            try:
+                snapshot_path.unlink()
+            except OSError:
+                pass
+
+@lru_cache(maxsize=8)
+def _compile_key_regex(pattern: str):
+    return re.compile(pattern, re.IGNORECASE)
+
+def _sqlite_regexp(pattern: str, value) -> bool:
+    """REGEXP implementation; the pattern is compiled once per connection lifetime via the cache."""
+    if value is None:
+        return False
+    return _compile_key_regex(pattern).search(str(value)) is not None
+
+class KeyMatcher:
+    """
+    Compiles a set of keywords and regex patterns into one ItemTable predicate.
+
+    Keywords become OR'd instr() checks on lower(key) (case-insensitive, with no LIKE wildcard
+    surprises). All patterns are joined into a single case-insensitive regex evaluated by a
+    deterministic REGEXP function, so any number of keywords costs one table scan.
+    """
+    def __init__(self, keywords: Union[str, Sequence[str], None] = "augment",
+                 patterns: Optional[Sequence[str]] = None):
+        if isinstance(keywords, str):
+            keywords = [keywords]
+        self.keywords = list(dict.fromkeys(k.lower() for k in (keywords or []) if k))
+        self.patterns = [p for p in (patterns or []) if p]
+        self.regex_source = None
+        if self.patterns:
+            self.regex_source = "|".join(f"(?:{p})" for p in self.patterns)
+            try:
+                _compile_key_regex(self.regex_source)
+            except re.error as e:
+                raise ValueError(f"无效的正则表达式: {e}")
+        if not self.keywords and not self.patterns:
+            raise ValueError("至少需要一个关键字或正则表达式")
+
+    def predicate(self) -> Tuple[str, tuple]:
+        """Returns (SQL condition, parameters)."""
+        clauses = ["instr(lower(key), ?) > 0"] * len(self.keywords)
+        params = list(self.keywords)
+        if self.regex_source:
+            clauses.append("key REGEXP ?")
+            params.append(self.regex_source)
+        return " OR ".join(clauses), tuple(params)
+
+    def register(self, conn: sqlite3.Connection) -> None:
+        if self.regex_source:
+            conn.create_function("regexp", 2, _sqlite_regexp, deterministic=True)
+
+    def describe(self) -> str:
+        parts = [f"'{k}'" for k in self.keywords] + [f"/{p}/" for p in self.patterns]
+        return ", ".join(parts)
+
+def open_cleanup_connection(db_path: Path) -> sqlite3.Connection:
+    """
+    Opens a connection in autocommit mode so transactions are controlled explicitly
+    (the sqlite3 module would otherwise open a deferred transaction on its own).
+    """
+    conn = db_access.connect(db_path, isolation_level=None)
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+def _database_size(db_path: Path) -> int:
+    """Size of the database file plus its WAL, in bytes."""
+    total = 0
+    for path in (str(db_path), f"{db_path}-wal"):
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+def compact_database(db_path: Path, min_free_ratio: float = COMPACT_MIN_FREE_RATIO,
+                     min_free_bytes: int = COMPACT_MIN_FREE_BYTES,
+                     max_vacuum_bytes: int = VACUUM_MAX_DB_BYTES,
+                     conn: Optional[sqlite3.Connection] = None) -> dict:
+    """
+    Returns free space to the filesystem after a cleanup.
+
+    `conn` may be an already open autocommit connection to `db_path` (it is left open);
+    otherwise a connection is opened and closed here.
+
+    Always checkpoints and truncates the WAL. The file itself is only rebuilt when the
+    freelist is at least `min_free_ratio` of the pages and `min_free_bytes` in size:
+    databases in incremental auto-vacuum mode release their free pages with
+    incremental_vacuum, others get a full VACUUM unless they are larger than
+    `max_vacuum_bytes`.
+
+    Returns:
+        dict: action ("none", "vacuum", "incremental_vacuum" or "skipped"), reason,
+              size_before, size_after, bytes_reclaimed, freelist_pages (before),
+              freelist_pages_after, pages_reclaimed, page_size, wal_checkpointed, seconds
+    """
+    started = time.perf_counter()
+    stats = {
+        "action": "none",
+        "reason": "",
+        "size_before": _database_size(db_path),
+        "size_after": 0,
+        "bytes_reclaimed": 0,
+        "freelist_pages": 0,
+        "freelist_pages_after": 0,
+        "pages_reclaimed": 0,
+        "page_size": 0,
+        "wal_checkpointed": False,
+        "seconds": 0.0,
+    }
+
+    own_connection = conn is None
+    if own_connection:
+        conn = db_access.connect(db_path, busy_timeout_ms=5000, isolation_level=None)
+    try:
+        busy = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0]
+        stats["wal_checkpointed"] = busy == 0
+
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        stats["page_size"] = page_size
+        stats["freelist_pages"] = freelist
+
+        free_bytes = freelist * page_size
+        ratio = freelist / page_count if page_count else 0.0
+        if free_bytes < min_free_bytes or ratio < min_free_ratio:
+            stats["reason"] = f"{free_bytes} free bytes ({ratio:.0%} of pages) below threshold"
+        elif auto_vacuum == AUTO_VACUUM_INCREMENTAL:
+            # Each step of the statement frees one page, but the sqlite3 module steps a
+            # statement without result columns only once; run it once per free page
+            # inside one transaction (freelist_count is re-read below)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for _ in range(freelist):
+                    conn.execute("PRAGMA incremental_vacuum")
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            stats["action"] = "incremental_vacuum"
+        elif page_count * page_size > max_vacuum_bytes:
+            stats["action"] = "skipped"
+            stats["reason"] = f"database larger than {max_vacuum_bytes} bytes, VACUUM not attempted"
+        else:
+            conn.execute("VACUUM")
+            stats["action"] = "vacuum"
+
+        if stats["action"] in ("vacuum", "incremental_vacuum"):
+            # Both write through the WAL; fold it back so the file actually shrinks
+            busy = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0]
+            stats["wal_checkpointed"] = busy == 0
+
+        stats["freelist_pages_after"] = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        stats["pages_reclaimed"] = max(0, freelist - stats["freelist_pages_after"])
+    finally:
+        if own_connection:
+            conn.close()
+
+    stats["size_after"] = _database_size(db_path)
+    stats["bytes_reclaimed"] = max(0, stats["size_before"] - stats["size_after"])
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+def _report_compaction(stats: dict) -> None:
+    if stats["action"] in ("vacuum", "incremental_vacuum"):
+        print_success(f"数据库压缩完成 ({stats['action']}): 释放 {stats['pages_reclaimed']} 个空闲页，"
+                      f"回收 {stats['bytes_reclaimed'] / 1024:.1f} KB，"
+                      f"耗时 {stats['seconds']:.2f} 秒")
+    elif stats["action"] == "skipped":
+        print_warning(f"跳过数据库压缩: {stats['reason']}")
+    else:
+        print_info(f"无需压缩数据库 (WAL 回收 {stats['bytes_reclaimed'] / 1024:.1f} KB): {stats['reason']}")
+    if not stats["wal_checkpointed"]:
+        print_warning("WAL 检查点未完成（数据库仍被其他进程读取），文件大小可能未减少")
+
+def delete_matching_keys(conn: sqlite3.Connection, predicate: Union[str, KeyMatcher], params: Sequence = (),
+                         preview_limit: int = PREVIEW_LIMIT) -> Tuple[int, List[str], int]:
+    """
+    Deletes ItemTable rows matching `predicate` in a single table scan and a single transaction.
+
+    The matching rowids are collected into a temp table in one pass; the preview and the
+    delete then work by rowid, and counts come from changes() instead of extra COUNT(*) scans.
+    BEGIN IMMEDIATE takes the write lock up front so the IDE cannot change the table between
+    the scan and the delete.
+
+    Args:
+        conn: Connection opened with isolation_level=None (see open_cleanup_connection)
+        predicate: SQL condition on ItemTable (e.g. "key LIKE ?") or a KeyMatcher
+        params: Parameters for an SQL predicate
+        preview_limit: Maximum number of matching keys returned for display
+
+    Returns:
+        (number of matching rows, preview keys, number of deleted rows)
+    """
+    if isinstance(predicate, KeyMatcher):
+        predicate.register(conn)
+        predicate, params = predicate.predicate()
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS cleanup_rowids (id INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.cleanup_rowids")
+        conn.execute(f"INSERT INTO temp.cleanup_rowids SELECT rowid FROM ItemTable WHERE {predicate}", tuple(params))
+        matched = conn.execute("SELECT changes()").fetchone()[0]
+
+        preview: List[str] = []
+        deleted = 0
+        if matched and preview_limit > 0:
+            preview = [row[0] for row in conn.execute(
+                "SELECT key FROM ItemTable WHERE rowid IN (SELECT id FROM temp.cleanup_rowids LIMIT ?)",
+                (preview_limit,))]
+        if matched:
+            conn.execute("DELETE FROM ItemTable WHERE rowid IN (SELECT id FROM temp.cleanup_rowids)")
+            deleted = conn.execute("SELECT changes()").fetchone()[0]
+
+        conn.execute("DELETE FROM temp.cleanup_rowids")
+        conn.execute("COMMIT")
+        return matched, preview, deleted
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+def clean_ide_database(ide_type: IDEType, keyword: Union[str, Sequence[str]] = "augment",
+                       patterns: Optional[Sequence[str]] = None,
+                       max_lock_wait: float = DEFAULT_MAX_LOCK_WAIT,
+                       wait_for_exit: bool = False) -> bool:
     """
     Cleans the specified IDE's SQLite database by removing entries containing a specific keyword.
 
     Args:
         ide_type: The IDE type to clean
-        keyword: The keyword to search for in the 'key' column of 'ItemTable'.
-                 Entries containing this keyword will be removed.
+        keyword: The keyword (or list of keywords) to search for in the 'key' column of 'ItemTable'.
+                 Entries containing any of them will be removed.
+        patterns: Optional regular expressions; keys matching any of them are removed too.
+        max_lock_wait: Seconds to keep retrying while the IDE holds the database lock.
+        wait_for_exit: Watch the IDE's processes while waiting and retry as soon as it exits.
 
     Returns:
         True if the database was cleaned successfully or if no cleaning was needed,
         False otherwise.
     """
     ide_name = get_ide_display_name(ide_type)
-    print_info(f"开始清理 {ide_name} 数据库 (关键字: '{keyword}')")
+    try:
+        matcher = KeyMatcher(keyword, patterns)
+    except ValueError as e:
+        print_error(str(e))
+        return False
+    print_info(f"开始清理 {ide_name} 数据库 (关键字: {matcher.describe()})")
 
     # JetBrains 产品不需要数据库清理，直接返回成功
     if ide_type == IDEType.JETBRAINS:
@@ -41,16 +388,25 @@ def clean_ide_database(ide_type: IDEType, keyword: str = "augment") -> bool:
         print_error(f"在配置中未找到 {ide_name} state.vscdb 路径。操作中止。")
         return False
     
-    return clean_vscode_database(db_path, keyword)
+    return clean_vscode_database(db_path, keyword, patterns, max_lock_wait,
+                                 ide_type if wait_for_exit else None)
 
-def clean_vscode_database(db_path: Path, keyword: str = "augment") -> bool:
+def clean_vscode_database(db_path: Path, keyword: Union[str, Sequence[str]] = "augment",
+                          patterns: Optional[Sequence[str]] = None,
+                          max_lock_wait: float = DEFAULT_MAX_LOCK_WAIT,
+                          wait_for_ide: Optional[IDEType] = None) -> bool:
     """
     Cleans the SQLite database by removing entries containing a specific keyword.
 
+    All keywords and patterns are matched in a single backup, scan and transaction.
+
     Args:
         db_path: Path to the state.vscdb SQLite database.
-        keyword: The keyword to search for in the 'key' column of 'ItemTable'.
-                 Entries containing this keyword will be removed.
+        keyword: The keyword (or list of keywords) to search for in the 'key' column of 'ItemTable'.
+                 Entries containing any of them will be removed.
+        patterns: Optional regular expressions; keys matching any of them are removed too.
+        max_lock_wait: Seconds to keep retrying (with backoff) while the database is locked.
+        wait_for_ide: If given, that IDE's processes are checked while waiting for the lock.
 
     Returns:
         True if the database was cleaned successfully or if no cleaning was needed,
@@ -84,69 +440,72 @@ def clean_vscode_database(db_path: Path, keyword: str = "augment") -> bool:
 
         return False
 
+    try:
+        matcher = KeyMatcher(keyword, patterns)
+    except ValueError as e:
+        print_error(str(e))
+        return False
+    keyword = matcher.describe()
+
     print_info(f"尝试清理数据库: {db_path}")
-    print_info(f"目标清理关键字: '{keyword}'")
+    print_info(f"目标清理关键字: {keyword}")
 
     backup_path = None
+    conn = None
     try:
         # 1. Create a backup
         print_info("正在备份数据库...")
-        backup_path = create_backup(db_path)
+        backup_path = backup_sqlite_database(db_path, max_lock_wait=max_lock_wait)
         if not backup_path:
             return False
         print_success(f"数据库备份成功: {backup_path}")
 
         # 2. Connect to the SQLite database
         print_info(f"连接到数据库: {db_path}")
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        conn = open_cleanup_connection(db_path)
         print_success("成功连接到数据库。")
 
-        # 3. Find and count entries to be deleted
-        query_select = f"SELECT key FROM ItemTable WHERE key LIKE ?"
-        like_pattern = f"%{keyword}%"
-        
-        print_info(f"搜索包含关键字 '{keyword}' 的条目...")
-        cursor.execute(query_select, (like_pattern,))
-        entries_to_delete = cursor.fetchall()
-        
-        num_entries_to_delete = len(entries_to_delete)
+        # 3. Find and delete matching entries in one scan and one transaction
+        print_info(f"搜索并删除包含关键字 {keyword} 的条目...")
+        retry = LockRetry(max_lock_wait, wait_for_ide)
+        num_entries_to_delete, preview, deleted_rows = retry.run(lambda: delete_matching_keys(conn, matcher), "清理")
+        if retry.lock_errors:
+            print_info(f"锁等待: {retry.lock_wait_seconds:.1f} 秒 ({retry.lock_errors} 次重试)")
 
         if num_entries_to_delete == 0:
-            print_success(f"未找到包含关键字 '{keyword}' 的条目。数据库已经是干净的。")
-            conn.close()
+            print_success(f"未找到包含关键字 {keyword} 的条目。数据库已经是干净的。")
             return True
 
-        print_info(f"找到 {num_entries_to_delete} 个包含 '{keyword}' 的条目:")
-        for entry in entries_to_delete[:5]:  # Show first 5 entries
-            print_info(f"  - {entry[0]}")
-        if num_entries_to_delete > 5:
-            print_info(f"  ... 还有 {num_entries_to_delete - 5} 个条目")
-
-        # 4. Delete the entries
-        query_delete = f"DELETE FROM ItemTable WHERE key LIKE ?"
-        print_info(f"正在删除包含 '{keyword}' 的条目...")
-        cursor.execute(query_delete, (like_pattern,))
-        conn.commit()
-        
-        deleted_rows = cursor.rowcount
+        print_info(f"找到 {num_entries_to_delete} 个包含 {keyword} 的条目:")
+        for key in preview:
+            print_info(f"  - {key}")
+        if num_entries_to_delete > len(preview):
+            print_info(f"  ... 还有 {num_entries_to_delete - len(preview)} 个条目")
+
         if deleted_rows == num_entries_to_delete:
-            print_success(f"成功删除 {deleted_rows} 个包含 '{keyword}' 的条目。")
+            print_success(f"成功删除 {deleted_rows} 个包含 {keyword} 的条目。")
         else:
             print_warning(f"尝试删除 {num_entries_to_delete} 个条目，但数据库报告删除了 {deleted_rows} 个。")
             if deleted_rows > 0:
                  print_success(f"部分成功: 删除了 {deleted_rows} 个条目。")
             else:
                  print_error("尽管找到了条目，但没有删除任何条目。请检查数据库权限或日志。")
-                 conn.close()
                  return False
 
-        conn.close()
         print_success("数据库清理完成。")
         return True
 
+    except LockTimeout as e:
+        # The delete was rolled back, so the database is unchanged and must not be overwritten
+        print_error(f"{e}")
+        print_info("请关闭 IDE 后重试，或使用更长的锁等待时间。")
+        return False
     except sqlite3.Error as e:
         print_error(f"SQLite 错误: {e}")
+        # Never overwrite the database while this process still has it open
+        if conn is not None:
+            conn.close()
+            conn = None
         if backup_path and backup_path.exists():
             print_warning(f"尝试从备份恢复数据库: {backup_path}")
             try:
@@ -160,6 +519,9 @@ def clean_vscode_database(db_path: Path, keyword: str = "augment") -> bool:
     except Exception as e:
         print_error(f"发生意外错误: {e}")
         return False
+    finally:
+        if conn is not None:
+            conn.close()
 
 if __name__ == '__main__':
     # This is for direct testing of this module, not part of the CLI.
@@ -259,13 +621,23 @@ if __name__ == '__main__':
 
 # === 新增功能：集成清理策略 ===
 
-def clean_ide_database_enhanced(ide_type: IDEType, keyword: str = "augment") -> dict:
+def clean_ide_database_enhanced(ide_type: IDEType, keyword: Union[str, Sequence[str]] = "augment",
+                                patterns: Optional[Sequence[str]] = None,
+                                backup_progress: Optional[BackupProgress] = None,
+                                compact: bool = True,
+                                max_lock_wait: float = DEFAULT_MAX_LOCK_WAIT,
+                                wait_for_exit: bool = False) -> dict:
     """
     增强版数据库清理函数，返回详细统计信息
 
     Args:
         ide_type: IDE类型
-        keyword: 搜索关键字
+        keyword: 搜索关键字（可为列表）
+        patterns: 可选的正则表达式列表
+        backup_progress: 备份进度回调 (已复制字节数, 总字节数)
+        compact: 删除后是否压缩数据库（见 compact_database）
+        max_lock_wait: 数据库被占用时最多等待的秒数
+        wait_for_exit: 等待期间检查 IDE 进程，退出后立即重试
 
     Returns:
         dict: 包含清理结果的详细信息
@@ -278,7 +650,13 @@ def clean_ide_database_enhanced(ide_type: IDEType, keyword: str = "augment") ->
     }
 
     ide_name = get_ide_display_name(ide_type)
-    print_info(f"开始增强清理 {ide_name} 数据库 (关键字: '{keyword}')")
+    try:
+        matcher = KeyMatcher(keyword, patterns)
+    except ValueError as e:
+        result["error_message"] = str(e)
+        print_error(result["error_message"])
+        return result
+    print_info(f"开始增强清理 {ide_name} 数据库 (关键字: {matcher.describe()})")
 
     # JetBrains 产品不需要数据库清理
     if ide_type == IDEType.JETBRAINS:
@@ -299,15 +677,28 @@ def clean_ide_database_enhanced(ide_type: IDEType, keyword: str = "augment") ->
         return result
 
     # 调用增强版清理函数
-    return clean_vscode_database_enhanced(db_path, keyword)
-
-def clean_vscode_database_enhanced(db_path: Path, keyword: str = "augment") -> dict:
+    return clean_vscode_database_enhanced(db_path, keyword, patterns, backup_progress, compact,
+                                          max_lock_wait, ide_type if wait_for_exit else None)
+
+def clean_vscode_database_enhanced(db_path: Path, keyword: Union[str, Sequence[str]] = "augment",
+                                   patterns: Optional[Sequence[str]] = None,
+                                   backup_progress: Optional[BackupProgress] = None,
+                                   compact: bool = True,
+                                   max_lock_wait: float = DEFAULT_MAX_LOCK_WAIT,
+                                   wait_for_ide: Optional[IDEType] = None) -> dict:
     """
     增强版VSCode数据库清理函数，返回详细统计信息
 
+    无论有多少关键字/正则，每个数据库只备份一次、扫描一次
+
     Args:
         db_path: 数据库文件路径
-        keyword: 搜索关键字
+        keyword: 搜索关键字（可为列表）
+        patterns: 可选的正则表达式列表
+        backup_progress: 备份进度回调 (已复制字节数, 总字节数)，抛出 BackupCancelled 可取消
+        compact: 有条目被删除时，是否检查点 WAL 并按空闲页比例 VACUUM
+        max_lock_wait: 数据库被占用时最多等待的秒数（指数退避重试）
+        wait_for_ide: 指定时在等待期间检查该 IDE 的进程
 
     Returns:
         dict: 包含清理结果的详细信息
@@ -316,6 +707,8 @@ def clean_vscode_database_enhanced(db_path: Path, keyword: str = "augment") -> d
         "success": False,
         "entries_removed": 0,
         "backup_created": False,
+        "compaction": None,
+        "lock_wait_seconds": 0.0,
         "error_message": None
     }
 
@@ -325,41 +718,50 @@ def clean_vscode_database_enhanced(db_path: Path, keyword: str = "augment") -> d
         return result
 
     try:
-        # 创建备份
-        backup_path = create_backup(db_path)
+        matcher = KeyMatcher(keyword, patterns)
+        keyword = matcher.describe()
+
+        # 创建备份（在线备份 API，包含 WAL 中的内容）
+        backup_path = backup_sqlite_database(db_path, backup_progress, max_lock_wait=max_lock_wait)
         if backup_path:
             result["backup_created"] = True
             print_success(f"已创建备份: {backup_path}")
 
-        # 连接数据库并清理
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-
-            # 首先统计要删除的条目数
-            count_query = "SELECT COUNT(*) FROM ItemTable WHERE key LIKE ?"
-            cursor.execute(count_query, (f'%{keyword}%',))
-            count_result = cursor.fetchone()
-            entries_to_remove = count_result[0] if count_result else 0
-
-            if entries_to_remove == 0:
-                print_info(f"未找到包含关键字 '{keyword}' 的条目")
-                result["success"] = True
-                return result
-
-            print_info(f"找到 {entries_to_remove} 个包含关键字 '{keyword}' 的条目")
+        # 连接数据库并清理（单次扫描、单个事务）
+        retry = LockRetry(max_lock_wait, wait_for_ide)
+        conn = open_cleanup_connection(db_path)
+        try:
+            entries_to_remove, _, deleted = retry.run(lambda: delete_matching_keys(conn, matcher), "清理")
+        finally:
+            conn.close()
+            result["lock_wait_seconds"] = retry.metrics()["lock_wait_seconds"]
 
-            # 执行删除
-            delete_query = "DELETE FROM ItemTable WHERE key LIKE ?"
-            cursor.execute(delete_query, (f'%{keyword}%',))
+        if entries_to_remove == 0:
+            print_info(f"未找到包含关键字 {keyword} 的条目")
+            result["success"] = True
+            return result
 
-            # 提交更改
-            conn.commit()
+        print_info(f"找到 {entries_to_remove} 个包含关键字 {keyword} 的条目")
 
-            result["entries_removed"] = entries_to_remove
-            result["success"] = True
+        result["entries_removed"] = deleted
+        result["success"] = True
 
-            print_success(f"成功删除 {entries_to_remove} 个条目")
+        print_success(f"成功删除 {deleted} 个条目")
 
+        if compact and deleted:
+            # 压缩失败不影响清理结果
+            try:
+                result["compaction"] = compact_database(db_path)
+                _report_compaction(result["compaction"])
+            except sqlite3.Error as e:
+                print_warning(f"数据库压缩失败: {e}")
+
+    except BackupCancelled:
+        result["error_message"] = "备份已取消，未进行清理"
+        print_warning(result["error_message"])
+    except LockTimeout as e:
+        result["error_message"] = f"{e}，未进行清理"
+        print_error(result["error_message"])
     except sqlite3.Error as e:
         result["error_message"] = f"数据库操作失败: {e}"
         print_error(result["error_message"])
@@ -417,6 +819,7 @@ async def clean_ide_comprehensive(ide_type: IDEType,
         "success": len(result.errors) == 0,
         "database_cleaned": result.database_cleaned,
         "database_entries_removed": result.database_entries_removed,
+        "database_bytes_reclaimed": result.database_bytes_reclaimed,
         "files_deleted": result.files_deleted,
         "global_storage_files": result.global_storage_files,
         "workspace_storage_files": result.workspace_storage_files,
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库访问与锁等待
+IDE 运行时会持有 state.vscdb 的锁，直接清理会在第一次 "database is locked" 时失败。
+这里统一设置 busy_timeout，并在锁错误时按指数退避（带随机抖动）重试，锁一释放就继续；
+可选地通过 ProcessManager 检查 IDE 是否仍在运行并提示等待其退出。锁等待时间作为指标返回。
+"""
+
+import random
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable, Optional, TypeVar
+
+from .common_utils import IDEType, get_ide_display_name, print_info, print_warning
+
+# 单条语句在 SQLite 内部等待锁的时间
+DEFAULT_BUSY_TIMEOUT_MS = 2000
+
+# 整个操作最多等待锁的时间（秒）
+DEFAULT_MAX_LOCK_WAIT = 30.0
+
+BACKOFF_INITIAL = 0.1
+BACKOFF_MAX = 5.0
+
+# 两次检查 IDE 进程之间的最短间隔（进程检查需要启动子进程）
+PROCESS_CHECK_INTERVAL = 3.0
+
+# SQLITE_BUSY / SQLITE_LOCKED
+_LOCK_ERROR_CODES = (5, 6)
+
+T = TypeVar("T")
+
+
+def is_lock_error(error: BaseException) -> bool:
+    """是否为可重试的锁错误"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xFF in _LOCK_ERROR_CODES
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+def connect(db_path: Path, busy_timeout_ms: int = DEFAULT_BUSY_TIMEOUT_MS, **kwargs) -> sqlite3.Connection:
+    """打开连接并设置 busy_timeout"""
+    return sqlite3.connect(db_path, timeout=busy_timeout_ms / 1000, **kwargs)
+
+
+def backoff_delay(attempt: int, initial: float = BACKOFF_INITIAL, maximum: float = BACKOFF_MAX) -> float:
+    """第 attempt 次重试前的等待时间：指数增长，上限 maximum，取其 50%-100% 的随机值"""
+    ceiling = min(maximum, initial * (2 ** attempt))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+class LockTimeout(sqlite3.OperationalError):
+    """超过最长等待时间后锁仍未释放"""
+
+
+def backup_database(src: sqlite3.Connection, dst: sqlite3.Connection, max_wait: float = DEFAULT_MAX_LOCK_WAIT,
+                    pages: int = -1, progress: Optional[Callable[[int, int, int], None]] = None) -> None:
+    """
+    在线备份 src 到 dst，源数据库持续被锁超过 max_wait 秒时中止并抛出 LockTimeout
+
+    Connection.backup 遇到 SQLITE_BUSY/LOCKED 会无限重试；每一步之后的回调都会收到该步的状态码，
+    在回调中检查锁等待时间。progress(status, remaining, total) 与 Connection.backup 的回调相同。
+    """
+    first_busy = None
+    step_started = time.monotonic()
+
+    def on_step(status, remaining, total):
+        nonlocal first_busy, step_started
+        now = time.monotonic()
+        if status in _LOCK_ERROR_CODES:
+            # 从第一次因锁失败的那一步开始计时（该步已在 busy_timeout 中等待过）
+            if first_busy is None:
+                first_busy = step_started
+            if now - first_busy >= max_wait:
+                raise LockTimeout(f"等待数据库锁超时 ({now - first_busy:.1f} 秒)，备份已中止")
+        else:
+            first_busy = None
+        if progress is not None:
+            progress(status, remaining, total)
+        step_started = time.monotonic()
+
+    src.backup(dst, pages=pages, progress=on_step)
+
+
+class LockRetry:
+    """
+    在锁错误时重试数据库操作
+
+    Args:
+        max_wait: 最多等待锁的秒数
+        ide_type: 指定时在等待期间检查该 IDE 的进程，提示用户关闭；进程退出后立即重试
+        process_manager: 用于检查进程的 ProcessManager（默认新建）
+        verbose: 是否输出等待提示（进程池工作进程中关闭）
+    """
+
+    def __init__(self, max_wait: float = DEFAULT_MAX_LOCK_WAIT, ide_type: Optional[IDEType] = None,
+                 process_manager=None, verbose: bool = True):
+        self.max_wait = max_wait
+        self.ide_type = ide_type
+        self.verbose = verbose
+        self._process_manager = process_manager
+        self.lock_wait_seconds = 0.0
+        self.lock_errors = 0
+
+    @property
+    def process_manager(self):
+        if self._process_manager is None:
+            from .process_manager import ProcessManager
+            self._process_manager = ProcessManager()
+        return self._process_manager
+
+    def metrics(self) -> dict:
+        return {
+            'lock_wait_seconds': round(self.lock_wait_seconds, 3),
+            'lock_errors': self.lock_errors,
+        }
+
+    def _ide_running(self) -> bool:
+        try:
+            return self.process_manager.check_ide_processes(self.ide_type)
+        except Exception:
+            return False
+
+    def run(self, operation: Callable[[], T], description: str = "数据库操作") -> T:
+        """
+        执行 operation，遇到锁错误时退避重试，直到成功或超过 max_wait
+
+        operation 失败时必须已回滚（如 delete_matching_keys），以便安全重试。
+        锁等待时间累加到 lock_wait_seconds：从第一次因锁失败的尝试开始到操作完成
+        （最后一次尝试可能仍在 busy_timeout 中等待，无法与执行时间分开）。
+        """
+        first_failure = None
+        attempt = 0
+        last_process_check = 0.0
+        ide_was_running = False
+        while True:
+            started = time.monotonic()
+            try:
+                result = operation()
+                if first_failure is not None:
+                    waited = time.monotonic() - first_failure
+                    self.lock_wait_seconds += waited
+                    if self.verbose:
+                        print_info(f"数据库锁已释放，{description}完成 (等待 {waited:.1f} 秒)")
+                return result
+            except sqlite3.OperationalError as e:
+                if not is_lock_error(e):
+                    raise
+                now = time.monotonic()
+                self.lock_errors += 1
+                if first_failure is None:
+                    first_failure = started
+                    if self.verbose:
+                        print_warning(f"数据库被占用，{description}将在锁释放后继续 (最多等待 {self.max_wait:.0f} 秒)")
+
+                waited = now - first_failure
+                if waited >= self.max_wait:
+                    self.lock_wait_seconds += waited
+                    raise LockTimeout(f"等待数据库锁超时 ({waited:.1f} 秒): {e}") from e
+
+                delay = backoff_delay(attempt)
+                attempt += 1
+                if self.ide_type is not None and now - last_process_check >= PROCESS_CHECK_INTERVAL:
+                    last_process_check = now
+                    running = self._ide_running()
+                    if running and not ide_was_running:
+                        if self.verbose:
+                            print_warning(f"{get_ide_display_name(self.ide_type)} 正在运行，请关闭后清理将自动继续")
+                    elif ide_was_running and not running:
+                        # IDE 刚退出，锁即将释放，从最短间隔重新开始
+                        attempt = 0
+                        delay = BACKOFF_INITIAL
+                    ide_was_running = running
+
+                time.sleep(min(delay, max(0.0, self.max_wait - waited)))
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库只读清单
+清理前查看各 state.vscdb（全局和每个工作区）中有哪些键：按键名前缀（第一个 "." 或 "/" 之前的部分）
+统计行数和值的字节数，并标出清理关键字会匹配多少行。每个数据库以 mode=ro URI 打开，
+只做一次 GROUP BY 扫描，不读取值内容；多个数据库并发处理，适合在登录脚本中运行。
+"""
+
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+from .common_utils import IDEType, get_ide_paths, print_info
+
+INVENTORY_IDES = (IDEType.VSCODE, IDEType.CURSOR, IDEType.WINDSURF)
+
+# 每个数据库输出的前缀数（按字节数排序），其余合并统计
+DEFAULT_TOP_PREFIXES = 20
+
+# octet_length 需要 SQLite 3.43；更早的版本转换为 BLOB 后取长度
+_VALUE_BYTES_SQL = ("octet_length(value)" if sqlite3.sqlite_version_info >= (3, 43, 0)
+                    else "length(CAST(value AS BLOB))")
+
+_PREFIX_SQL = """
+    CASE
+        WHEN dot = 0 AND slash = 0 THEN key
+        WHEN dot = 0 OR (slash > 0 AND slash < dot) THEN substr(key, 1, slash - 1)
+        ELSE substr(key, 1, dot - 1)
+    END
+"""
+
+
+def _inventory_query(predicate: str) -> str:
+    return f"""
+        SELECT prefix, COUNT(*), SUM(bytes), SUM(matched), SUM(CASE WHEN matched THEN bytes ELSE 0 END)
+        FROM (
+            SELECT {_PREFIX_SQL} AS prefix, bytes, matched
+            FROM (
+                SELECT key, instr(key, '.') AS dot, instr(key, '/') AS slash,
+                       COALESCE({_VALUE_BYTES_SQL}, 0) AS bytes,
+                       ({predicate}) AS matched
+                FROM ItemTable
+            )
+        )
+        GROUP BY prefix
+    """
+
+
+def open_readonly(db_path: Path) -> sqlite3.Connection:
+    """以只读 URI 打开数据库（不会创建文件，也不会获取写锁）"""
+    from .db_access import connect
+    return connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+
+
+def inventory_database(db_path: Path, matcher=None, top: int = DEFAULT_TOP_PREFIXES) -> dict:
+    """
+    统计单个数据库
+
+    Args:
+        db_path: state.vscdb 路径
+        matcher: KeyMatcher（可选），用于统计清理会删除的行
+        top: 输出的前缀数
+
+    Returns:
+        dict: db / rows / value_bytes / matched_rows / matched_bytes / prefixes / seconds / error
+    """
+    started = time.perf_counter()
+    result = {
+        'db': str(db_path),
+        'rows': 0,
+        'value_bytes': 0,
+        'matched_rows': 0,
+        'matched_bytes': 0,
+        'prefixes': [],
+        'seconds': 0.0,
+        'error': None,
+    }
+    conn = None
+    try:
+        conn = open_readonly(db_path)
+        predicate, params = "0", ()
+        if matcher is not None:
+            matcher.register(conn)
+            predicate, params = matcher.predicate()
+
+        groups = []
+        for prefix, rows, value_bytes, matched, matched_bytes in conn.execute(_inventory_query(predicate), params):
+            value_bytes = value_bytes or 0
+            result['rows'] += rows
+            result['value_bytes'] += value_bytes
+            result['matched_rows'] += matched
+            result['matched_bytes'] += matched_bytes
+            groups.append({'prefix': prefix, 'rows': rows, 'bytes': value_bytes, 'matched': matched})
+
+        groups.sort(key=lambda group: (group['matched'] > 0, group['bytes']), reverse=True)
+        shown = groups[:top]
+        rest = groups[top:]
+        if rest:
+            shown.append({
+                'prefix': f"({len(rest)} more)",
+                'rows': sum(group['rows'] for group in rest),
+                'bytes': sum(group['bytes'] for group in rest),
+                'matched': sum(group['matched'] for group in rest),
+            })
+        result['prefixes'] = shown
+    except sqlite3.Error as e:
+        result['error'] = str(e)
+    finally:
+        if conn is not None:
+            conn.close()
+    result['seconds'] = round(time.perf_counter() - started, 4)
+    return result
+
+
+def collect_database_targets(ide_types: Sequence[IDEType] = INVENTORY_IDES,
+                             include_workspaces: bool = True) -> List[Tuple[str, str, Optional[str], Path]]:
+    """
+    列出要统计的数据库
+
+    Returns:
+        [(ide, scope, workspace, db_path)]，scope 为 "global" 或 "workspace"
+    """
+    from .file_cleaner import iter_workspace_databases
+
+    targets = []
+    for ide_type in ide_types:
+        paths = get_ide_paths(ide_type, verbose=False) or {}
+        state_db = paths.get('state_db')
+        if not state_db:
+            continue
+        if state_db.exists():
+            targets.append((ide_type.value, "global", None, state_db))
+        if include_workspaces:
+            workspace_storage = state_db.parent.parent / "workspaceStorage"
+            if workspace_storage.is_dir():
+                for db_path in iter_workspace_databases(workspace_storage):
+                    db_path = Path(db_path)
+                    targets.append((ide_type.value, "workspace", db_path.parent.name, db_path))
+    return targets
+
+
+def build_inventory(ide_types: Sequence[IDEType] = INVENTORY_IDES,
+                    keywords: Sequence[str] = ("augment",), patterns: Sequence[str] = (),
+                    include_workspaces: bool = True, max_workers: Optional[int] = None,
+                    top: int = DEFAULT_TOP_PREFIXES) -> dict:
+    """
+    并发统计所有IDE的全局和工作区数据库
+
+    Returns:
+        dict: matcher / summary（databases、rows、value_bytes、matched_rows、matched_bytes、errors）/ databases
+    """
+    from .batch_patcher import default_worker_count
+    from .database_manager import KeyMatcher
+
+    matcher = KeyMatcher(list(keywords), list(patterns))
+    targets = collect_database_targets(ide_types, include_workspaces)
+
+    started = time.perf_counter()
+    databases = []
+    if targets:
+        workers = max_workers or default_worker_count(len(targets))
+        print_info(f"统计 {len(targets)} 个数据库 (线程数: {workers})")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db-inventory") as executor:
+            reports = executor.map(lambda target: inventory_database(target[3], matcher, top), targets)
+            for (ide, scope, workspace, _), report in zip(targets, reports):
+                databases.append({'ide': ide, 'scope': scope, 'workspace': workspace, **report})
+
+    summary = {
+        'databases': len(databases),
+        'rows': sum(db['rows'] for db in databases),
+        'value_bytes': sum(db['value_bytes'] for db in databases),
+        'matched_rows': sum(db['matched_rows'] for db in databases),
+        'matched_bytes': sum(db['matched_bytes'] for db in databases),
+        'errors': sum(1 for db in databases if db['error']),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+    return {'matcher': matcher.describe(), 'summary': summary, 'databases': databases}
@@ -6,62 +6,215 @@
 """
 
 import os
-import glob
+import fnmatch
+import threading
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Sequence, Tuple
 import platform
 
-from .common_utils import IDEType, print_info, print_warning, print_error
+from .common_utils import IDEType, print_info, print_warning
+
+
+# 便携版中常见的扩展目录
+PORTABLE_EXTENSION_SUBDIRS = (
+    "extensions",
+    os.path.join("data", "extensions"),
+    os.path.join("user-data", "extensions"),
+    os.path.join("resources", "app", "extensions"),
+)
+
+# 遍历深度（根目录为 0，只列出深度不超过该值的目录）
+PORTABLE_SEARCH_DEPTH = 3
+KEYWORD_SEARCH_DEPTH = 4
+
+# 不进入的目录：依赖目录中可能有成千上万个子目录，且不会包含扩展入口
+SKIP_DIR_NAMES = frozenset({"node_modules", ".git"})
+
+EXTENSION_ENTRY_NAME = "extension.js"
+
+
+class ExtensionWalkSpec:
+    """
+    一个遍历根目录及其规则
+
+    Args:
+        root: 根目录
+        ide_type: 命中结果归属的IDE（关键词搜索时为 None）
+        max_depth: 最大目录深度
+        dir_patterns: 各层子目录名需匹配的通配符（如 ("augment.vscode-augment-*", "out")），
+            超出部分不限制；指定时只接受位于最后一层规则之下的入口文件
+        keyword: 命中文件所在目录路径需包含的关键词（不区分大小写）
+    """
+    def __init__(self, root: str, ide_type: Optional[IDEType], max_depth: int,
+                 dir_patterns: Sequence[str] = (), keyword: str = "augment"):
+        self.root = root
+        self.ide_type = ide_type
+        self.max_depth = max_depth
+        self.dir_patterns = tuple(dir_patterns)
+        self.keyword = keyword.lower()
+
+    def cache_key(self) -> tuple:
+        return (self.root, self.ide_type, self.max_depth, self.dir_patterns, self.keyword)
+
+
+def walk_extension_trees(specs: List[ExtensionWalkSpec],
+                         listed_dirs: Optional[Dict[str, Optional[int]]] = None) -> List[Tuple[Optional[IDEType], str]]:
+    """
+    用 os.scandir 一次遍历所有根目录，返回 (IDE类型, 入口文件路径) 列表（按路径去重，保持发现顺序）
+
+    不匹配规则的子目录在列出前即被剪除。已遍历记录按规则（目录通配符和关键词）区分：
+    过滤条件相同的规则覆盖同一目录时，只有能继续向下遍历更深的规则才会重新进入该目录；
+    过滤条件不同的规则各自遍历，不会因其他规则已经访问过而漏掉命中。
+
+    Args:
+        listed_dirs: 若提供，记录每个被列出目录的 st_mtime_ns（不存在的根目录记为 None），
+            供发现缓存判断目录内容是否变化
+    """
+    hits: Dict[str, Optional[IDEType]] = {}
+    # (过滤条件, st_dev, st_ino, 通配符层级) -> 已遍历时剩余的深度，防止符号链接环路和重复遍历
+    visited: Dict[tuple, int] = {}
+
+    for spec in specs:
+        stack = [(spec.root, 0)]
+        while stack:
+            path, depth = stack.pop()
+            try:
+                st = os.stat(path)
+            except OSError:
+                if depth == 0 and listed_dirs is not None:
+                    listed_dirs.setdefault(path, None)
+                continue
+            if listed_dirs is not None:
+                listed_dirs[path] = st.st_mtime_ns
+            # 有通配符时同一目录在不同层级匹配不同规则，层级也是键的一部分
+            level = depth if depth < len(spec.dir_patterns) else None
+            key = (spec.dir_patterns, spec.keyword, st.st_dev, st.st_ino, level)
+            remaining = spec.max_depth - depth
+            if visited.get(key, -1) >= remaining:
+                continue
+            visited[key] = max(remaining, visited.get(key, -1))
+
+            accept_files = depth >= len(spec.dir_patterns) and spec.keyword in path.lower()
+            child_pattern = spec.dir_patterns[depth] if depth < len(spec.dir_patterns) else None
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        name = entry.name
+                        try:
+                            if entry.is_dir():
+                                if depth >= spec.max_depth or name in SKIP_DIR_NAMES:
+                                    continue
+                                if child_pattern is not None and not fnmatch.fnmatch(name, child_pattern):
+                                    continue
+                                stack.append((entry.path, depth + 1))
+                            elif accept_files and name == EXTENSION_ENTRY_NAME:
+                                hits.setdefault(entry.path, spec.ide_type)
+                        except OSError:
+                            continue
+            except OSError as e:
+                if depth == 0:
+                    print_warning(f"搜索路径失败 {path}: {e}")
+
+    return [(ide_type, path) for path, ide_type in hits.items()]
+
+
+def _stat_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class _DiscoveryEntry:
+    """一次发现的结果及其依赖的文件系统状态"""
+    def __init__(self, dir_mtimes: Dict[str, Optional[int]], file_stats: Dict[str, Optional[Tuple[int, int]]],
+                 hits: List[Tuple[Optional[IDEType], str]]):
+        self.dir_mtimes = dir_mtimes
+        self.file_stats = file_stats
+        self.hits = hits
+
+    def is_current(self) -> bool:
+        """目录的增删改都会更新其 mtime；文件本身的变化通过 (大小, mtime) 检查"""
+        for path, mtime in self.dir_mtimes.items():
+            try:
+                current = os.stat(path).st_mtime_ns
+            except OSError:
+                current = None
+            if current != mtime:
+                return False
+        return all(_stat_signature(path) == sig for path, sig in self.file_stats.items())
+
+
+# 进程内共享的发现缓存：遍历规则 -> 结果；以及文件有效性检查结果：路径 -> (签名, 是否有效)
+_discovery_cache: Dict[tuple, _DiscoveryEntry] = {}
+_validity_cache: Dict[str, Tuple[Optional[Tuple[int, int]], bool]] = {}
+_discovery_lock = threading.Lock()
+
+
+def invalidate_discovery_cache() -> None:
+    """清空发现缓存（如监视器发现新扩展后）；目录或文件变化时缓存也会自动失效"""
+    with _discovery_lock:
+        _discovery_cache.clear()
+        _validity_cache.clear()
 
 
 class ExtensionFinder:
     """扩展文件查找器"""
     
-    def __init__(self):
+    def __init__(self, home: Optional[str] = None, verbose: bool = True):
+        """
+        Args:
+            home: 在指定的用户主目录下查找（默认当前用户，用于多用户扫描）
+            verbose: 是否输出查找结果
+        """
         self.system = platform.system().lower()
+        self.home = os.path.abspath(home) if home else os.path.expanduser("~")
+        self.verbose = verbose
+        user_path = self._user_path
         
         # 扩展文件路径模式
         self.extension_patterns = {
             IDEType.VSCODE: {
                 "windows": [
-                    os.path.expanduser("~/.vscode/extensions/augment.vscode-augment-*/out/extension.js"),
-                    os.path.expanduser("~/AppData/Roaming/Code/User/extensions/augment.vscode-augment-*/out/extension.js"),
+                    user_path(".vscode/extensions/augment.vscode-augment-*/out/extension.js"),
+                    user_path("AppData/Roaming/Code/User/extensions/augment.vscode-augment-*/out/extension.js"),
                 ],
                 "linux": [
-                    os.path.expanduser("~/.vscode/extensions/augment.vscode-augment-*/out/extension.js"),
-                    os.path.expanduser("~/.config/Code/User/extensions/augment.vscode-augment-*/out/extension.js"),
+                    user_path(".vscode/extensions/augment.vscode-augment-*/out/extension.js"),
+                    user_path(".config/Code/User/extensions/augment.vscode-augment-*/out/extension.js"),
                 ],
                 "darwin": [
-                    os.path.expanduser("~/.vscode/extensions/augment.vscode-augment-*/out/extension.js"),
-                    os.path.expanduser("~/Library/Application Support/Code/User/extensions/augment.vscode-augment-*/out/extension.js"),
+                    user_path(".vscode/extensions/augment.vscode-augment-*/out/extension.js"),
+                    user_path("Library/Application Support/Code/User/extensions/augment.vscode-augment-*/out/extension.js"),
                 ]
             },
             IDEType.CURSOR: {
                 "windows": [
-                    os.path.expanduser("~/.cursor/extensions/augment.cursor-augment-*/out/extension.js"),
-                    os.path.expanduser("~/AppData/Roaming/Cursor/User/extensions/augment.cursor-augment-*/out/extension.js"),
+                    user_path(".cursor/extensions/augment.cursor-augment-*/out/extension.js"),
+                    user_path("AppData/Roaming/Cursor/User/extensions/augment.cursor-augment-*/out/extension.js"),
                 ],
                 "linux": [
-                    os.path.expanduser("~/.cursor/extensions/augment.cursor-augment-*/out/extension.js"),
-                    os.path.expanduser("~/.config/Cursor/User/extensions/augment.cursor-augment-*/out/extension.js"),
+                    user_path(".cursor/extensions/augment.cursor-augment-*/out/extension.js"),
+                    user_path(".config/Cursor/User/extensions/augment.cursor-augment-*/out/extension.js"),
                 ],
                 "darwin": [
-                    os.path.expanduser("~/.cursor/extensions/augment.cursor-augment-*/out/extension.js"),
-                    os.path.expanduser("~/Library/Application Support/Cursor/User/extensions/augment.cursor-augment-*/out/extension.js"),
+                    user_path(".cursor/extensions/augment.cursor-augment-*/out/extension.js"),
+                    user_path("Library/Application Support/Cursor/User/extensions/augment.cursor-augment-*/out/extension.js"),
                 ]
             },
             IDEType.WINDSURF: {
                 "windows": [
-                    os.path.expanduser("~/.windsurf/extensions/augment.windsurf-augment-*/out/extension.js"),
-                    os.path.expanduser("~/AppData/Roaming/Windsurf/User/extensions/augment.windsurf-augment-*/out/extension.js"),
+                    user_path(".windsurf/extensions/augment.windsurf-augment-*/out/extension.js"),
+                    user_path("AppData/Roaming/Windsurf/User/extensions/augment.windsurf-augment-*/out/extension.js"),
                 ],
                 "linux": [
-                    os.path.expanduser("~/.windsurf/extensions/augment.windsurf-augment-*/out/extension.js"),
-                    os.path.expanduser("~/.config/Windsurf/User/extensions/augment.windsurf-augment-*/out/extension.js"),
+                    user_path(".windsurf/extensions/augment.windsurf-augment-*/out/extension.js"),
+                    user_path(".config/Windsurf/User/extensions/augment.windsurf-augment-*/out/extension.js"),
                 ],
                 "darwin": [
-                    os.path.expanduser("~/.windsurf/extensions/augment.windsurf-augment-*/out/extension.js"),
-                    os.path.expanduser("~/Library/Application Support/Windsurf/User/extensions/augment.windsurf-augment-*/out/extension.js"),
+                    user_path(".windsurf/extensions/augment.windsurf-augment-*/out/extension.js"),
+                    user_path("Library/Application Support/Windsurf/User/extensions/augment.windsurf-augment-*/out/extension.js"),
                 ]
             }
         }
@@ -74,91 +227,110 @@ class ExtensionFinder:
             "*augment*/build/extension.js"
         ]
     
+    def _user_path(self, relative: str) -> str:
+        return os.path.join(self.home, *relative.split("/"))
+
     def find_extension_files(self, ide_type: IDEType, portable_root: Optional[str] = None) -> List[str]:
         """查找指定IDE的扩展文件"""
-        found_files = []
-        
-        # 如果指定了便携版根目录
-        if portable_root:
-            portable_files = self._find_portable_extensions(ide_type, portable_root)
-            found_files.extend(portable_files)
-        
-        # 查找标准安装位置
-        standard_files = self._find_standard_extensions(ide_type)
-        found_files.extend(standard_files)
-        
-        # 去重并验证文件
-        unique_files = list(set(found_files))
-        valid_files = [f for f in unique_files if os.path.exists(f) and self._is_valid_extension_file(f)]
-        
-        if valid_files:
-            print_info(f"找到 {len(valid_files)} 个 {ide_type.value} 扩展文件:")
-            for file in valid_files:
-                print_info(f"  - {file}")
-        else:
-            print_warning(f"未找到 {ide_type.value} 的扩展文件")
-        
-        return valid_files
-    
-    def _find_standard_extensions(self, ide_type: IDEType) -> List[str]:
-        """查找标准安装位置的扩展文件"""
-        found_files = []
-        
         if ide_type not in self.extension_patterns:
             print_warning(f"不支持的IDE类型: {ide_type}")
-            return found_files
-        
-        patterns = self.extension_patterns[ide_type].get(self.system, [])
-        
-        for pattern in patterns:
-            try:
-                matches = glob.glob(pattern)
-                found_files.extend(matches)
-            except Exception as e:
-                print_warning(f"搜索模式失败 {pattern}: {e}")
+            return []
+
+        valid_files = [path for _, path in self._discover(self._build_walk_specs(ide_type, portable_root))]
         
-        return found_files
-    
-    def _find_portable_extensions(self, ide_type: IDEType, portable_root: str) -> List[str]:
-        """查找便携版扩展文件"""
-        found_files = []
+        if self.verbose:
+            if valid_files:
+                print_info(f"找到 {len(valid_files)} 个 {ide_type.value} 扩展文件:")
+                for file in valid_files:
+                    print_info(f"  - {file}")
+            else:
+                print_warning(f"未找到 {ide_type.value} 的扩展文件")
         
-        try:
-            portable_path = Path(portable_root)
-            if not portable_path.exists():
+        return valid_files
+
+    def _discover(self, specs: List[ExtensionWalkSpec]) -> List[Tuple[Optional[IDEType], str]]:
+        """
+        遍历并验证扩展文件，结果按遍历规则缓存
+
+        缓存记录遍历时列出的每个目录的 mtime 和每个命中文件的 (大小, mtime)，
+        全部未变化时直接返回缓存结果；否则重新遍历，但未变化文件的有效性检查结果仍会复用
+        """
+        key = tuple(spec.cache_key() for spec in specs)
+        with _discovery_lock:
+            entry = _discovery_cache.get(key)
+        if entry is not None and entry.is_current():
+            return list(entry.hits)
+
+        dir_mtimes: Dict[str, Optional[int]] = {}
+        file_stats: Dict[str, Optional[Tuple[int, int]]] = {}
+        valid_hits = []
+        for ide_type, path in walk_extension_trees(specs, dir_mtimes):
+            sig = _stat_signature(path)
+            file_stats[path] = sig
+            with _discovery_lock:
+                cached = _validity_cache.get(path)
+            if cached is not None and cached[0] == sig:
+                valid = cached[1]
+            else:
+                valid = self._is_valid_extension_file(path)
+                with _discovery_lock:
+                    _validity_cache[path] = (sig, valid)
+            if valid:
+                valid_hits.append((ide_type, path))
+
+        with _discovery_lock:
+            _discovery_cache[key] = _DiscoveryEntry(dir_mtimes, file_stats, valid_hits)
+        return list(valid_hits)
+
+    def invalidate_cache(self) -> None:
+        """显式清空发现缓存"""
+        invalidate_discovery_cache()
+
+    def get_extension_roots(self, ide_type: IDEType, portable_root: Optional[str] = None,
+                            existing_only: bool = True) -> List[str]:
+        """
+        获取扩展安装根目录（即 augment.* 扩展目录的父目录），供监视器使用
+
+        Args:
+            existing_only: 只返回已存在的目录
+        """
+        roots = []
+
+        if portable_root:
+            for sub in PORTABLE_EXTENSION_SUBDIRS:
+                roots.append(os.path.join(portable_root, sub))
+
+        # 模式形如 <root>/augment.xxx-augment-*/out/extension.js
+        for pattern in self.extension_patterns.get(ide_type, {}).get(self.system, []):
+            roots.append(str(Path(pattern).parents[2]))
+
+        unique_roots = list(dict.fromkeys(roots))
+        if existing_only:
+            unique_roots = [root for root in unique_roots if os.path.isdir(root)]
+        return unique_roots
+
+    def _build_walk_specs(self, ide_type: IDEType, portable_root: Optional[str] = None) -> List["ExtensionWalkSpec"]:
+        """生成指定IDE的遍历规则：便携版目录在前，标准安装位置在后"""
+        specs = []
+
+        if portable_root:
+            if not Path(portable_root).exists():
                 print_warning(f"便携版路径不存在: {portable_root}")
-                return found_files
-            
-            # 在便携版目录中搜索扩展文件
-            search_patterns = [
-                "extensions/augment*/out/extension.js",
-                "data/extensions/augment*/out/extension.js",
-                "user-data/extensions/augment*/out/extension.js",
-                "resources/app/extensions/augment*/out/extension.js"
-            ]
-            
-            for pattern in search_patterns:
-                search_path = portable_path / pattern
-                matches = glob.glob(str(search_path))
-                found_files.extend(matches)
-            
-            # 递归搜索（限制深度）
-            for root, dirs, files in os.walk(portable_root):
-                # 限制搜索深度
-                level = root.replace(portable_root, '').count(os.sep)
-                if level >= 4:
-                    dirs[:] = []  # 不再深入
-                    continue
-                
-                for file in files:
-                    if file == "extension.js" and "augment" in root.lower():
-                        full_path = os.path.join(root, file)
-                        found_files.append(full_path)
-        
-        except Exception as e:
-            print_error(f"搜索便携版扩展失败: {e}")
-        
-        return found_files
+            else:
+                # 有限深度的递归搜索，命中路径需包含 augment
+                specs.append(ExtensionWalkSpec(portable_root, ide_type, max_depth=PORTABLE_SEARCH_DEPTH))
+                # 常见的扩展目录（可能超出递归深度），扩展目录名需以 augment 开头
+                for sub in PORTABLE_EXTENSION_SUBDIRS:
+                    specs.append(ExtensionWalkSpec(os.path.join(portable_root, sub), ide_type,
+                                                   max_depth=2, dir_patterns=("augment*", "out")))
+
+        # 标准安装位置: <root>/augment.xxx-augment-*/out/extension.js
+        for pattern in self.extension_patterns[ide_type].get(self.system, []):
+            pattern_path = Path(pattern)
+            specs.append(ExtensionWalkSpec(str(pattern_path.parents[2]), ide_type, max_depth=2,
+                                           dir_patterns=(pattern_path.parts[-3], pattern_path.parts[-2])))
+
+        return specs
     
     def _is_valid_extension_file(self, file_path: str) -> bool:
         """验证是否为有效的扩展文件"""
@@ -195,28 +367,49 @@ class ExtensionFinder:
             return "augment" in file_path.lower() and file_path.endswith(".js")
     
     def find_all_extensions(self, portable_roots: Optional[Dict[IDEType, str]] = None) -> Dict[IDEType, List[str]]:
-        """查找所有支持的IDE的扩展文件"""
-        results = {}
-        
+        """查找所有支持的IDE的扩展文件（所有IDE的根目录在一次遍历中完成）"""
+        specs = []
         for ide_type in [IDEType.VSCODE, IDEType.CURSOR, IDEType.WINDSURF]:
             portable_root = None
             if portable_roots and ide_type in portable_roots:
                 portable_root = portable_roots[ide_type]
-            
-            files = self.find_extension_files(ide_type, portable_root)
-            if files:
-                results[ide_type] = files
+            specs.extend(self._build_walk_specs(ide_type, portable_root))
+
+        results: Dict[IDEType, List[str]] = {}
+        for ide_type, path in self._discover(specs):
+            results.setdefault(ide_type, []).append(path)
+
+        if self.verbose:
+            for ide_type, files in results.items():
+                print_info(f"找到 {len(files)} 个 {ide_type.value} 扩展文件:")
+                for file in files:
+                    print_info(f"  - {file}")
         
         return results
     
+    def find_extension_installs(self, ide_type: IDEType, portable_root: Optional[str] = None) -> List["ExtensionInstall"]:
+        """
+        通过各扩展目录的 extensions.json 列出已安装的 Augment 扩展及其版本
+        （清单不可用的目录退回目录匹配）
+        """
+        from .extension_index import list_extension_installs
+
+        return list_extension_installs(self.get_extension_roots(ide_type, portable_root))
+
     def get_latest_extension(self, ide_type: IDEType, portable_root: Optional[str] = None) -> Optional[str]:
-        """获取最新版本的扩展文件"""
+        """获取最新版本的扩展文件（按语义化版本比较）"""
+        from .extension_index import pick_latest
+
+        latest = pick_latest(self.find_extension_installs(ide_type, portable_root))
+        if latest is not None and latest.version_key is not None:
+            return latest.entry_path
+
+        # 索引中没有可比较的版本（如便携版的非标准目录），退回按修改时间选择
         files = self.find_extension_files(ide_type, portable_root)
         
         if not files:
-            return None
+            return latest.entry_path if latest is not None else None
         
-        # 按修改时间排序，返回最新的
         try:
             latest_file = max(files, key=lambda f: os.path.getmtime(f))
             return latest_file
@@ -226,37 +419,18 @@ class ExtensionFinder:
     
     def search_by_keyword(self, keyword: str = "augment", search_paths: Optional[List[str]] = None) -> List[str]:
         """通过关键词搜索扩展文件"""
-        found_files = []
-        
         if not search_paths:
             # 默认搜索路径
             search_paths = [
-                os.path.expanduser("~/.vscode"),
-                os.path.expanduser("~/.cursor"), 
-                os.path.expanduser("~/.windsurf"),
-                os.path.expanduser("~/AppData/Roaming") if self.system == "windows" else "",
-                os.path.expanduser("~/.config") if self.system == "linux" else "",
-                os.path.expanduser("~/Library/Application Support") if self.system == "darwin" else ""
+                self._user_path(".vscode"),
+                self._user_path(".cursor"),
+                self._user_path(".windsurf"),
+                self._user_path("AppData/Roaming") if self.system == "windows" else "",
+                self._user_path(".config") if self.system == "linux" else "",
+                self._user_path("Library/Application Support") if self.system == "darwin" else ""
             ]
             search_paths = [p for p in search_paths if p and os.path.exists(p)]
         
-        for search_path in search_paths:
-            try:
-                for root, dirs, files in os.walk(search_path):
-                    # 限制搜索深度
-                    level = root.replace(search_path, '').count(os.sep)
-                    if level >= 5:
-                        dirs[:] = []
-                        continue
-                    
-                    if keyword.lower() in root.lower():
-                        for file in files:
-                            if file == "extension.js":
-                                full_path = os.path.join(root, file)
-                                if self._is_valid_extension_file(full_path):
-                                    found_files.append(full_path)
-            
-            except Exception as e:
-                print_warning(f"搜索路径失败 {search_path}: {e}")
-        
-        return list(set(found_files))  # 去重
+        specs = [ExtensionWalkSpec(path, None, max_depth=KEYWORD_SEARCH_DEPTH, keyword=keyword)
+                 for path in search_paths]
+        return [full_path for _, full_path in self._discover(specs)]
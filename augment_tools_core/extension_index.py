@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+扩展安装索引
+VS Code / Cursor / Windsurf 在 extensions/extensions.json 中记录已安装扩展的 ID、版本和位置。
+直接读取该清单即可列出 Augment 扩展及其版本，无需遍历目录；清单缺失或损坏时退回目录匹配。
+清单按 (大小, mtime) 缓存，同一进程中未变化时只解析一次。
+"""
+
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .common_utils import print_warning
+
+MANIFEST_NAME = "extensions.json"
+# 已卸载/已被新版本替换、等待 IDE 删除的扩展目录
+OBSOLETE_NAME = ".obsolete"
+
+EXTENSION_ENTRY = os.path.join("out", "extension.js")
+
+_SEMVER_RE = re.compile(r"^v?(\d+)\.(\d+)\.(\d+)(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?$")
+# 扩展市场的目标平台后缀（不属于版本号，不参与版本比较）
+_PLATFORM_SUFFIX = r"(?:win32|linux|darwin|alpine)-(?:x64|arm64|ia32|armhf)|web|universal"
+# 目录名形如 augment.vscode-augment-0.482.1 或 augment.vscode-augment-0.482.1-linux-x64；
+# 预发布标识不能恰好是平台后缀（否则 -universal 会被当作预发布版本）
+_DIR_NAME_RE = re.compile(
+    rf"^(?P<id>.+?)-(?P<version>\d+\.\d+\.\d+(?:-(?!(?:{_PLATFORM_SUFFIX})$)[0-9A-Za-z.]+)?)"
+    rf"(?:-(?P<platform>{_PLATFORM_SUFFIX}))?$"
+)
+
+_manifest_cache: Dict[str, Tuple[Tuple[int, int], Optional[list]]] = {}
+_manifest_lock = threading.Lock()
+
+
+def parse_version(version: Optional[str]) -> Optional[tuple]:
+    """
+    按语义化版本解析为可比较的元组，无法解析时返回 None
+
+    预发布版本低于对应的正式版本，预发布标识按 semver 规则比较（数字段小于字母段）
+    """
+    if not version:
+        return None
+    match = _SEMVER_RE.match(version.strip())
+    if not match:
+        return None
+    major, minor, patch, prerelease = match.groups()
+    if prerelease is None:
+        return int(major), int(minor), int(patch), 1, ()
+    identifiers = tuple((0, int(part), "") if part.isdigit() else (1, 0, part)
+                        for part in prerelease.split("."))
+    return int(major), int(minor), int(patch), 0, identifiers
+
+
+def split_dir_name(name: str) -> Tuple[str, Optional[str], Optional[str]]:
+    """把扩展目录名拆分为 (扩展ID, 版本号, 平台后缀)，无法识别版本时返回 (目录名, None, None)"""
+    match = _DIR_NAME_RE.match(name)
+    if not match:
+        return name, None, None
+    return match.group("id"), match.group("version"), match.group("platform")
+
+
+def version_from_dir_name(name: str) -> Optional[str]:
+    """从扩展目录名中提取版本号（不含平台后缀）"""
+    return split_dir_name(name)[1]
+
+
+class ExtensionInstall:
+    """一个已安装的扩展版本"""
+    def __init__(self, extension_id: str, version: Optional[str], location: str, source: str):
+        self.extension_id = extension_id
+        self.version = version
+        self.location = location
+        self.entry_path = os.path.join(location, EXTENSION_ENTRY)
+        self.source = source    # "manifest" 或 "directory"
+
+    @property
+    def version_key(self) -> Optional[tuple]:
+        return parse_version(self.version)
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.extension_id,
+            'version': self.version,
+            'location': self.location,
+            'entry_path': self.entry_path,
+            'source': self.source,
+        }
+
+
+def _load_json_cached(path: str) -> Optional[list]:
+    """读取 JSON 文件，按 (大小, mtime) 缓存；文件不存在或无法解析时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    signature = (st.st_size, st.st_mtime_ns)
+
+    with _manifest_lock:
+        cached = _manifest_cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print_warning(f"扩展清单无法解析 {path}: {e}")
+        data = None
+
+    with _manifest_lock:
+        _manifest_cache[path] = (signature, data)
+    return data
+
+
+def _location_of(entry: dict, extensions_dir: str) -> Optional[str]:
+    """解析清单条目中的安装位置（fsPath / path / relativeLocation）"""
+    location = entry.get("location")
+    if isinstance(location, dict):
+        if location.get("fsPath"):
+            return location["fsPath"]
+        path = location.get("path")
+        if path and location.get("scheme", "file") == "file":
+            # Windows 下 path 形如 /c:/Users/...
+            if os.name == "nt" and re.match(r"^/[A-Za-z]:", path):
+                path = path[1:]
+            return os.path.normpath(path)
+    elif isinstance(location, str) and location:
+        return location
+
+    relative = entry.get("relativeLocation")
+    if relative:
+        return os.path.join(extensions_dir, relative)
+    return None
+
+
+def _obsolete_dirs(extensions_dir: str) -> set:
+    data = _load_json_cached(os.path.join(extensions_dir, OBSOLETE_NAME))
+    if isinstance(data, dict):
+        return {name for name, flag in data.items() if flag}
+    return set()
+
+
+def read_extension_manifest(extensions_dir: str, keyword: str = "augment") -> Optional[List[ExtensionInstall]]:
+    """
+    从 extensions.json 列出 ID 包含 keyword 的扩展
+
+    Returns:
+        安装列表（只包含入口文件存在且未标记为过期的版本）；清单不存在或格式无效时返回 None，
+        调用方应退回目录匹配
+    """
+    data = _load_json_cached(os.path.join(extensions_dir, MANIFEST_NAME))
+    if not isinstance(data, list):
+        return None
+
+    keyword = keyword.lower()
+    obsolete = _obsolete_dirs(extensions_dir)
+    installs = []
+    for entry in data:
+        if not isinstance(entry, dict):
+            continue
+        identifier = entry.get("identifier") or {}
+        extension_id = identifier.get("id", "") if isinstance(identifier, dict) else ""
+        if keyword not in extension_id.lower():
+            continue
+
+        location = _location_of(entry, extensions_dir)
+        if not location or os.path.basename(location) in obsolete:
+            continue
+        install = ExtensionInstall(extension_id, entry.get("version"), location, "manifest")
+        if os.path.isfile(install.entry_path):
+            installs.append(install)
+    return installs
+
+
+def scan_extension_dirs(extensions_dir: str, keyword: str = "augment") -> List[ExtensionInstall]:
+    """目录匹配（清单不可用时的后备方案），版本从目录名解析"""
+    keyword = keyword.lower()
+    obsolete = _obsolete_dirs(extensions_dir)
+    installs = []
+    try:
+        with os.scandir(extensions_dir) as entries:
+            for entry in entries:
+                if keyword not in entry.name.lower() or entry.name in obsolete or not entry.is_dir():
+                    continue
+                extension_id, version, _ = split_dir_name(entry.name)
+                install = ExtensionInstall(extension_id, version, entry.path, "directory")
+                if os.path.isfile(install.entry_path):
+                    installs.append(install)
+    except OSError:
+        pass
+    return installs
+
+
+def list_extension_installs(extensions_dirs: List[str], keyword: str = "augment") -> List[ExtensionInstall]:
+    """依次读取各扩展目录的清单，清单不可用的目录退回目录匹配；按入口文件去重"""
+    installs: Dict[str, ExtensionInstall] = {}
+    for extensions_dir in extensions_dirs:
+        found = read_extension_manifest(extensions_dir, keyword)
+        if found is None:
+            found = scan_extension_dirs(extensions_dir, keyword)
+        for install in found:
+            installs.setdefault(os.path.normcase(os.path.abspath(install.entry_path)), install)
+    return list(installs.values())
+
+
+def pick_latest(installs: List[ExtensionInstall]) -> Optional[ExtensionInstall]:
+    """按语义化版本选出最新的安装；版本无法解析的安装排在最后"""
+    if not installs:
+        return None
+    return max(installs, key=lambda install: (install.version_key is not None, install.version_key or ()))
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+扩展更新监视器
+监视 ExtensionFinder 已知的扩展根目录，IDE 自动更新出现新的 augment.* 扩展目录时，
+等待 out/extension.js 写入稳定后立即通过 PatchManager 补丁，取代定时全量扫描。
+
+Linux 上使用 inotify（通过 ctypes 调用，无额外依赖），其他平台或 inotify 不可用时退回轮询。
+同一文件的多个事件会被合并，文件大小和修改时间在 settle 时间内不再变化才会补丁；
+补丁自身的写入会产生新事件，通过记录补丁后的文件签名忽略。
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .common_utils import IDEType, print_error, print_info, print_success, print_warning
+from .extension_finder import ExtensionFinder, invalidate_discovery_cache
+from .patch_manager import PatchManager, PatchMode
+
+DEFAULT_SETTLE_SECONDS = 2.0
+DEFAULT_POLL_INTERVAL = 5.0
+
+# inotify 模式下重新尝试监视尚不存在的根目录的间隔
+_MISSING_ROOT_RETRY = 30.0
+
+EXTENSION_ENTRY = os.path.join("out", "extension.js")
+
+# inotify 常量（见 <sys/inotify.h>）
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (_IN_CREATE | _IN_MOVED_TO | _IN_CLOSE_WRITE | _IN_MODIFY
+               | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct("iIII")
+
+# 监视深度: 根目录 -> 扩展目录 -> out 目录
+_DEPTH_ROOT, _DEPTH_EXTENSION, _DEPTH_OUT = 0, 1, 2
+
+
+def _is_extension_dir_name(name: str) -> bool:
+    return "augment" in name.lower() and not name.startswith(".")
+
+
+def iter_extension_entries(root: str) -> Iterable[str]:
+    """列出根目录下各 augment 扩展目录中的 out/extension.js 路径（不检查文件是否存在）"""
+    try:
+        with os.scandir(root) as entries:
+            for entry in entries:
+                if _is_extension_dir_name(entry.name) and entry.is_dir(follow_symlinks=False):
+                    yield os.path.join(entry.path, EXTENSION_ENTRY)
+    except OSError:
+        return
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class PollingBackend:
+    """轮询后端：按固定间隔比较各扩展入口文件的签名"""
+
+    name = "poll"
+
+    def __init__(self, roots: List[str], interval: float = DEFAULT_POLL_INTERVAL):
+        self.roots = roots
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._next_poll = time.monotonic() + interval
+
+    def _scan(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        snapshot = {}
+        for root in self.roots:
+            for path in iter_extension_entries(root):
+                snapshot[path] = _file_signature(path)
+        return snapshot
+
+    def wait(self, timeout: float) -> Set[str]:
+        """最多等待 timeout 秒，返回签名发生变化的入口文件"""
+        remaining = self._next_poll - time.monotonic()
+        if remaining > timeout:
+            time.sleep(max(0.0, timeout))
+            return set()
+        time.sleep(max(0.0, remaining))
+        self._next_poll = time.monotonic() + self.interval
+
+        snapshot = self._scan()
+        changed = {path for path, sig in snapshot.items() if self._snapshot.get(path) != sig}
+        self._snapshot = snapshot
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyBackend:
+    """inotify 后端：只监视根目录、augment 扩展目录及其 out 目录"""
+
+    name = "inotify"
+
+    def __init__(self, roots: List[str]):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+
+        self.roots = roots
+        self._watches: Dict[int, Tuple[str, int]] = {}
+        self._watched_paths: Dict[str, int] = {}
+        self._missing_roots: List[str] = []
+        self._next_retry = time.monotonic() + _MISSING_ROOT_RETRY
+        self._buffer = b""
+
+        for root in roots:
+            if not self._watch_root(root):
+                self._missing_roots.append(root)
+
+    def _add_watch(self, path: str, depth: int) -> bool:
+        if path in self._watched_paths:
+            return True
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            return False
+        self._watches[wd] = (path, depth)
+        self._watched_paths[path] = wd
+        return True
+
+    def _watch_extension_dir(self, path: str) -> None:
+        if self._add_watch(path, _DEPTH_EXTENSION):
+            out_dir = os.path.join(path, "out")
+            if os.path.isdir(out_dir):
+                self._add_watch(out_dir, _DEPTH_OUT)
+
+    def _watch_root(self, root: str) -> bool:
+        if not self._add_watch(root, _DEPTH_ROOT):
+            return False
+        for entry_path in iter_extension_entries(root):
+            self._watch_extension_dir(os.path.dirname(os.path.dirname(entry_path)))
+        return True
+
+    def _retry_missing_roots(self) -> Set[str]:
+        """根目录在监视开始后才创建（如首次安装扩展）时补加监视，并把其中的扩展作为候选"""
+        changed = set()
+        still_missing = []
+        for root in self._missing_roots:
+            if os.path.isdir(root) and self._watch_root(root):
+                changed.update(iter_extension_entries(root))
+            else:
+                still_missing.append(root)
+        self._missing_roots = still_missing
+        return changed
+
+    def _rescan_all(self) -> Set[str]:
+        """事件队列溢出时无法知道丢失了哪些事件，把所有扩展都作为候选"""
+        print_warning("inotify 事件队列溢出，重新扫描全部扩展目录")
+        changed = set()
+        for root in self.roots:
+            if self._watch_root(root):
+                changed.update(iter_extension_entries(root))
+        return changed
+
+    def _handle_event(self, wd: int, mask: int, name: str, changed: Set[str]) -> None:
+        if mask & _IN_Q_OVERFLOW:
+            changed.update(self._rescan_all())
+            return
+
+        watch = self._watches.get(wd)
+        if watch is None:
+            return
+        path, depth = watch
+
+        if mask & (_IN_IGNORED | _IN_DELETE_SELF | _IN_MOVE_SELF):
+            # 目录被删除或移走（如旧版本被清理），inotify 会自动移除监视
+            if mask & _IN_IGNORED:
+                self._watches.pop(wd, None)
+                self._watched_paths.pop(path, None)
+                if depth == _DEPTH_ROOT:
+                    self._missing_roots.append(path)
+            return
+
+        is_dir = bool(mask & _IN_ISDIR)
+        if depth == _DEPTH_ROOT and is_dir and _is_extension_dir_name(name):
+            # 新版本扩展目录：可能是解压到临时目录后整体改名进来，此时内部不会再有事件
+            extension_dir = os.path.join(path, name)
+            self._watch_extension_dir(extension_dir)
+            changed.add(os.path.join(extension_dir, EXTENSION_ENTRY))
+        elif depth == _DEPTH_EXTENSION and is_dir and name == "out":
+            self._add_watch(os.path.join(path, name), _DEPTH_OUT)
+            changed.add(os.path.join(path, EXTENSION_ENTRY))
+        elif depth == _DEPTH_OUT and name == "extension.js":
+            changed.add(os.path.join(path, name))
+
+    def wait(self, timeout: float) -> Set[str]:
+        """最多等待 timeout 秒，返回可能发生变化的入口文件"""
+        changed: Set[str] = set()
+
+        if self._missing_roots and time.monotonic() >= self._next_retry:
+            self._next_retry = time.monotonic() + _MISSING_ROOT_RETRY
+            changed.update(self._retry_missing_roots())
+            if changed:
+                return changed
+
+        readable, _, _ = select.select([self._fd], [], [], max(0.0, timeout))
+        if not readable:
+            return changed
+
+        try:
+            self._buffer += os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+
+        offset = 0
+        data = self._buffer
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            end = offset + _EVENT_HEADER.size + length
+            if end > len(data):
+                break
+            name = os.fsdecode(data[offset + _EVENT_HEADER.size:end].rstrip(b"\0"))
+            self._handle_event(wd, mask, name, changed)
+            offset = end
+        self._buffer = data[offset:]
+        return changed
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def create_backend(roots: List[str], backend: str = "auto", poll_interval: float = DEFAULT_POLL_INTERVAL):
+    """
+    创建监视后端
+
+    Args:
+        backend: auto / inotify / poll；auto 在 Linux 上优先使用 inotify
+    """
+    if backend in ("auto", "inotify"):
+        try:
+            if not sys.platform.startswith("linux"):
+                raise OSError("当前平台不支持 inotify")
+            return InotifyBackend(roots)
+        except (OSError, AttributeError) as e:
+            if backend == "inotify":
+                raise
+            print_warning(f"inotify 不可用，改用轮询: {e}")
+    return PollingBackend(roots, poll_interval)
+
+
+def collect_watch_roots(ide_types: Iterable[IDEType],
+                        portable_roots: Optional[Dict[IDEType, str]] = None,
+                        extension_finder: Optional[ExtensionFinder] = None,
+                        existing_only: bool = False) -> List[str]:
+    """汇总多个IDE的扩展根目录（去重，保持顺序）"""
+    finder = extension_finder or ExtensionFinder()
+    roots = []
+    for ide_type in ide_types:
+        portable_root = (portable_roots or {}).get(ide_type)
+        roots.extend(finder.get_extension_roots(ide_type, portable_root, existing_only=existing_only))
+    return list(dict.fromkeys(roots))
+
+
+class ExtensionWatcher:
+    """扩展更新监视器"""
+
+    def __init__(self, roots: List[str], patch_mode: PatchMode = PatchMode.RANDOM,
+                 patch_manager: Optional[PatchManager] = None,
+                 backend: str = "auto",
+                 settle_seconds: float = DEFAULT_SETTLE_SECONDS,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.roots = roots
+        self.patch_mode = patch_mode
+        self.patch_manager = patch_manager or PatchManager()
+        self.backend_name = backend
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+
+        # 等待稳定的文件: path -> (最近签名, 签名开始保持不变的时间)
+        self._pending: Dict[str, Tuple[Optional[Tuple[int, int]], float]] = {}
+        # 已处理文件的签名，用于忽略补丁自身写入产生的事件
+        self._handled: Dict[str, Tuple[int, int]] = {}
+        self.stats = {'events': 0, 'patched': 0, 'already_patched': 0, 'failed': 0}
+
+    def _enqueue(self, paths: Iterable[str]) -> None:
+        now = time.monotonic()
+        for path in paths:
+            self.stats['events'] += 1
+            # 同一文件的多次事件合并为一个待处理项，并重新开始计时
+            self._pending[path] = (_file_signature(path), now)
+
+    def _collect_settled(self) -> List[str]:
+        """返回签名在 settle 时间内未变化的文件"""
+        now = time.monotonic()
+        settled = []
+        for path, (last_sig, since) in list(self._pending.items()):
+            sig = _file_signature(path)
+            if sig != last_sig:
+                self._pending[path] = (sig, now)
+                continue
+            if now - since < self.settle_seconds:
+                continue
+            del self._pending[path]
+            if sig is None:
+                continue  # 文件尚未出现或已被删除，等待下一次事件
+            if self._handled.get(path) == sig:
+                continue
+            settled.append(path)
+        return settled
+
+    def _patch(self, file_path: str) -> None:
+        from .batch_patcher import _get_file_lock
+
+        with _get_file_lock(file_path):
+            try:
+                result = self.patch_manager.apply_patch(file_path, self.patch_mode)
+            except Exception as e:
+                print_error(f"补丁异常 {file_path}: {e}")
+                self.stats['failed'] += 1
+                return
+
+        if result.already_patched:
+            self.stats['already_patched'] += 1
+        elif result.success:
+            self.stats['patched'] += 1
+            print_success(f"已补丁新扩展: {file_path}")
+        else:
+            self.stats['failed'] += 1
+            print_warning(f"补丁失败 {file_path}: {result.message}")
+
+        sig = _file_signature(file_path)
+        if sig is not None:
+            self._handled[file_path] = sig
+
+    def _next_timeout(self) -> float:
+        if self._pending:
+            return max(0.05, min(self.settle_seconds / 2, 0.5))
+        return self.poll_interval
+
+    def run(self, duration: Optional[float] = None, initial_scan: bool = True) -> dict:
+        """
+        运行监视循环，直到 stop_event 被设置或超过 duration 秒
+
+        Args:
+            initial_scan: 启动时检查一遍已存在的扩展（已补丁的文件会被快速跳过）
+
+        Returns:
+            dict: 统计信息
+        """
+        backend = create_backend(self.roots, self.backend_name, self.poll_interval)
+        deadline = time.monotonic() + duration if duration else None
+        print_info(f"开始监视 {len(self.roots)} 个扩展根目录 (后端: {backend.name})")
+        for root in self.roots:
+            print_info(f"  - {root}{'' if os.path.isdir(root) else ' (尚不存在)'}")
+
+        try:
+            if initial_scan:
+                for root in self.roots:
+                    for path in iter_extension_entries(root):
+                        if os.path.isfile(path):
+                            self._patch(path)
+
+            while not self.stop_event.is_set():
+                timeout = self._next_timeout()
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    timeout = min(timeout, remaining)
+
+                self._enqueue(backend.wait(timeout))
+                settled = self._collect_settled()
+                if settled:
+                    # 新版本出现后让同一进程中的其他发现调用立即看到变化
+                    invalidate_discovery_cache()
+                for path in settled:
+                    self._patch(path)
+        finally:
+            backend.close()
+
+        return dict(self.stats)
+
+    def start(self, initial_scan: bool = True) -> threading.Thread:
+        """在后台线程中运行，调用 stop() 结束"""
+        thread = threading.Thread(target=self.run, kwargs={'initial_scan': initial_scan},
+                                  name="extension-watcher", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self.stop_event.set()
@@ -4,13 +4,110 @@
 """
 import os
 import shutil
+import sqlite3
 import subprocess
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Optional, Dict
+from typing import Callable, Iterator, List, Optional, Dict, Sequence, Union
 from .common_utils import IDEType, get_ide_paths, print_info, print_success, print_warning, print_error
 from .process_manager import ProcessManager
 
+WORKSPACE_DB_NAME = "state.vscdb"
+
+# 数据库很少时不值得启动进程池
+MIN_DBS_FOR_PROCESS_POOL = 4
+
+# 单个工作区数据库被占用时最多等待的秒数
+WORKSPACE_LOCK_WAIT = 10.0
+
+
+def iter_workspace_databases(workspace_storage_path: Union[str, Path]) -> Iterator[str]:
+    """用 os.scandir 列出 workspaceStorage/*/state.vscdb"""
+    try:
+        with os.scandir(workspace_storage_path) as entries:
+            for entry in entries:
+                try:
+                    if not entry.is_dir():
+                        continue
+                except OSError:
+                    continue
+                db_path = os.path.join(entry.path, WORKSPACE_DB_NAME)
+                if os.path.isfile(db_path):
+                    yield db_path
+    except OSError as e:
+        print_error(f"读取 workspaceStorage 目录失败: {e}")
+
+
+def clean_workspace_database(db_path: str, keywords: Sequence[str], patterns: Sequence[str] = (),
+                             backup: bool = True) -> dict:
+    """
+    清理单个工作区数据库中匹配的行（进程池工作函数，不输出日志）
+
+    先用 LIMIT 1 查询判断是否有匹配（无匹配的数据库只扫描一次且不写入），有匹配时先用在线备份
+    API 生成 state.vscdb.backup 快照，再在一个连接、一个 IMMEDIATE 事务中删除。
+    备份只放在数据库旁边，不写入共享备份仓库，避免多进程同时更新仓库清单。
+
+    Returns:
+        dict: workspace / db / matched / deleted / backup / lock_wait_seconds / error
+    """
+    from .database_manager import KeyMatcher, delete_matching_keys, open_cleanup_connection
+    from .db_access import LockRetry, backup_database
+
+    result = {
+        'workspace': os.path.basename(os.path.dirname(db_path)),
+        'db': db_path,
+        'matched': 0,
+        'deleted': 0,
+        'backup': None,
+        'lock_wait_seconds': 0.0,
+        'error': None,
+    }
+    conn = None
+    try:
+        matcher = KeyMatcher(list(keywords), list(patterns))
+        conn = open_cleanup_connection(db_path)
+        matcher.register(conn)
+        predicate, params = matcher.predicate()
+        try:
+            has_match = conn.execute(f"SELECT 1 FROM ItemTable WHERE {predicate} LIMIT 1", params).fetchone()
+        except sqlite3.OperationalError as e:
+            if "no such table" in str(e):
+                return result  # 空数据库或非 VS Code 状态库
+            raise
+        if not has_match:
+            return result
+
+        if backup:
+            backup_path = db_path + ".backup"
+            snapshot_path = f"{backup_path}.tmp-{os.getpid()}"
+            try:
+                dst = sqlite3.connect(snapshot_path)
+                try:
+                    backup_database(conn, dst, WORKSPACE_LOCK_WAIT)
+                finally:
+                    dst.close()
+                os.replace(snapshot_path, backup_path)
+            except BaseException:
+                # 不留下不完整的快照
+                try:
+                    os.unlink(snapshot_path)
+                except OSError:
+                    pass
+                raise
+            result['backup'] = backup_path
+
+        retry = LockRetry(WORKSPACE_LOCK_WAIT, verbose=False)
+        result['matched'], _, result['deleted'] = retry.run(
+            lambda: delete_matching_keys(conn, matcher, preview_limit=0))
+        result['lock_wait_seconds'] = retry.metrics()['lock_wait_seconds']
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        if conn is not None:
+            conn.close()
+    return result
+
 class FileCleaner:
     """文件清理器 - 安全删除和强制删除文件"""
     
@@ -74,6 +171,80 @@ class FileCleaner:
         print_success(f"globalStorage 清理完成，删除了 {deleted_count} 个文件")
         return deleted_count
     
+    def clean_workspace_databases(self, workspace_storage_path: Union[str, Path],
+                                  keywords: Union[str, Sequence[str]] = "augment",
+                                  patterns: Sequence[str] = (),
+                                  max_workers: Optional[int] = None,
+                                  backup: bool = True,
+                                  on_result: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        按行清理所有工作区数据库（不删除文件），使用进程池并行处理
+
+        每个结果完成时立即回调 on_result 并输出有删除或出错的工作区。
+
+        Args:
+            workspace_storage_path: workspaceStorage 目录
+            keywords: 关键字（可为列表）
+            patterns: 正则表达式列表
+            max_workers: 进程数（默认 CPU 核数）
+            backup: 修改前是否为每个有匹配的数据库生成 .backup 快照
+            on_result: 每个工作区结果的回调
+
+        Returns:
+            dict: databases / cleaned / entries_removed / errors / results
+        """
+        if isinstance(keywords, str):
+            keywords = [keywords]
+        keywords, patterns = list(keywords), list(patterns)
+
+        db_paths = list(iter_workspace_databases(workspace_storage_path))
+        summary = {'databases': len(db_paths), 'cleaned': 0, 'entries_removed': 0, 'errors': [], 'results': []}
+        if not db_paths:
+            print_info(f"未找到工作区数据库: {workspace_storage_path}")
+            return summary
+
+        def collect(result: dict) -> None:
+            summary['results'].append(result)
+            if result['error']:
+                summary['errors'].append(f"{result['workspace']}: {result['error']}")
+                print_warning(f"工作区 {result['workspace']} 清理失败: {result['error']}")
+            elif result['deleted']:
+                summary['cleaned'] += 1
+                summary['entries_removed'] += result['deleted']
+                print_info(f"工作区 {result['workspace']}: 删除 {result['deleted']} 个条目")
+            if on_result:
+                on_result(result)
+
+        workers = max_workers or os.cpu_count() or 1
+        print_info(f"清理 {len(db_paths)} 个工作区数据库 (进程数: {min(workers, len(db_paths))})")
+
+        if len(db_paths) < MIN_DBS_FOR_PROCESS_POOL or workers == 1:
+            for db_path in db_paths:
+                collect(clean_workspace_database(db_path, keywords, patterns, backup))
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(db_paths))) as executor:
+                futures = [executor.submit(clean_workspace_database, db_path, keywords, patterns, backup)
+                           for db_path in db_paths]
+                for future in as_completed(futures):
+                    collect(future.result())
+
+        print_success(f"工作区数据库清理完成: {summary['cleaned']}/{summary['databases']} 个数据库，"
+                      f"共删除 {summary['entries_removed']} 个条目，{len(summary['errors'])} 个错误")
+        return summary
+
+    def clean_ide_workspace_databases(self, ide_type: IDEType, keywords: Union[str, Sequence[str]] = "augment",
+                                      patterns: Sequence[str] = (), max_workers: Optional[int] = None,
+                                      backup: bool = True) -> dict:
+        """按行清理指定IDE的所有工作区数据库"""
+        paths = get_ide_paths(ide_type)
+        if not paths or "state_db" not in paths:
+            print_error(f"无法获取 {ide_type.value} 路径")
+            return {'databases': 0, 'cleaned': 0, 'entries_removed': 0,
+                    'errors': [f"无法获取 {ide_type.value} 路径"], 'results': []}
+
+        workspace_storage_path = paths["state_db"].parent.parent / "workspaceStorage"
+        return self.clean_workspace_databases(workspace_storage_path, keywords, patterns, max_workers, backup)
+
     def _clean_workspace_storage(self, workspace_storage_path: Path, force_mode: bool) -> int:
         """清理workspaceStorage目录"""
         print_info("清理 workspaceStorage...")
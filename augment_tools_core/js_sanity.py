@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+补丁后 JS 语法快速检查（无需 JS 运行时）
+线性扫描注入代码及注入点附近的代码，检查括号/花括号/模板字符串是否配对、
+字符串和注释是否闭合，在 os.replace 之前拒绝会破坏扩展包的写入。
+
+只检查发生变化的区域：注入代码本身，以及从外层类声明（对象字面量方法则为外层 "{"）
+到注入点的代码（注入点必须恰好位于某个方法体的 "{" 之后，而不是字符串、模板字符串或
+注释中）。原文件其余部分不变，因此即使是很大的文件也只需扫描一个类。
+"""
+
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+_OPENERS = {'(': ')', '[': ']', '{': '}'}
+_CLOSERS = {')': '(', ']': '[', '}': '{'}
+
+# 出现在这些字符之后的 "/" 视为正则字面量的开始，否则视为除号
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = {
+    'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void',
+    'throw', 'case', 'do', 'else', 'yield', 'await',
+}
+
+# 模板字符串中 "${" 在括号栈中的标记
+_TEMPLATE_EXPR = '${'
+
+# 从注入点向前查找外层类声明的最大距离（字节）和候选数
+ENCLOSING_SEARCH_WINDOW = 1024 * 1024
+MAX_ENCLOSING_CANDIDATES = 16
+# 没有类声明时，向前查找外层 "{" 的最大距离（字节）
+ENCLOSING_FALLBACK_WINDOW = 64 * 1024
+
+_CLASS_DECL = r'\bclass(?:\s+[\w$]+)?(?:\s+extends\s+[^{};]+?)?\s*\{'
+_CLASS_DECL_RE = re.compile(_CLASS_DECL)
+_CLASS_DECL_RE_BYTES = re.compile(_CLASS_DECL.encode('ascii'))
+_BRACE_RE = re.compile(r'[{}]')
+_BRACE_RE_BYTES = re.compile(rb'[{}]')
+
+
+class JSSanityError(ValueError):
+    """补丁后的代码未通过语法快速检查"""
+
+
+class ScanResult:
+    """扫描结果：未闭合的括号栈，以及首个错误（无错误时为 None）"""
+    def __init__(self, stack: List[str], error: Optional[str] = None):
+        self.stack = stack
+        self.error = error
+
+
+def _line_of(code: str, index: int) -> int:
+    return code.count('\n', 0, index) + 1
+
+
+def scan(code: str, stack: Optional[List[str]] = None) -> ScanResult:
+    """
+    线性扫描 JS 代码
+
+    Args:
+        code: 代码片段（须从代码上下文开始，而不是字符串或注释中间）
+        stack: 扫描开始时已打开的括号（用于接续前一段代码）
+
+    Returns:
+        ScanResult: 片段结束时仍未闭合的括号栈；字符串、模板、注释或正则
+        在片段结束时未闭合，或括号不匹配时返回错误
+    """
+    stack = list(stack or [])
+    i = 0
+    n = len(code)
+    # 上一个有意义的字符/标识符，用于区分正则字面量与除号
+    last_significant = ''
+    last_word = ''
+
+    while i < n:
+        ch = code[i]
+
+        if ch in ' \t\r\n':
+            i += 1
+            continue
+
+        # 注释
+        if ch == '/' and i + 1 < n and code[i + 1] == '/':
+            end = code.find('\n', i + 2)
+            i = n if end < 0 else end + 1
+            continue
+        if ch == '/' and i + 1 < n and code[i + 1] == '*':
+            end = code.find('*/', i + 2)
+            if end < 0:
+                return ScanResult(stack, f"第 {_line_of(code, i)} 行: 块注释未闭合")
+            i = end + 2
+            continue
+
+        # 字符串
+        if ch in '"\'':
+            j = i + 1
+            while j < n:
+                c = code[j]
+                if c == '\\':
+                    j += 2
+                    continue
+                if c == ch:
+                    break
+                if c == '\n':
+                    return ScanResult(stack, f"第 {_line_of(code, i)} 行: 字符串未闭合")
+                j += 1
+            if j >= n:
+                return ScanResult(stack, f"第 {_line_of(code, i)} 行: 字符串未闭合")
+            i = j + 1
+            last_significant, last_word = 'a', ''
+            continue
+
+        # 模板字符串（或 "}" 结束 ${...} 后回到模板字符串）
+        if ch == '`' or (ch == '}' and stack and stack[-1] == _TEMPLATE_EXPR):
+            if ch == '}':
+                stack.pop()
+            j = i + 1
+            while j < n:
+                c = code[j]
+                if c == '\\':
+                    j += 2
+                    continue
+                if c == '`':
+                    break
+                if c == '$' and j + 1 < n and code[j + 1] == '{':
+                    break
+                j += 1
+            if j >= n:
+                return ScanResult(stack, f"第 {_line_of(code, i)} 行: 模板字符串未闭合")
+            if code[j] == '`':
+                i = j + 1
+                last_significant, last_word = 'a', ''
+            else:
+                stack.append(_TEMPLATE_EXPR)
+                i = j + 2
+                last_significant, last_word = '{', ''
+            continue
+
+        # 正则字面量
+        if ch == '/' and (not last_significant or last_significant in _REGEX_PRECEDERS
+                          or last_word in _REGEX_KEYWORDS):
+            j = i + 1
+            in_class = False
+            while j < n:
+                c = code[j]
+                if c == '\\':
+                    j += 2
+                    continue
+                if c == '\n':
+                    break
+                if in_class:
+                    if c == ']':
+                        in_class = False
+                elif c == '[':
+                    in_class = True
+                elif c == '/':
+                    break
+                j += 1
+            if j >= n or code[j] != '/':
+                return ScanResult(stack, f"第 {_line_of(code, i)} 行: 正则表达式未闭合")
+            j += 1
+            while j < n and (code[j].isalnum() or code[j] == '_'):
+                j += 1  # 标志位
+            i = j
+            last_significant, last_word = 'a', ''
+            continue
+
+        # 括号
+        if ch in _OPENERS:
+            stack.append(ch)
+            i += 1
+            last_significant, last_word = ch, ''
+            continue
+        if ch in _CLOSERS:
+            if not stack or stack[-1] != _CLOSERS[ch]:
+                expected = _OPENERS.get(stack[-1], '}') if stack else '（无）'
+                return ScanResult(stack, f"第 {_line_of(code, i)} 行: 括号不匹配，遇到 '{ch}'，期望 '{expected}'")
+            stack.pop()
+            i += 1
+            last_significant, last_word = ')', ''
+            continue
+
+        # 标识符 / 数字
+        if ch.isalnum() or ch in '_$':
+            j = i + 1
+            while j < n and (code[j].isalnum() or code[j] in '_$'):
+                j += 1
+            last_word = code[i:j]
+            last_significant = 'a'
+            i = j
+            continue
+
+        # 后置 ++/-- 之后的 "/" 是除号（如 a++/2），按操作数处理；前置时仍视为运算符
+        if ch in '+-' and i + 1 < n and code[i + 1] == ch:
+            if last_significant not in ('a', ')'):
+                last_significant = ch
+            last_word = ''
+            i += 2
+            continue
+
+        # 其他运算符
+        last_significant, last_word = ch, ''
+        i += 1
+
+    return ScanResult(stack)
+
+
+@lru_cache(maxsize=32)
+def check_fragment(code: str) -> Optional[str]:
+    """
+    检查独立的代码片段（如注入代码）是否自身配对完整
+
+    Returns:
+        错误描述，通过时返回 None
+    """
+    result = scan(code)
+    if result.error:
+        return result.error
+    if result.stack:
+        return f"片段结束时仍有未闭合的括号: {''.join(result.stack)}"
+    return None
+
+
+def _enclosing_class_starts(code, header_start: int) -> List[int]:
+    """函数头之前的类声明起始偏移，由近到远（类声明文本可能出现在字符串中，需逐个验证）"""
+    pattern = _CLASS_DECL_RE if isinstance(code, str) else _CLASS_DECL_RE_BYTES
+    starts = [match.start() for match in
+              pattern.finditer(code, max(0, header_start - ENCLOSING_SEARCH_WINDOW), header_start)]
+    return starts[::-1][:MAX_ENCLOSING_CANDIDATES]
+
+
+def _enclosing_brace_starts(code, header_start: int) -> List[int]:
+    """
+    函数头之前未配对的 "{" 偏移，由近到远（如对象字面量的起始位置）
+
+    只在有限窗口内按括号计数向前查找，不识别字符串；候选由 check_splice 正向扫描验证。
+    """
+    window_start = max(0, header_start - ENCLOSING_FALLBACK_WINDOW)
+    pattern = _BRACE_RE if isinstance(code, str) else _BRACE_RE_BYTES
+    braces = [(match.start(), match.group()) for match in pattern.finditer(code, window_start, header_start)]
+    starts = []
+    depth = 0
+    for position, brace in reversed(braces):
+        if brace in ('}', b'}'):
+            depth += 1
+        elif depth:
+            depth -= 1
+        else:
+            starts.append(position)
+            if len(starts) >= MAX_ENCLOSING_CANDIDATES:
+                break
+    return starts
+
+
+def _check_context(code, starts: List[int], offset: int, where: str) -> Tuple[bool, Optional[str]]:
+    """从各候选起点扫描到注入点，括号栈恰好为外层 + 方法体时通过；未通过时返回最近候选的问题"""
+    error = None
+    for start in starts:
+        context = code[start:offset]
+        if not isinstance(context, str):
+            try:
+                context = context.decode('utf-8')
+            except UnicodeDecodeError as e:
+                error = error or f"注入点附近不是有效的 UTF-8: {e}"
+                continue
+        result = scan(context)
+        if result.error is None and result.stack == ['{', '{']:
+            return True, None
+        error = error or (f"注入点前的代码异常: {result.error}" if result.error else
+                          f"注入点不在{where}方法体起始位置 (未闭合: {''.join(result.stack) or '无'})")
+    return False, error
+
+
+def check_splice(code, header_start: int, offset: int, injected: str) -> Optional[str]:
+    """
+    检查注入点：从外层类声明扫描到注入点，注入点必须恰好位于类体中一个方法体的 "{" 之后
+    （括号栈为类体 + 方法体），不能在字符串、模板字符串、注释或更深的嵌套中；
+    并检查注入代码自身配对完整
+
+    callApi 为对象字面量方法（注入点之前没有类声明）时，退回为从最近的未配对 "{" 开始
+    检查有限窗口内的配对。
+
+    Args:
+        code: 完整的原文件内容（str、bytes 或 mmap）
+        header_start: callApi 函数头的起始偏移
+        offset: 注入点偏移（函数头 "{" 之后）
+        injected: 注入代码
+
+    Returns:
+        错误描述，通过时返回 None
+    """
+    class_starts = _enclosing_class_starts(code, header_start)
+    if class_starts:
+        accepted, error = _check_context(code, class_starts, offset, "类")
+    else:
+        accepted, error = _check_context(code, _enclosing_brace_starts(code, header_start), offset, "对象")
+    if not accepted:
+        return error or "注入点之前未找到外层类或对象"
+
+    fragment_error = check_fragment(injected)
+    if fragment_error:
+        return f"注入代码异常: {fragment_error}"
+    return None
+
+
+def verify_splice(code, header_start: int, offset: int, injected: str) -> None:
+    """check_splice 的抛出版本，失败时抛出 JSSanityError"""
+    error = check_splice(code, header_start, offset, injected)
+    if error:
+        raise JSSanityError(error)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多用户发现
+在共享构建机 / VDI 服务器上枚举用户主目录根（默认 /home、/Users 或 C:\\Users，
+可用环境变量 AUGMENT_USERS_BASE 覆盖）下的所有用户，并发收集每个用户的
+扩展文件、state.vscdb 和 storage.json 路径，供批量操作使用。
+
+各用户的扫描互不依赖，且主要耗时在目录/文件元数据的网络往返上（NFS 挂载的主目录），
+因此使用线程池并发执行。
+"""
+
+import os
+import platform
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .common_utils import IDEType, get_ide_paths, print_info, print_warning
+from .extension_finder import ExtensionFinder
+
+USERS_BASE_ENV = "AUGMENT_USERS_BASE"
+
+# 用户主目录根下不属于真实用户的目录
+_SKIP_HOME_NAMES = frozenset({
+    "lost+found", "Shared", "Public", "Default", "Default User", "All Users", "defaultuser0",
+})
+
+INVENTORY_IDES = (IDEType.VSCODE, IDEType.CURSOR, IDEType.WINDSURF)
+
+
+def get_users_base() -> Path:
+    """用户主目录的上级目录"""
+    override = os.environ.get(USERS_BASE_ENV)
+    if override:
+        return Path(override).expanduser()
+    system = platform.system()
+    if system == "Windows":
+        return Path(os.environ.get("SystemDrive", "C:") + "\\") / "Users"
+    if system == "Darwin":
+        return Path("/Users")
+    return Path("/home")
+
+
+def list_user_homes(base: Optional[Path] = None) -> List[Path]:
+    """列出用户主目录（跳过隐藏目录和系统保留目录）"""
+    base = Path(base) if base is not None else get_users_base()
+    homes = []
+    try:
+        with os.scandir(base) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or entry.name in _SKIP_HOME_NAMES:
+                    continue
+                try:
+                    if entry.is_dir():
+                        homes.append(Path(entry.path))
+                except OSError:
+                    continue
+    except OSError as e:
+        print_warning(f"无法列出用户目录 {base}: {e}")
+    return sorted(homes)
+
+
+def _existing(path: Optional[Path]) -> Optional[str]:
+    try:
+        return str(path) if path is not None and path.exists() else None
+    except OSError:
+        return None
+
+
+def collect_user_inventory(home: Path, ide_types=INVENTORY_IDES) -> dict:
+    """
+    收集单个用户的清单
+
+    Returns:
+        dict: user / home / accessible / ides（每个IDE的 extension_files、state_db、storage_json）/ error
+    """
+    inventory = {
+        'user': home.name,
+        'home': str(home),
+        'accessible': os.access(home, os.R_OK | os.X_OK),
+        'ides': {},
+        'error': None,
+    }
+    if not inventory['accessible']:
+        inventory['error'] = "权限不足，无法读取主目录"
+        return inventory
+
+    try:
+        finder = ExtensionFinder(home=str(home), verbose=False)
+        for ide_type in ide_types:
+            paths = get_ide_paths(ide_type, home=home, verbose=False) or {}
+            ide_entry = {
+                'extension_files': finder.find_extension_files(ide_type),
+                'state_db': _existing(paths.get('state_db')),
+                'storage_json': _existing(paths.get('storage_json')),
+            }
+            if any(ide_entry.values()):
+                inventory['ides'][ide_type.value] = ide_entry
+    except Exception as e:
+        inventory['error'] = str(e)
+    return inventory
+
+
+def scan_user_homes(base: Optional[Path] = None, ide_types=INVENTORY_IDES,
+                    max_workers: Optional[int] = None) -> List[dict]:
+    """
+    并发扫描所有用户，结果按用户名排序
+
+    Args:
+        base: 用户主目录根（默认 get_users_base()）
+        max_workers: 线程数（默认按 I/O 负载确定）
+    """
+    from .batch_patcher import default_worker_count
+
+    homes = list_user_homes(base)
+    if not homes:
+        return []
+
+    workers = max_workers or default_worker_count(len(homes))
+    print_info(f"扫描 {len(homes)} 个用户主目录 (线程数: {workers})")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="user-scan") as executor:
+        return list(executor.map(lambda home: collect_user_inventory(home, ide_types), homes))
+
+
+def summarize_inventory(inventories: List[dict]) -> Dict[str, int]:
+    """统计有扩展 / 数据库的用户数"""
+    summary = {'users': len(inventories), 'with_extensions': 0, 'with_state_db': 0, 'inaccessible': 0}
+    for inventory in inventories:
+        if not inventory['accessible']:
+            summary['inaccessible'] += 1
+        ides = inventory['ides'].values()
+        if any(ide['extension_files'] for ide in ides):
+            summary['with_extensions'] += 1
+        if any(ide['state_db'] for ide in ides):
+            summary['with_state_db'] += 1
+    return summary
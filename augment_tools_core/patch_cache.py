@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+补丁产物缓存
+以 (原文件 sha256, 补丁模式, 补丁版本) 为键缓存补丁后的文件。相同构建的扩展文件
+再次补丁时只需一次哈希计算和一次复制（优先 reflink），无需重新搜索注入点。
+
+缓存目录默认位于工具数据目录下，也可以通过环境变量 AUGMENT_PATCH_CACHE_DIR
+指向多台机器共享的目录；所有写入均为临时文件 + os.replace，可安全并发。
+
+缓存产物会被原样写入扩展文件，因此命中前不信任元数据：期望摘要由原文件内容和补丁模板
+重新计算，注入点必须紧跟 callApi 函数头，复制后的产物必须与该摘要一致。共享目录中
+被篡改的条目因此无法被使用。
+"""
+
+import hashlib
+import json
+import os
+import socket
+import threading
+from pathlib import Path
+from typing import Optional, Union
+
+from .common_utils import print_info, print_warning, copy_file_with_hash, get_tool_data_dir
+
+PATCH_CACHE_ENV = "AUGMENT_PATCH_CACHE_DIR"
+
+
+def get_patch_cache_dir() -> Path:
+    """返回补丁缓存目录（环境变量优先）"""
+    override = os.environ.get(PATCH_CACHE_ENV)
+    if override:
+        return Path(override).expanduser()
+    return get_tool_data_dir() / "patch_cache"
+
+
+class PatchArtifactCache:
+    """补丁产物缓存"""
+
+    def __init__(self, root: Optional[Union[str, Path]] = None):
+        self.root = Path(root) if root else get_patch_cache_dir()
+
+    def _entry_base(self, original_digest: str, mode: str, version: str) -> Path:
+        return self.root / original_digest[:2] / f"{original_digest}-{mode}-v{version}"
+
+    def _temp_suffix(self) -> str:
+        # 共享目录可能被多台机器同时写入，临时文件名需包含主机名
+        return f".tmp-{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}"
+
+    def lookup(self, original_digest: str, mode: str, version: str, template_sha256: str,
+               raw: bytes, insert: bytes) -> Optional[dict]:
+        """
+        查找缓存条目
+
+        Args:
+            original_digest: 原文件 sha256（即 raw 的摘要）
+            raw: 原文件内容
+            insert: 补丁模板的 UTF-8 编码
+
+        Returns:
+            条目元数据（含 blob 路径、注入点和重新计算的期望摘要），未命中时返回 None
+        """
+        from .patch_manager import find_callapi_header_before
+
+        base = self._entry_base(original_digest, mode, version)
+        try:
+            with open(Path(f"{base}.json"), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print_warning(f"补丁缓存条目无法读取: {e}")
+            return None
+
+        if meta.get("original_sha256") != original_digest:
+            return None
+        # 模板内容变更但未更新版本号时视为未命中
+        if template_sha256 and meta.get("template_sha256") != template_sha256:
+            return None
+
+        blob = Path(f"{base}.js")
+        if not blob.exists():
+            return None
+
+        offset = meta.get("offset")
+        header = (find_callapi_header_before(raw, offset)
+                  if isinstance(offset, int) and 0 < offset <= len(raw) else None)
+        if header is None:
+            print_warning(f"补丁缓存条目的注入点不在 callApi 函数头之后，已忽略: {blob}")
+            return None
+
+        # 期望摘要只由原文件和模板决定，不采用元数据中的 patched_sha256
+        view = memoryview(raw)
+        hasher = hashlib.sha256(view[:offset])
+        hasher.update(insert)
+        hasher.update(view[offset:])
+        expected = hasher.hexdigest()
+        if meta.get("patched_sha256") != expected:
+            print_warning(f"补丁缓存条目与原文件和模板不一致，已忽略: {blob}")
+            return None
+
+        meta["blob"] = str(blob)
+        meta["header_start"] = header.start()
+        meta["expected_sha256"] = expected
+        return meta
+
+    def materialize(self, meta: dict, dest: Union[str, Path]) -> bool:
+        """
+        把缓存的补丁产物复制到目标路径，并与 lookup 重新计算的期望摘要做全量哈希校验
+
+        校验失败时删除目标文件和损坏的缓存条目。
+        """
+        digest = copy_file_with_hash(meta["blob"], dest)
+        if digest and digest == meta.get("expected_sha256"):
+            return True
+
+        print_warning(f"补丁缓存条目校验失败，已丢弃: {meta['blob']}")
+        if digest:
+            try:
+                os.unlink(dest)
+            except OSError:
+                pass
+        self._discard(Path(meta["blob"]))
+        return False
+
+    def store(self, original_digest: str, mode: str, version: str, template_sha256: str,
+              patched_path: Union[str, Path], offset: int) -> Optional[dict]:
+        """
+        把补丁后的文件存入缓存
+
+        Args:
+            patched_path: 已写好的补丁后文件（通常为暂存文件）
+            offset: 注入点偏移（记录在元数据中，便于排查）
+        """
+        base = self._entry_base(original_digest, mode, version)
+        blob = Path(f"{base}.js")
+        meta_path = Path(f"{base}.json")
+        suffix = self._temp_suffix()
+        temp_blob = Path(f"{blob}{suffix}")
+        temp_meta = Path(f"{meta_path}{suffix}")
+
+        try:
+            base.parent.mkdir(parents=True, exist_ok=True)
+            patched_digest = copy_file_with_hash(patched_path, temp_blob)
+            if not patched_digest:
+                return None
+
+            meta = {
+                "original_sha256": original_digest,
+                "patched_sha256": patched_digest,
+                "template_sha256": template_sha256,
+                "mode": mode,
+                "version": version,
+                "offset": offset,
+                "size": temp_blob.stat().st_size,
+            }
+            with open(temp_meta, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, indent=2)
+
+            # 先替换产物再替换元数据：读取方只有在元数据存在时才会使用产物
+            os.replace(temp_blob, blob)
+            os.replace(temp_meta, meta_path)
+            print_info(f"补丁产物已缓存 (sha256: {original_digest[:12]} → {patched_digest[:12]})")
+            meta["blob"] = str(blob)
+            return meta
+        except OSError as e:
+            print_warning(f"写入补丁缓存失败: {e}")
+            for path in (temp_blob, temp_meta):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            return None
+
+    def _discard(self, blob: Path) -> None:
+        for path in (Path(str(blob)[:-len(".js")] + ".json"), blob):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+# 默认缓存实例
+_default_cache = None
+
+
+def get_patch_cache() -> PatchArtifactCache:
+    """获取默认的补丁缓存实例"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PatchArtifactCache()
+    return _default_cache
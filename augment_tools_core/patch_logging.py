@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+注入补丁的聚合日志
+补丁代码不再逐次 console.log，而是在内存中按类别计数，定时或达到阈值时输出一行汇总：
+
+    [AUG-PATCH-SUMMARY] {"session": "...", "seq": 3, "counts": {"TELEMETRY BLOCKED": 42}, ...}
+
+本模块生成注入用的 JS 聚合器代码，并提供解析汇总行的函数供监控工具使用
+"""
+
+import json
+from typing import Dict, Iterable, Optional
+
+SUMMARY_PREFIX = "[AUG-PATCH-SUMMARY]"
+
+# 默认每 60 秒或累计 500 个事件输出一次汇总
+DEFAULT_FLUSH_INTERVAL_MS = 60000
+DEFAULT_FLUSH_THRESHOLD = 500
+
+# 每个类别最多记录的明细键数量（如 endpoint），超出部分计入 "(other)"
+DEFAULT_MAX_DETAIL_KEYS = 20
+
+# 聚合器挂在全局对象上，补丁代码每次执行只做一次属性查找
+_AGGREGATOR_TEMPLATE = '''const augPatchLog = globalThis.__augPatchLog || (globalThis.__augPatchLog = (function() {
+    const session = Math.random().toString(36).substring(2, 10);
+    let counts = {}, details = {}, pending = 0, seq = 0, timer = null;
+    function flush() {
+        if (timer) { clearTimeout(timer); timer = null; }
+        if (pending === 0) { return; }
+        const line = "__PREFIX__ " + JSON.stringify({ session: session, seq: ++seq, source: "__SOURCE__", time: Date.now(), events: pending, counts: counts, details: details });
+        counts = {}; details = {}; pending = 0;
+        console.log(line);
+    }
+    function record(category, detail) {
+        counts[category] = (counts[category] || 0) + 1;
+        if (detail !== undefined) {
+            const bucket = details[category] || (details[category] = {});
+            let key = String(detail).substring(0, 120);
+            if (!(key in bucket) && Object.keys(bucket).length >= __MAX_KEYS__) { key = "(other)"; }
+            bucket[key] = (bucket[key] || 0) + 1;
+        }
+        if (++pending >= __THRESHOLD__) {
+            flush();
+        } else if (!timer) {
+            timer = setTimeout(flush, __INTERVAL__);
+            if (timer && typeof timer.unref === "function") { timer.unref(); }
+        }
+    }
+    record.flush = flush;
+    if (typeof process !== "undefined" && typeof process.once === "function") { process.once("exit", flush); }
+    return record;
+})());'''
+
+
+def generate_log_aggregator(source: str = "patch",
+                            interval_ms: int = DEFAULT_FLUSH_INTERVAL_MS,
+                            threshold: int = DEFAULT_FLUSH_THRESHOLD,
+                            max_detail_keys: int = DEFAULT_MAX_DETAIL_KEYS) -> str:
+    """
+    生成聚合日志的 JS 代码，定义局部函数 augPatchLog(category, detail)
+
+    同一进程中首次执行的补丁创建全局聚合器，之后的补丁复用它（source 取首次创建者的值）。
+    计时器只在有待输出事件时存在，并调用 unref()，不会阻止扩展宿主退出。
+    """
+    return (_AGGREGATOR_TEMPLATE
+            .replace("__PREFIX__", SUMMARY_PREFIX)
+            .replace("__SOURCE__", source)
+            .replace("__MAX_KEYS__", str(int(max_detail_keys)))
+            .replace("__THRESHOLD__", str(int(threshold)))
+            .replace("__INTERVAL__", str(int(interval_ms))))
+
+
+def parse_summary_line(line: str) -> Optional[dict]:
+    """解析一行日志中的汇总记录，不是汇总行时返回 None"""
+    index = line.find(SUMMARY_PREFIX)
+    if index < 0:
+        return None
+    payload = line[index + len(SUMMARY_PREFIX):].strip()
+    try:
+        summary = json.loads(payload)
+    except ValueError:
+        return None
+    if not isinstance(summary, dict) or not isinstance(summary.get("counts"), dict):
+        return None
+    return summary
+
+
+def parse_summary_lines(lines: Iterable[str], seen: Optional[set] = None) -> Dict:
+    """
+    汇总多行日志中的补丁计数
+
+    Args:
+        lines: 日志行
+        seen: 已处理过的 (session, seq) 集合；重复读取同一日志时跳过已计入的汇总
+
+    Returns:
+        dict: summaries / events / counts / details
+    """
+    result = {"summaries": 0, "events": 0, "counts": {}, "details": {}}
+
+    for line in lines:
+        summary = parse_summary_line(line)
+        if summary is None:
+            continue
+
+        if seen is not None:
+            key = (summary.get("session"), summary.get("seq"))
+            if key in seen:
+                continue
+            seen.add(key)
+
+        result["summaries"] += 1
+        result["events"] += int(summary.get("events", 0))
+        for category, count in summary["counts"].items():
+            result["counts"][category] = result["counts"].get(category, 0) + int(count)
+        for category, bucket in (summary.get("details") or {}).items():
+            merged = result["details"].setdefault(category, {})
+            for key, count in bucket.items():
+                merged[key] = merged.get(key, 0) + int(count)
+
+    return result
@@ -7,12 +7,22 @@
 
 import re
 import os
+import hashlib
 import shutil
+import threading
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 from enum import Enum
 
-from .common_utils import print_info, print_success, print_error, print_warning, IDEType
+from .common_utils import (
+    print_info, print_success, print_error, print_warning, IDEType,
+    copy_file_with_hash
+)
+from .backup_store import get_backup_store
+from .patch_cache import get_patch_cache
+from .patch_logging import generate_log_aggregator
+from .js_sanity import JSSanityError, check_fragment, verify_splice
 
 
 class PatchMode(Enum):
@@ -26,25 +36,20 @@ class PatchMode(Enum):
 
 class PatchResult:
     """补丁操作结果"""
-    def __init__(self, success: bool = False, message: str = "", file_path: str = "", backup_path: str = ""):
+    def __init__(self, success: bool = False, message: str = "", file_path: str = "", backup_path: str = "",
+                 already_patched: bool = False):
         self.success = success
         self.message = message
         self.file_path = file_path
         self.backup_path = backup_path
+        self.already_patched = already_patched
 
 
 class PatchManager:
     """代码补丁管理器"""
     
     def __init__(self):
-        # 补丁代码模板
-        self.patches = {
-            PatchMode.BLOCK: self._generate_comprehensive_block_patch(),
-            PatchMode.RANDOM: self._generate_comprehensive_random_patch(),
-            PatchMode.EMPTY: self._generate_comprehensive_empty_patch(),
-            PatchMode.STEALTH: self._generate_comprehensive_stealth_patch(),
-            PatchMode.DEBUG: self._generate_comprehensive_debug_patch()
-        }
+        # 补丁代码模板按需生成并在模块级缓存，见 get_patch_template()
         
         # 补丁签名，用于检测是否已补丁
         self.patch_signatures = [
@@ -72,7 +77,8 @@ class PatchManager:
         }
         return descriptions.get(mode, "未知模式")
     
-    def _generate_comprehensive_block_patch(self) -> str:
+    @staticmethod
+    def _generate_comprehensive_block_patch() -> str:
         """生成全面的阻止模式补丁"""
         return '''
         // 全面遥测拦截 - 支持多种参数名
@@ -80,19 +86,19 @@ class PatchManager:
         
         // 1. 拦截 report-, record- 前缀
         if (endpoint && (endpoint.startsWith("report-") || endpoint.startsWith("record-"))) {
-            console.log("[TELEMETRY BLOCKED]", endpoint);
+            augPatchLog("TELEMETRY BLOCKED", endpoint);
             return { success: true, blocked: true };
         }
         
         // 2. 拦截遥测关键词
         if (endpoint && /(telemetry|analytics|tracking|metrics|usage|fingerprint|event|log)/i.test(endpoint)) {
-            console.log("[TELEMETRY BLOCKED]", endpoint);
+            augPatchLog("TELEMETRY BLOCKED", endpoint);
             return { success: true, blocked: true };
         }
         
         // 3. 拦截订阅查询
         if (endpoint && /(subscription|auth|license|activation)/i.test(endpoint)) {
-            console.log("[AUTH INTERCEPTED]", endpoint);
+            augPatchLog("AUTH INTERCEPTED", endpoint);
             return { success: true, subscription: { Enterprise: {}, ActiveSubscription: { end_date: "2026-12-31", usage_balance_depleted: false } } };
         }
         
@@ -104,19 +110,20 @@ class PatchManager:
                 if (field in i) { hasSensitive = true; break; }
             }
             if (hasSensitive) {
-                console.log("[DATA SANITIZED]", Object.keys(i));
+                augPatchLog("DATA SANITIZED", endpoint);
                 return { success: true, sanitized: true };
             }
         }
         '''.strip()
     
-    def _generate_comprehensive_random_patch(self) -> str:
+    @staticmethod
+    def _generate_comprehensive_random_patch() -> str:
         """生成全面的随机数据模式补丁"""
         return '''
         const endpoint = typeof s === "string" ? s : (typeof n === "string" ? n : (typeof r === "string" ? r : ""));
         
         if (endpoint && (endpoint.startsWith("report-") || endpoint.startsWith("record-") || /(telemetry|analytics|tracking|metrics|usage|fingerprint|event|log)/i.test(endpoint))) {
-            console.log("[TELEMETRY RANDOMIZED]", endpoint);
+            augPatchLog("TELEMETRY RANDOMIZED", endpoint);
             i = { timestamp: Date.now(), version: Math.random().toString(36).substring(2, 8), randomized: true };
         }
         
@@ -134,13 +141,14 @@ class PatchManager:
         }
         '''.strip()
     
-    def _generate_comprehensive_empty_patch(self) -> str:
+    @staticmethod
+    def _generate_comprehensive_empty_patch() -> str:
         """生成全面的空数据模式补丁"""
         return '''
         const endpoint = typeof s === "string" ? s : (typeof n === "string" ? n : (typeof r === "string" ? r : ""));
         
         if (endpoint && (endpoint.startsWith("report-") || endpoint.startsWith("record-") || /(telemetry|analytics|tracking|metrics|usage|fingerprint|event|log)/i.test(endpoint))) {
-            console.log("[TELEMETRY EMPTIED]", endpoint);
+            augPatchLog("TELEMETRY EMPTIED", endpoint);
             i = {};
         }
         
@@ -158,13 +166,14 @@ class PatchManager:
         }
         '''.strip()
     
-    def _generate_comprehensive_stealth_patch(self) -> str:
+    @staticmethod
+    def _generate_comprehensive_stealth_patch() -> str:
         """生成全面的隐身模式补丁"""
         return '''
         const endpoint = typeof s === "string" ? s : (typeof n === "string" ? n : (typeof r === "string" ? r : ""));
         
         if (endpoint && (endpoint.startsWith("report-") || endpoint.startsWith("record-") || /(telemetry|analytics|tracking|metrics|usage|fingerprint|event|log)/i.test(endpoint))) {
-            console.log("[TELEMETRY STEALTHED]", endpoint);
+            augPatchLog("TELEMETRY STEALTHED", endpoint);
             i = { timestamp: Date.now(), session: Math.random().toString(36).substring(2, 10), events: [], stealth: true };
         }
         
@@ -182,18 +191,19 @@ class PatchManager:
         }
         '''.strip()
     
-    def _generate_comprehensive_debug_patch(self) -> str:
+    @staticmethod
+    def _generate_comprehensive_debug_patch() -> str:
         """生成全面的调试模式补丁"""
         return '''
         const endpoint = typeof s === "string" ? s : (typeof n === "string" ? n : (typeof r === "string" ? r : ""));
         
         if (endpoint && (endpoint.startsWith("report-") || endpoint.startsWith("record-") || /(telemetry|analytics|tracking|metrics|usage|fingerprint|event|log)/i.test(endpoint))) {
-            console.log("[TELEMETRY DEBUG]", endpoint);
+            augPatchLog("TELEMETRY DEBUG", endpoint);
             i = { timestamp: Date.now(), version: Math.random().toString(36).substring(2, 8), debug: true };
         }
         
         if (endpoint && /(subscription|auth|license|activation)/i.test(endpoint)) {
-            console.log("[AUTH DEBUG]", endpoint);
+            augPatchLog("AUTH DEBUG", endpoint);
             return { success: true, subscription: { Enterprise: {}, ActiveSubscription: { end_date: "2026-12-31", usage_balance_depleted: false } } };
         }
         
@@ -214,36 +224,46 @@ class PatchManager:
         }
         '''.strip()
     
-    def _generate_session_randomizer(self) -> str:
+    @staticmethod
+    def _generate_session_randomizer() -> str:
         """生成会话随机化代码"""
         return ' const chars = "0123456789abcdef"; let randSessionId = ""; for (let i = 0; i < 36; i++) { randSessionId += i === 8 || i === 13 || i === 18 || i === 23 ? "-" : i === 14 ? "4" : i === 19 ? chars[8 + Math.floor(4 * Math.random())] : chars[Math.floor(16 * Math.random())]; } this.sessionId = randSessionId; this._userAgent = "";'
     
-    def _create_backup(self, file_path: str) -> Tuple[bool, str]:
+    def get_backup_path(self, file_path: str) -> str:
+        """返回文件对应的原始备份路径 (xxx_ori.js)"""
+        file_path_obj = Path(file_path)
+        return str(file_path_obj.with_name(f'{file_path_obj.stem}_ori{file_path_obj.suffix}'))
+    
+    def _create_backup(self, file_path: str, digest: Optional[str] = None) -> Tuple[bool, str]:
         """创建文件备份"""
         try:
-            file_path_obj = Path(file_path)
-            # 正确生成备份文件名
-            backup_path = file_path_obj.with_name(f'{file_path_obj.stem}_ori{file_path_obj.suffix}')
+            backup_path = Path(self.get_backup_path(file_path))
             
             if backup_path.exists():
                 print_warning(f"备份文件已存在: {backup_path}")
                 return True, str(backup_path)
             
-            shutil.copy2(file_path, backup_path)
-            
-            # 验证备份完整性
-            is_valid, message = self._verify_backup_integrity(file_path, str(backup_path))
-            if is_valid:
-                print_success(f"备份创建成功: {backup_path}")
+            # 原始内容存入内容寻址仓库（相同内容只需一次哈希），备份文件由仓库对象硬链接生成
+            store = get_backup_store()
+            stored = store.store_file(file_path, digest)
+            if stored and store.materialize(stored, backup_path):
+                print_success(f"备份创建成功: {backup_path} (sha256: {stored[:12]})")
                 return True, str(backup_path)
-            else:
-                print_error(f"备份验证失败: {message}")
-                # 删除无效备份
-                try:
-                    backup_path.unlink()
-                except:
-                    pass
+            
+            # 仓库不可用时回退为单次读取的复制+哈希（copy_file_with_hash 会对备份做全量哈希校验）
+            copied = copy_file_with_hash(file_path, backup_path)
+            if not copied:
+                print_error("备份验证失败: 备份内容与原文件不一致")
+                return False, ""
+            # 已知摘要时确认文件在读取之后没有被修改
+            if digest and copied != digest:
+                print_error(f"备份验证失败: 文件在读取后被修改 (期望 {digest[:12]}, 实际 {copied[:12]})")
+                os.unlink(backup_path)
                 return False, ""
+            digest = copied
+            
+            print_success(f"备份创建成功: {backup_path} (sha256: {digest[:12]})")
+            return True, str(backup_path)
             
         except Exception as e:
             print_error(f"创建备份失败: {e}")
@@ -256,22 +276,35 @@ class PatchManager:
             print_info(f"检测到文件已被补丁 (置信度: {confidence})")
         return is_patched
     
-    def _enhanced_patch_detection(self, content: str) -> tuple[bool, str]:
-        """增强的补丁检测，使用多种方法"""
+    def _enhanced_patch_detection(self, content) -> tuple[bool, str]:
+        """增强的补丁检测，使用多种方法（支持 str、bytes 和 mmap 内容）"""
+        as_bytes = not isinstance(content, str)
+        
+        def contains(needle: str) -> bool:
+            return content.find(needle.encode('utf-8') if as_bytes else needle) >= 0
+        
+        def occurs_more_than(needle: str, limit: int) -> bool:
+            # 直接在内容（含 mmap）上迭代匹配，达到次数即停止，不复制内容
+            pattern = re.escape(needle.encode('utf-8') if as_bytes else needle)
+            for count, _ in enumerate(re.finditer(pattern, content), 1):
+                if count > limit:
+                    return True
+            return False
         
         # 方法1: 签名检测
-        signature_matches = [sig for sig in self.patch_signatures if sig in content]
+        signature_matches = [sig for sig in self.patch_signatures if contains(sig)]
         if signature_matches:
             return True, f"签名匹配: {', '.join(signature_matches)}"
         
         # 方法2: 文件开头检测（补丁文件通常以特定模式开始）
-        if content.startswith('!function(){const _={'):
+        prefix = '!function(){const _={'
+        if content[:len(prefix)] == (prefix.encode('utf-8') if as_bytes else prefix):
             return True, "文件开头模式匹配"
         
         # 方法3: 大小检测（补丁后文件通常会变小）
         if len(content) < 3000000:  # 小于3MB可能是补丁后的文件
             # 进一步检查是否包含压缩特征
-            if content.count('const _=') > 5 and content.count('function()') > 10:
+            if occurs_more_than('const _=', 5) and occurs_more_than('function()', 10):
                 return True, "大小和内容模式匹配"
         
         # 方法4: 特殊字符串检测
@@ -280,7 +313,7 @@ class PatchManager:
             'randSessionId', 'fakeData', 'blockTelemetry'  # 补丁功能标识
         ]
         
-        found_indicators = [ind for ind in patch_indicators if ind in content]
+        found_indicators = [ind for ind in patch_indicators if contains(ind)]
         if found_indicators:
             return True, f"补丁指示器匹配: {', '.join(found_indicators)}"
         
@@ -331,39 +364,6 @@ class PatchManager:
         except Exception as e:
             print_warning(f"无法获取文件状态: {e}")
     
-    def _verify_backup_integrity(self, original_path: str, backup_path: str) -> tuple[bool, str]:
-        """验证备份文件的完整性"""
-        try:
-            if not os.path.exists(backup_path):
-                return False, "备份文件不存在"
-            
-            original_size = os.path.getsize(original_path)
-            backup_size = os.path.getsize(backup_path)
-            
-            if original_size != backup_size:
-                return False, f"文件大小不匹配: 原始 {original_size} vs 备份 {backup_size}"
-            
-            # 快速内容验证 - 比较文件开头和结尾
-            with open(original_path, 'rb') as orig, open(backup_path, 'rb') as backup:
-                # 比较前1000字节
-                orig_start = orig.read(1000)
-                backup_start = backup.read(1000)
-                if orig_start != backup_start:
-                    return False, "文件开头内容不匹配"
-                
-                # 比较最后1000字节
-                orig.seek(-1000, 2)
-                backup.seek(-1000, 2)
-                orig_end = orig.read(1000)
-                backup_end = backup.read(1000)
-                if orig_end != backup_end:
-                    return False, "文件结尾内容不匹配"
-            
-            return True, "备份验证成功"
-            
-        except Exception as e:
-            return False, f"验证过程出错: {e}"
-    
     def _safe_restore_from_backup(self, file_path: str, backup_path: str) -> bool:
         """安全地从备份恢复文件，包含详细的错误处理和验证"""
         try:
@@ -401,10 +401,118 @@ class PatchManager:
             print_error(f"恢复文件时发生未知错误 ({type(e).__name__}): {e}")
             return False
     
-    def _find_callapi_function(self, content: str) -> Optional[re.Match]:
-        """查找async callApi函数"""
-        pattern = r'(async\s+callApi\s*\([^)]*\)\s*\{)'
-        return re.search(pattern, content)
+    def _find_callapi_function(self, content) -> Optional[re.Match]:
+        """查找async callApi函数（支持 str、bytes 和 mmap 内容）"""
+        pattern = _CALLAPI_PATTERN if isinstance(content, str) else _CALLAPI_PATTERN_BYTES
+        return pattern.search(content)
+    
+    def _stage_spliced(self, file_path: str, raw: bytes, offset: int, patch_bytes: bytes, staged_path: str) -> None:
+        """
+        将 原文件[:offset] + 补丁 + 原文件[offset:] 流式写入暂存文件（不构造完整的补丁后内容）
+        """
+        view = memoryview(raw)
+        try:
+            with open(staged_path, 'wb') as f:
+                f.write(view[:offset])
+                f.write(patch_bytes)
+                f.write(view[offset:])
+            shutil.copymode(file_path, staged_path)
+        except BaseException:
+            try:
+                os.unlink(staged_path)
+            except OSError:
+                pass
+            raise
+    
+    def _stage_patched(self, file_path: str, prepared: "_PreparedPatch", template: "PatchTemplate",
+                       staged_path: str) -> None:
+        """
+        生成补丁后的暂存文件：缓存命中时直接复制（优先 reflink）缓存产物并校验，
+        否则拼接写入并把结果存入补丁缓存
+        """
+        cache = get_patch_cache()
+        if prepared.cached:
+            if cache.materialize(prepared.cached, staged_path):
+                shutil.copymode(file_path, staged_path)
+                print_info(f"使用缓存的补丁产物 (sha256: {prepared.cached['patched_sha256'][:12]})")
+                return
+            # 缓存条目损坏，回退为常规补丁
+            match = self._find_callapi_function(prepared.raw)
+            if not match:
+                raise ValueError("未找到async callApi函数")
+            prepared.header_start, prepared.offset = match.start(), match.end()
+        
+        # 写入前检查注入点和注入代码的语法配对，未通过时原文件保持不变
+        verify_splice(prepared.raw, prepared.header_start, prepared.offset, template.code)
+        
+        self._stage_spliced(file_path, prepared.raw, prepared.offset, template.encoded, staged_path)
+        cache.store(prepared.digest, template.mode.value, template.version, template.sha256,
+                    staged_path, prepared.offset)
+    
+    def _write_patched(self, file_path: str, prepared: "_PreparedPatch", template: "PatchTemplate") -> None:
+        """写入同目录临时文件后用 os.replace 原子替换原文件"""
+        temp_path = f"{file_path}.patching-{os.getpid()}-{threading.get_ident()}"
+        self._stage_patched(file_path, prepared, template, temp_path)
+        try:
+            os.replace(temp_path, file_path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+    
+    def _prepare_patch(self, file_path: str, template: "PatchTemplate") -> Tuple[Optional["_PreparedPatch"], Optional[PatchResult]]:
+        """
+        读取文件、检测补丁状态、定位注入点并创建备份
+        
+        原文件内容命中补丁缓存时跳过补丁检测和注入点搜索（缓存只记录未补丁的原文件）。
+        
+        Returns:
+            (准备结果, None) 或 (None, 失败/跳过的 PatchResult)
+        """
+        # 检查并处理文件属性
+        self._ensure_file_writable(file_path)
+        
+        # 读取文件内容（保留原始字节，写入时直接拼接）
+        try:
+            with open(file_path, 'rb') as f:
+                raw = f.read()
+            print_info(f"文件读取成功，大小: {len(raw)} 字节")
+        except Exception as e:
+            print_error(f"读取文件失败: {e}")
+            return None, PatchResult(False, f"读取文件失败: {e}")
+        
+        digest = hashlib.sha256(raw).hexdigest()
+        cached = get_patch_cache().lookup(digest, template.mode.value, template.version, template.sha256,
+                                          raw, template.encoded)
+        offset = cached["offset"] if cached else 0
+        header_start = cached["header_start"] if cached else 0
+        
+        if not cached:
+            try:
+                content = raw.decode('utf-8')
+            except UnicodeDecodeError as e:
+                print_error(f"读取文件失败: {e}")
+                return None, PatchResult(False, f"读取文件失败: {e}")
+            
+            # 检查是否已被补丁
+            if self._is_already_patched(content):
+                return None, PatchResult(False, "文件已被补丁，跳过操作", file_path, already_patched=True)
+            del content
+            
+            # 查找callApi函数
+            match = self._find_callapi_function(raw)
+            if not match:
+                return None, PatchResult(False, "未找到async callApi函数")
+            header_start, offset = match.start(), match.end()
+        
+        # 创建备份（已知摘要，备份仓库无需再次哈希）
+        backup_success, backup_path = self._create_backup(file_path, digest)
+        if not backup_success:
+            return None, PatchResult(False, "创建备份失败")
+        
+        return _PreparedPatch(raw, offset, backup_path, digest, cached, header_start), None
     
     def apply_patch(self, file_path: str, patch_mode: PatchMode) -> PatchResult:
         """应用补丁到指定文件"""
@@ -418,43 +526,16 @@ class PatchManager:
             print_info(f"开始补丁文件: {file_path}")
             print_info(f"补丁模式: {patch_mode.value} - {self.get_patch_description(patch_mode)}")
             
-            # 检查并处理文件属性
-            self._ensure_file_writable(file_path)
-            
-            # 读取文件内容
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                print_info(f"文件读取成功，大小: {len(content)} 字符")
-            except Exception as e:
-                print_error(f"读取文件失败: {e}")
-                return PatchResult(False, f"读取文件失败: {e}")
+            # 获取缓存的补丁模板（含会话随机化代码及其 UTF-8 编码）
+            template = get_patch_template(patch_mode)
             
-            # 检查是否已被补丁
-            if self._is_already_patched(content):
-                return PatchResult(False, "文件已被补丁，跳过操作")
+            prepared, error_result = self._prepare_patch(file_path, template)
+            if error_result:
+                return error_result
             
-            # 查找callApi函数
-            match = self._find_callapi_function(content)
-            if not match:
-                return PatchResult(False, "未找到async callApi函数")
-            
-            # 创建备份
-            backup_success, backup_path = self._create_backup(file_path)
-            if not backup_success:
-                return PatchResult(False, "创建备份失败")
-            
-            # 生成完整补丁代码
-            patch_code = self.patches[patch_mode] + self._generate_session_randomizer()
-            
-            # 应用补丁
-            func_start = match.end()
-            patched_content = content[:func_start] + patch_code + content[func_start:]
-            
-            # 写入补丁后的内容
+            # 应用补丁：写入临时文件后原子替换，失败时原文件保持不变
             try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(patched_content)
+                self._write_patched(file_path, prepared, template)
                 
                 # 记录补丁后的文件状态
                 self._log_file_state(file_path, "补丁后")
@@ -462,35 +543,90 @@ class PatchManager:
                 print_success(f"补丁应用成功: {file_path}")
                 print_info(f"效果: {self.get_patch_description(patch_mode)}")
                 print_info("隐私保护已启用!")
-                print_info(f"补丁代码长度: {len(patch_code)} 字符")
-                print_info(f"文件大小变化: {len(content)} → {len(patched_content)} 字符")
+                print_info(f"补丁代码长度: {len(template.code)} 字符")
+                print_info(f"文件大小变化: {len(prepared.raw)} → {len(prepared.raw) + len(template.encoded)} 字节")
                 
-                return PatchResult(True, "补丁应用成功", file_path, backup_path)
+                return PatchResult(True, "补丁应用成功", file_path, prepared.backup_path)
                 
+            except JSSanityError as e:
+                error_msg = f"补丁后代码未通过语法检查，已取消写入: {e}"
+                print_error(error_msg)
+                return PatchResult(False, error_msg)
             except PermissionError as e:
                 error_msg = f"文件权限不足，请关闭 VS Code 或以管理员身份运行: {e}"
                 print_error(error_msg)
-                self._safe_restore_from_backup(file_path, backup_path)
                 return PatchResult(False, error_msg)
             except OSError as e:
                 error_msg = f"文件系统错误（可能文件被占用）: {e}"
                 print_error(error_msg)
-                self._safe_restore_from_backup(file_path, backup_path)
                 return PatchResult(False, error_msg)
             except Exception as e:
                 error_msg = f"写入补丁文件失败 ({type(e).__name__}): {e}"
                 print_error(error_msg)
-                self._safe_restore_from_backup(file_path, backup_path)
                 return PatchResult(False, error_msg)
                 
         except Exception as e:
             return PatchResult(False, f"补丁操作失败: {e}")
     
+    def apply_patch_transaction(self, file_paths: List[str], patch_mode: PatchMode,
+                                patch_modes: Optional[List[PatchMode]] = None) -> List[PatchResult]:
+        """
+        事务模式批量补丁：全部文件先暂存为临时文件，再依次 os.replace 提交并写入回滚日志；
+        任一文件失败（如被运行中的IDE锁定）则所有文件保持/回滚为原始内容
+        
+        已补丁的文件会被跳过，不视为失败。每个文件暂存后即释放其内容，内存占用与文件数量无关。
+        patch_modes 与 file_paths 一一对应时按文件指定补丁模式（用于多个IDE一起提交）。
+        """
+        from .patch_transaction import PatchTransaction
+        
+        transaction = PatchTransaction()
+        results: List[PatchResult] = []
+        
+        try:
+            for index, file_path in enumerate(file_paths):
+                template = get_patch_template(patch_modes[index] if patch_modes else patch_mode)
+                if not os.path.exists(file_path):
+                    results.append(PatchResult(False, f"文件不存在: {file_path}", file_path))
+                    break
+                
+                print_info(f"暂存补丁: {file_path}")
+                prepared, error_result = self._prepare_patch(file_path, template)
+                if error_result:
+                    results.append(error_result)
+                    if error_result.already_patched:
+                        continue
+                    break
+                
+                staged_path = transaction.staged_path_for(file_path)
+                self._stage_patched(file_path, prepared, template, staged_path)
+                transaction.add_staged(file_path, staged_path)
+                results.append(PatchResult(True, "已暂存", file_path, prepared.backup_path))
+                prepared = None  # 释放文件内容
+            
+            failed = [r for r in results if not r.success and not r.already_patched]
+            if failed or len(results) < len(file_paths):
+                transaction.abort()
+                reason = failed[0].message if failed else "事务中止"
+                print_error(f"事务中止，所有文件保持原样: {reason}")
+                return [r if r.already_patched else PatchResult(False, f"事务中止: {reason}", r.file_path)
+                        for r in results]
+            
+            if not transaction.commit():
+                return [r if r.already_patched else PatchResult(False, "事务提交失败，已回滚", r.file_path)
+                        for r in results]
+            
+            return [r if r.already_patched else PatchResult(True, "补丁应用成功", r.file_path, r.backup_path)
+                    for r in results]
+        
+        except Exception as e:
+            print_error(f"事务补丁失败: {e}")
+            transaction.abort()
+            return [PatchResult(False, f"事务补丁失败: {e}", path) for path in file_paths]
+    
     def restore_from_backup(self, file_path: str) -> PatchResult:
         """从备份恢复原始文件"""
         try:
-            file_path_obj = Path(file_path)
-            backup_path = file_path_obj.with_name(f'{file_path_obj.stem}_ori{file_path_obj.suffix}')
+            backup_path = Path(self.get_backup_path(file_path))
             
             if not backup_path.exists():
                 return PatchResult(False, f"备份文件不存在: {backup_path}")
@@ -519,3 +655,67 @@ class PatchManager:
                 
         except Exception:
             return "状态未知"
+
+
+# 补丁模板版本：模板内容变化时递增，用于区分缓存
+PATCH_TEMPLATE_VERSION = "2"
+
+_CALLAPI_PATTERN = re.compile(r'(async\s+callApi\s*\([^)]*\)\s*\{)')
+_CALLAPI_PATTERN_BYTES = re.compile(rb'(async\s+callApi\s*\([^)]*\)\s*\{)')
+_CALLAPI_HEADER_END_BYTES = re.compile(rb'async\s+callApi\s*\([^)]*\)\s*\{\Z')
+
+# 向前查找 callApi 函数头的最大字节数
+_CALLAPI_HEADER_WINDOW = 4096
+
+
+def find_callapi_header_before(raw: bytes, offset: int) -> Optional[re.Match]:
+    """返回恰好结束于 offset 的 callApi 函数头匹配（只检查 offset 之前的有限窗口），没有时返回 None"""
+    return _CALLAPI_HEADER_END_BYTES.search(raw, max(0, offset - _CALLAPI_HEADER_WINDOW), offset)
+
+_TEMPLATE_BUILDERS = {
+    PatchMode.BLOCK: PatchManager._generate_comprehensive_block_patch,
+    PatchMode.RANDOM: PatchManager._generate_comprehensive_random_patch,
+    PatchMode.EMPTY: PatchManager._generate_comprehensive_empty_patch,
+    PatchMode.STEALTH: PatchManager._generate_comprehensive_stealth_patch,
+    PatchMode.DEBUG: PatchManager._generate_comprehensive_debug_patch,
+}
+
+
+class _PreparedPatch:
+    """已完成检测和备份、等待写入的补丁"""
+    def __init__(self, raw: bytes, offset: int, backup_path: str, digest: str, cached: Optional[dict] = None,
+                 header_start: int = 0):
+        self.raw = raw
+        self.offset = offset
+        self.header_start = header_start
+        self.backup_path = backup_path
+        self.digest = digest
+        self.cached = cached
+
+
+class PatchTemplate:
+    """生成完成的补丁代码（注入 callApi 的完整代码及其 UTF-8 编码）"""
+    def __init__(self, mode: PatchMode, version: str, code: str):
+        self.mode = mode
+        self.version = version
+        self.code = code
+        self.encoded = code.encode('utf-8')
+        self.sha256 = hashlib.sha256(self.encoded).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def get_patch_template(mode: PatchMode, version: str = PATCH_TEMPLATE_VERSION) -> PatchTemplate:
+    """
+    按 (模式, 版本) 懒加载并缓存补丁模板，进程内每种模式只生成一次
+    
+    扫描、恢复等只查询状态的操作不会触发模板生成。
+    """
+    if version != PATCH_TEMPLATE_VERSION:
+        raise ValueError(f"不支持的补丁模板版本: {version} (当前 {PATCH_TEMPLATE_VERSION})")
+    # 聚合日志：补丁代码按类别计数，定时输出一行汇总，不再逐次 console.log
+    code = (" " + generate_log_aggregator(source=f"callApi:{mode.value}") + "\n        "
+            + _TEMPLATE_BUILDERS[mode]() + PatchManager._generate_session_randomizer())
+    error = check_fragment(code)
+    if error:
+        raise JSSanityError(f"补丁模板 {mode.value} 语法检查失败: {error}")
+    return PatchTemplate(mode, version, code)
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+补丁预演（dry-run）
+只计算注入点偏移并生成紧凑的 unified diff 风格片段，不修改文件，也不构造补丁后的完整内容。
+文件通过 mmap 读取，上下文按字节数截断（压缩后的单行可能有数 MB），可并行规划大量文件，
+适合作为批量补丁前的检查关卡。
+"""
+
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .common_utils import print_info, print_warning
+from .js_sanity import check_splice
+from .patch_manager import PatchManager, PatchMode, get_patch_template
+
+# 计划状态
+PLAN_PATCHABLE = "patchable"
+PLAN_ALREADY_PATCHED = "already_patched"
+PLAN_NO_INJECTION_POINT = "no_injection_point"
+PLAN_UNSAFE = "unsafe"
+PLAN_MISSING = "missing"
+PLAN_ERROR = "error"
+
+# 这些状态不会阻止批量补丁
+PLAN_OK_STATUSES = (PLAN_PATCHABLE, PLAN_ALREADY_PATCHED)
+
+DEFAULT_CONTEXT_LINES = 3
+DEFAULT_MAX_LINE_BYTES = 160
+DEFAULT_MAX_INSERT_LINES = 12
+
+# 计算行号时分块统计换行符，避免复制整个文件
+_COUNT_CHUNK = 1024 * 1024
+
+# 插入点: (偏移, 插入内容, 注入点所在函数头的起始偏移或 None)
+Insertion = Tuple[int, bytes, Optional[int]]
+
+
+class PatchPlan:
+    """单个文件的补丁计划"""
+    def __init__(self, file_path: str, status: str, message: str = ""):
+        self.file_path = file_path
+        self.status = status
+        self.message = message
+        self.file_size = 0
+        self.insertions: List[dict] = []   # {'offset', 'line', 'column', 'bytes'}
+        self.hunks: List[str] = []
+
+    @property
+    def ok(self) -> bool:
+        return self.status in PLAN_OK_STATUSES
+
+    @property
+    def added_bytes(self) -> int:
+        return sum(item['bytes'] for item in self.insertions)
+
+    def to_dict(self) -> dict:
+        return {
+            'path': self.file_path,
+            'status': self.status,
+            'message': self.message,
+            'file_size': self.file_size,
+            'added_bytes': self.added_bytes,
+            'insertions': self.insertions,
+            'hunks': self.hunks,
+        }
+
+    def format_diff(self, label: str = "patched") -> str:
+        """返回该文件的 diff 文本（无插入时为空字符串）"""
+        if not self.hunks:
+            return ""
+        header = f"--- {self.file_path}\n+++ {self.file_path} ({label})\n"
+        return header + "".join(self.hunks)
+
+
+def _count_newlines(buf, end: int) -> int:
+    count = 0
+    for start in range(0, end, _COUNT_CHUNK):
+        count += buf[start:min(start + _COUNT_CHUNK, end)].count(b'\n')
+    return count
+
+
+def _clip_bytes(text: bytes, max_bytes: int) -> bytes:
+    """把过长的行截断为 max_bytes 并加省略号"""
+    if len(text) > max_bytes:
+        return text[:max_bytes] + b"\xe2\x80\xa6"
+    return text
+
+
+def _clip(text: bytes, max_bytes: int) -> str:
+    return _clip_bytes(text, max_bytes).decode('utf-8', 'replace')
+
+
+def _line_start(buf, end: int, max_bytes: int) -> Tuple[int, bool]:
+    """向前查找行首（最多 max_bytes），返回 (行首偏移, 是否被截断)"""
+    window = max(0, end - max_bytes)
+    start = buf.rfind(b'\n', window, end) + 1
+    if start == 0 and window > 0:
+        return window, True
+    return start, False
+
+
+def _context_before(buf, offset: int, lines: int, max_bytes: int) -> Tuple[List[bytes], int, bool]:
+    """返回注入点之前的上下文行（不含注入点所在行）、注入点所在行的起始偏移及该行是否被截断"""
+    line_start, truncated = _line_start(buf, offset, max_bytes)
+    head_truncated = truncated
+    context = []
+    cursor = line_start
+    while len(context) < lines and cursor > 0 and not truncated:
+        prev_start, truncated = _line_start(buf, cursor - 1, max_bytes)
+        context.insert(0, (b"\xe2\x80\xa6" if truncated else b"") + buf[prev_start:cursor - 1])
+        cursor = prev_start
+    return context, line_start, head_truncated
+
+
+def _line_end(buf, start: int, size: int, max_bytes: int) -> Tuple[int, bool]:
+    """向后查找行尾（最多 max_bytes），返回 (行尾偏移, 是否被截断)"""
+    limit = min(size, start + max_bytes)
+    end = buf.find(b'\n', start, limit)
+    if end < 0:
+        return limit, limit < size
+    return end, False
+
+
+def _context_after(buf, offset: int, size: int, lines: int, max_bytes: int) -> Tuple[int, bool, List[bytes]]:
+    """返回注入点所在行的结束偏移、该行是否被截断及其后的上下文行"""
+    line_end, truncated = _line_end(buf, offset, size, max_bytes)
+    tail_truncated = truncated
+    context = []
+    cursor = line_end + 1
+    while len(context) < lines and cursor < size and not truncated:
+        next_end, truncated = _line_end(buf, cursor, size, max_bytes)
+        context.append(buf[cursor:next_end] + (b"\xe2\x80\xa6" if truncated else b""))
+        cursor = next_end + 1
+    return line_end, tail_truncated, context
+
+
+def build_hunk(buf, size: int, offset: int, payload: bytes,
+               context_lines: int = DEFAULT_CONTEXT_LINES,
+               max_line_bytes: int = DEFAULT_MAX_LINE_BYTES,
+               max_insert_lines: int = DEFAULT_MAX_INSERT_LINES,
+               line_delta: int = 0) -> Tuple[str, int, int]:
+    """
+    根据偏移生成一个 unified diff 片段
+
+    注入点所在行显示为一行删除和若干行新增；行号与行数按真实内容计算，
+    只有显示内容被截断。line_delta 为同一文件中此前插入所增加的行数。
+
+    Returns:
+        (片段文本, 行号, 列号)
+    """
+    line_no = _count_newlines(buf, offset) + 1
+    before, line_start, head_truncated = _context_before(buf, offset, context_lines, max_line_bytes)
+    line_end, tail_truncated, after = _context_after(buf, offset, size, context_lines, max_line_bytes)
+    column = offset - buf.rfind(b'\n', 0, offset)
+
+    # 超长行只显示注入点附近的部分，用省略号标出
+    head = (b"\xe2\x80\xa6" if head_truncated else b"") + buf[line_start:offset]
+    tail = buf[offset:line_end] + (b"\xe2\x80\xa6" if tail_truncated else b"")
+    payload_lines = payload.split(b'\n')
+
+    start = line_no - len(before)
+    old_count = len(before) + 1 + len(after)
+    new_count = len(before) + len(payload_lines) + len(after)
+
+    out = [f"@@ -{start},{old_count} +{start + line_delta},{new_count} @@\n"]
+    out.extend(f" {_clip(line, max_line_bytes)}\n" for line in before)
+    out.append(f"-{head.decode('utf-8', 'replace')}{tail.decode('utf-8', 'replace')}\n")
+
+    new_lines = list(payload_lines)
+    new_lines[0] = head + _clip_bytes(new_lines[0], max_line_bytes)
+    new_lines[-1] = _clip_bytes(new_lines[-1], max_line_bytes) + tail
+    if len(payload_lines) == 1:
+        new_lines = [head + _clip_bytes(payload_lines[0], max_line_bytes) + tail]
+    if len(new_lines) > max_insert_lines:
+        hidden = len(new_lines) - max_insert_lines
+        new_lines = (new_lines[:max_insert_lines - 1]
+                     + [f"… ({hidden} more lines, {len(payload)} bytes inserted in total)".encode('utf-8')]
+                     + new_lines[-1:])
+    for index, line in enumerate(new_lines):
+        if 0 < index < len(new_lines) - 1:
+            line = _clip_bytes(line, max_line_bytes)
+        out.append(f"+{line.decode('utf-8', 'replace')}\n")
+
+    out.extend(f" {_clip(line, max_line_bytes)}\n" for line in after)
+    return "".join(out), line_no, column
+
+
+class PatchPlanner:
+    """补丁预演器"""
+
+    def __init__(self, patch_manager: Optional[PatchManager] = None, max_workers: Optional[int] = None,
+                 context_lines: int = DEFAULT_CONTEXT_LINES, max_line_bytes: int = DEFAULT_MAX_LINE_BYTES):
+        self.patch_manager = patch_manager or PatchManager()
+        self.max_workers = max_workers
+        self.context_lines = context_lines
+        self.max_line_bytes = max_line_bytes
+
+    def plan_insertions(self, file_path: str,
+                        locate: Callable[[object, int], Tuple[str, List[Insertion], str]]) -> PatchPlan:
+        """
+        通用规划入口
+
+        Args:
+            locate: locate(buf, size) -> (状态, 插入点列表, 说明)，buf 为只读 mmap
+        """
+        if not os.path.isfile(file_path):
+            return PatchPlan(file_path, PLAN_MISSING, "文件不存在")
+
+        try:
+            with open(file_path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size == 0:
+                    return PatchPlan(file_path, PLAN_NO_INJECTION_POINT, "文件为空")
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                    status, insertions, message = locate(buf, size)
+                    plan = PatchPlan(file_path, status, message)
+                    plan.file_size = size
+
+                    line_delta = 0
+                    for offset, payload, header_start in sorted(insertions, key=lambda item: item[0]):
+                        if header_start is not None:
+                            error = check_splice(buf, header_start, offset, payload.decode('utf-8'))
+                            if error:
+                                plan.status = PLAN_UNSAFE
+                                plan.message = error
+                        hunk, line_no, column = build_hunk(buf, size, offset, payload, self.context_lines,
+                                                           self.max_line_bytes, line_delta=line_delta)
+                        line_delta += payload.count(b'\n')
+                        plan.hunks.append(hunk)
+                        plan.insertions.append({'offset': offset, 'line': line_no,
+                                                'column': column, 'bytes': len(payload)})
+                    return plan
+        except Exception as e:
+            return PatchPlan(file_path, PLAN_ERROR, f"规划失败: {e}")
+
+    def plan_file(self, file_path: str, patch_mode: PatchMode) -> PatchPlan:
+        """规划 PatchManager.apply_patch 对单个文件的修改"""
+        template = get_patch_template(patch_mode)
+
+        def locate(buf, size):
+            detected, reason = self.patch_manager._enhanced_patch_detection(buf)
+            if detected:
+                return PLAN_ALREADY_PATCHED, [], reason
+            match = self.patch_manager._find_callapi_function(buf)
+            if not match:
+                return PLAN_NO_INJECTION_POINT, [], "未找到async callApi函数"
+            return PLAN_PATCHABLE, [(match.end(), template.encoded, match.start())], ""
+
+        return self.plan_insertions(file_path, locate)
+
+    def plan_files(self, file_paths: List[str], patch_mode: PatchMode) -> List[PatchPlan]:
+        """并行规划多个文件，结果顺序与输入一致"""
+        from .batch_patcher import default_worker_count
+
+        if not file_paths:
+            return []
+        # 模板在主线程中生成一次，工作线程只读取缓存
+        get_patch_template(patch_mode)
+
+        workers = self.max_workers or default_worker_count(len(file_paths))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="plan") as executor:
+            return list(executor.map(lambda path: self.plan_file(path, patch_mode), file_paths))
+
+
+def summarize_plans(plans: List[PatchPlan]) -> Dict[str, int]:
+    """按状态统计计划数量并打印摘要"""
+    counts: Dict[str, int] = {}
+    for plan in plans:
+        counts[plan.status] = counts.get(plan.status, 0) + 1
+
+    print_info(f"共规划 {len(plans)} 个文件: " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    for plan in plans:
+        if not plan.ok:
+            print_warning(f"  {plan.status}: {plan.file_path} {plan.message}")
+    return counts
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多文件补丁事务
+所有补丁输出先暂存为同目录临时文件，再依次 os.replace 提交；每一步写入回滚日志，
+失败时按日志回滚，进程崩溃后可在下次启动时重放日志恢复
+"""
+
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import List, Optional, Union
+
+from .common_utils import (
+    print_info, print_success, print_warning, print_error,
+    copy_file_with_hash, get_tool_data_dir
+)
+
+# 日志记录类型
+OP_BEGIN = "begin"
+OP_STAGE = "stage"          # 暂存文件已写入: path, staged, rollback
+OP_PREPARED = "prepared"    # 所有原文件的回滚副本已就绪
+OP_REPLACE = "replace"      # 即将替换 path（先写日志再执行 os.replace）
+OP_COMMITTED = "committed"
+OP_ROLLED_BACK = "rolled_back"
+OP_ABORTED = "aborted"
+
+TERMINAL_OPS = (OP_COMMITTED, OP_ROLLED_BACK, OP_ABORTED)
+
+
+def get_journal_dir() -> Path:
+    """返回事务日志目录"""
+    return get_tool_data_dir() / "journal"
+
+
+def _remove_quietly(path: Optional[str]) -> None:
+    if not path:
+        return
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print_warning(f"无法删除临时文件 {path}: {e}")
+
+
+class PatchTransaction:
+    """多文件补丁事务"""
+
+    def __init__(self, journal_dir: Optional[Union[str, Path]] = None):
+        self.tx_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.journal_dir = Path(journal_dir) if journal_dir else get_journal_dir()
+        self.journal_path = self.journal_dir / f"{self.tx_id}.journal"
+        self.entries: List[dict] = []
+        self.finished = False
+        self._journal = None
+
+    # --- 日志 ---
+
+    def _append(self, record: dict) -> None:
+        """追加一条日志并落盘"""
+        if self._journal is None:
+            self.journal_dir.mkdir(parents=True, exist_ok=True)
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            begin = {"op": OP_BEGIN, "tx": self.tx_id, "pid": os.getpid(), "time": time.time()}
+            self._journal.write(json.dumps(begin) + "\n")
+        self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _close_journal(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        _remove_quietly(str(self.journal_path))
+
+    # --- 暂存 ---
+
+    def staged_path_for(self, file_path: str) -> str:
+        """返回文件在本事务中的暂存路径（与原文件同目录，保证 os.replace 原子）"""
+        return f"{file_path}.aug-tx-{self.tx_id}"
+
+    def add_staged(self, file_path: str, staged_path: str) -> None:
+        """登记已写好的暂存文件"""
+        entry = {
+            "path": file_path,
+            "staged": staged_path,
+            "rollback": f"{file_path}.aug-rb-{self.tx_id}",
+            "replaced": False,
+        }
+        self.entries.append(entry)
+        self._append({"op": OP_STAGE, "path": entry["path"], "staged": entry["staged"],
+                      "rollback": entry["rollback"]})
+
+    # --- 提交 / 回滚 ---
+
+    def commit(self) -> bool:
+        """
+        提交事务：先为每个原文件建立回滚副本（硬链接，失败时复制），
+        再依次 os.replace；任一步失败则按日志回滚已替换的文件
+
+        Returns:
+            bool: 是否全部提交成功
+        """
+        if self.finished:
+            return False
+        if not self.entries:
+            self.finished = True
+            self._close_journal()
+            return True
+
+        try:
+            for entry in self.entries:
+                _remove_quietly(entry["rollback"])
+                try:
+                    os.link(entry["path"], entry["rollback"])
+                except OSError:
+                    if not copy_file_with_hash(entry["path"], entry["rollback"]):
+                        raise OSError(f"无法为 {entry['path']} 创建回滚副本")
+            self._append({"op": OP_PREPARED})
+
+            for entry in self.entries:
+                self._append({"op": OP_REPLACE, "path": entry["path"]})
+                entry["replaced"] = True
+                os.replace(entry["staged"], entry["path"])
+
+        except Exception as e:
+            print_error(f"事务 {self.tx_id} 提交失败，开始回滚: {e}")
+            self.rollback()
+            return False
+
+        self._append({"op": OP_COMMITTED})
+        for entry in self.entries:
+            _remove_quietly(entry["rollback"])
+        self.finished = True
+        self._close_journal()
+        print_success(f"事务 {self.tx_id} 已提交，共 {len(self.entries)} 个文件")
+        return True
+
+    def rollback(self) -> None:
+        """按逆序把已替换的文件恢复为原文件，并清理暂存文件"""
+        failed = False
+        for entry in reversed(self.entries):
+            if entry["replaced"] and os.path.exists(entry["rollback"]):
+                try:
+                    os.replace(entry["rollback"], entry["path"])
+                    print_info(f"已回滚: {entry['path']}")
+                except OSError as e:
+                    print_error(f"回滚失败 {entry['path']}: {e}，回滚副本保留在 {entry['rollback']}")
+                    failed = True
+                    continue
+            _remove_quietly(entry["rollback"])
+            _remove_quietly(entry["staged"])
+
+        self.finished = True
+        if failed:
+            # 保留日志，下次启动时由 recover_pending_transactions() 继续回滚
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            return
+
+        self._append({"op": OP_ROLLED_BACK})
+        self._close_journal()
+
+    def abort(self) -> None:
+        """放弃尚未提交的事务，只清理暂存文件"""
+        if self.finished:
+            return
+        for entry in self.entries:
+            _remove_quietly(entry["staged"])
+        if self._journal is not None:
+            self._append({"op": OP_ABORTED})
+        self.finished = True
+        self._close_journal()
+
+
+def _read_journal(journal_path: Path) -> List[dict]:
+    records = []
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break  # 崩溃时最后一行可能不完整
+    return records
+
+
+def _owner_is_alive(records: List[dict]) -> bool:
+    """日志所属进程是否仍在运行（避免回滚其他进程正在进行的事务）"""
+    begin = records[0] if records and records[0].get("op") == OP_BEGIN else {}
+    pid = begin.get("pid")
+    if not pid or pid == os.getpid():
+        return False
+    try:
+        import psutil
+        return psutil.pid_exists(pid)
+    except ImportError:
+        return False
+
+
+def recover_pending_transactions(journal_dir: Optional[Union[str, Path]] = None) -> int:
+    """
+    重放未完成的事务日志（启动时调用）
+
+    已提交的事务只清理残留的临时文件；未完成的事务把所有已记录替换意图的文件
+    从回滚副本恢复（原文件本身即是回滚副本的同一内容，重复恢复是安全的）。
+
+    Returns:
+        int: 处理的日志数量
+    """
+    journal_root = Path(journal_dir) if journal_dir else get_journal_dir()
+    if not journal_root.is_dir():
+        return 0
+
+    recovered = 0
+    for journal_path in sorted(journal_root.glob("*.journal")):
+        try:
+            records = _read_journal(journal_path)
+        except OSError as e:
+            print_warning(f"无法读取事务日志 {journal_path}: {e}")
+            continue
+
+        if _owner_is_alive(records):
+            continue
+
+        stages = [r for r in records if r.get("op") == OP_STAGE]
+        replaced = {r.get("path") for r in records if r.get("op") == OP_REPLACE}
+        terminal = next((r.get("op") for r in reversed(records) if r.get("op") in TERMINAL_OPS), None)
+
+        failed = set()
+        if terminal is None:
+            print_warning(f"发现未完成的补丁事务，正在回滚: {journal_path.stem}")
+            for stage in reversed(stages):
+                if stage["path"] in replaced and os.path.exists(stage["rollback"]):
+                    try:
+                        os.replace(stage["rollback"], stage["path"])
+                        print_info(f"已回滚: {stage['path']}")
+                    except OSError as e:
+                        print_error(f"回滚失败 {stage['path']}: {e}，回滚副本保留在 {stage['rollback']}")
+                        failed.add(stage["path"])
+
+        for stage in stages:
+            _remove_quietly(stage.get("staged"))
+            if stage["path"] not in failed:
+                _remove_quietly(stage.get("rollback"))
+
+        if not failed:
+            _remove_quietly(str(journal_path))
+        recovered += 1
+
+    return recovered
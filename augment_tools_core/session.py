@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+维护会话
+一键执行（run-all）依次清理数据库、修改遥测 ID。各步骤单独调用时会分别解析 IDE 路径
+（Windsurf 还会重复探测并打印诊断信息）、分别备份、分别打开数据库。
+MaintenanceSession 只解析一次路径，在修改任何文件之前为所有涉及的文件做一次快照，
+并在各步骤之间复用同一个数据库连接。
+"""
+
+import sqlite3
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Union
+
+from .common_utils import (
+    IDEType, create_backup, get_ide_display_name, get_ide_paths,
+    print_error, print_info, print_success, print_warning
+)
+from .db_access import DEFAULT_MAX_LOCK_WAIT
+
+
+class MaintenanceSession:
+    """
+    单个IDE的维护会话（可用作上下文管理器，退出时关闭数据库连接）
+
+    Args:
+        ide_type: IDE类型
+        keywords: 清理关键字（可为列表）
+        patterns: 清理用正则表达式
+        max_lock_wait: 数据库被占用时最多等待的秒数
+        wait_for_exit: 等待锁期间检查 IDE 进程
+        compact: 清理后是否压缩数据库
+    """
+
+    def __init__(self, ide_type: IDEType, keywords: Union[str, Sequence[str]] = "augment",
+                 patterns: Sequence[str] = (), max_lock_wait: float = DEFAULT_MAX_LOCK_WAIT,
+                 wait_for_exit: bool = False, compact: bool = True):
+        self.ide_type = ide_type
+        self.ide_name = get_ide_display_name(ide_type)
+        self.keywords = [keywords] if isinstance(keywords, str) else list(keywords)
+        self.patterns = list(patterns)
+        self.max_lock_wait = max_lock_wait
+        self.wait_for_exit = wait_for_exit
+        self.compact = compact
+        self.backups: Dict[str, Optional[Path]] = {}
+        self.lock_wait_seconds = 0.0
+        self._paths: Optional[dict] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._snapshot_taken = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    @property
+    def paths(self) -> dict:
+        """IDE 路径（只解析一次）"""
+        if self._paths is None:
+            self._paths = get_ide_paths(self.ide_type) or {}
+        return self._paths
+
+    @property
+    def state_db(self) -> Optional[Path]:
+        return self.paths.get("state_db")
+
+    @property
+    def storage_json(self) -> Optional[Path]:
+        return self.paths.get("storage_json")
+
+    def connection(self) -> sqlite3.Connection:
+        """会话共享的数据库连接（首次调用时打开）"""
+        if self._conn is None:
+            from .database_manager import open_cleanup_connection
+            self._conn = open_cleanup_connection(self.state_db)
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def snapshot(self) -> Dict[str, Optional[Path]]:
+        """
+        在修改前为 state.vscdb 和 storage.json 各做一次备份（重复调用直接返回已有结果）
+
+        数据库使用在线备份 API，包含 WAL 中尚未检查点的内容。
+        """
+        if self._snapshot_taken:
+            return self.backups
+        self._snapshot_taken = True
+        if self.ide_type == IDEType.JETBRAINS:
+            return self.backups
+
+        from .database_manager import backup_sqlite_database
+        from .db_access import LockTimeout
+
+        print_info(f"为 {self.ide_name} 创建会话快照...")
+        if self.state_db and self.state_db.exists():
+            try:
+                self.backups["state_db"] = backup_sqlite_database(self.state_db, max_lock_wait=self.max_lock_wait)
+            except LockTimeout:
+                # 已输出原因；数据库步骤会因缺少备份而中止
+                self.backups["state_db"] = None
+            except sqlite3.Error as e:
+                print_error(f"数据库备份失败: {e}")
+                self.backups["state_db"] = None
+        if self.storage_json and self.storage_json.exists():
+            self.backups["storage_json"] = create_backup(self.storage_json)
+        return self.backups
+
+    def clean_database(self) -> dict:
+        """
+        删除匹配的键（共享连接、单次扫描、单个事务），需要时压缩数据库
+
+        Returns:
+            dict: success / entries_removed / lock_wait_seconds / compaction / error_message
+        """
+        from .database_manager import (
+            KeyMatcher, _report_compaction, compact_database, delete_matching_keys
+        )
+        from .db_access import LockRetry, LockTimeout
+
+        result = {
+            "success": False,
+            "entries_removed": 0,
+            "lock_wait_seconds": 0.0,
+            "compaction": None,
+            "error_message": None,
+        }
+
+        if self.ide_type == IDEType.JETBRAINS:
+            print_info(f"{self.ide_name} 产品不需要数据库清理，跳过此步骤")
+            result["success"] = True
+            return result
+
+        if not self.state_db or not self.state_db.exists():
+            result["error_message"] = f"数据库文件未找到: {self.state_db}"
+            print_error(result["error_message"])
+            return result
+
+        self.snapshot()
+        if not self.backups.get("state_db"):
+            result["error_message"] = "数据库备份失败，未进行清理"
+            print_error(result["error_message"])
+            return result
+
+        try:
+            matcher = KeyMatcher(self.keywords, self.patterns)
+            conn = self.connection()
+            retry = LockRetry(self.max_lock_wait, self.ide_type if self.wait_for_exit else None)
+            try:
+                matched, preview, deleted = retry.run(lambda: delete_matching_keys(conn, matcher), "清理")
+            finally:
+                result["lock_wait_seconds"] = retry.metrics()["lock_wait_seconds"]
+                self.lock_wait_seconds += result["lock_wait_seconds"]
+
+            if matched == 0:
+                print_success(f"未找到包含关键字 {matcher.describe()} 的条目。数据库已经是干净的。")
+            else:
+                print_info(f"找到 {matched} 个包含 {matcher.describe()} 的条目:")
+                for key in preview:
+                    print_info(f"  - {key}")
+                if matched > len(preview):
+                    print_info(f"  ... 还有 {matched - len(preview)} 个条目")
+                print_success(f"成功删除 {deleted} 个条目")
+            result["entries_removed"] = deleted
+            result["success"] = True
+        except LockTimeout as e:
+            result["error_message"] = str(e)
+            print_error(result["error_message"])
+            return result
+        except (sqlite3.Error, ValueError) as e:
+            result["error_message"] = f"数据库操作失败: {e}"
+            print_error(result["error_message"])
+            return result
+
+        if self.compact and result["entries_removed"]:
+            try:
+                result["compaction"] = compact_database(self.state_db, conn=self.connection())
+                _report_compaction(result["compaction"])
+            except sqlite3.Error as e:
+                print_warning(f"数据库压缩失败: {e}")
+        return result
+
+    def modify_telemetry_ids(self) -> bool:
+        """修改遥测 ID，复用会话快照作为 storage.json 的备份"""
+        from .telemetry_manager import modify_vscode_telemetry_ids
+
+        if self.ide_type == IDEType.JETBRAINS:
+            from .jetbrains_manager import modify_all_jetbrains_session_ids
+            return modify_all_jetbrains_session_ids()
+
+        if not self.storage_json:
+            print_error(f"在配置中未找到 {self.ide_name} storage.json 路径。操作中止。")
+            return False
+
+        self.snapshot()
+        return modify_vscode_telemetry_ids(self.storage_json, self.backups.get("storage_json"))
@@ -1,5 +1,6 @@
 import json
 from pathlib import Path
+from typing import Optional
 import shutil
 
 from .common_utils import (
@@ -38,12 +39,14 @@ def modify_ide_telemetry_ids(ide_type: IDEType) -> bool:
 
     return modify_vscode_telemetry_ids(storage_path)
 
-def modify_vscode_telemetry_ids(storage_json_path: Path) -> bool:
+def modify_vscode_telemetry_ids(storage_json_path: Path, backup_path: Optional[Path] = None) -> bool:
     """
     Modifies the telemetry IDs (machineId and devDeviceId) in storage.json.
 
     Args:
         storage_json_path: Path to the storage.json file.
+        backup_path: An existing backup of the file (e.g. from a MaintenanceSession snapshot).
+                     A new backup is only created when this is not given.
 
     Returns:
         True if modification was successful, False otherwise.
@@ -78,7 +81,8 @@ def modify_vscode_telemetry_ids(storage_json_path: Path) -> bool:
 
         return False
 
-    backup_path = create_backup(storage_json_path)
+    if backup_path is None:
+        backup_path = create_backup(storage_json_path)
     if not backup_path:
         print_error("创建备份失败。中止遥测 ID 修改。")
         return False
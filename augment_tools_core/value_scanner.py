@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ItemTable 值扫描
+数据库清理只匹配 key 列，但 machineId / devDeviceId 等标识符也会出现在无关键名的 value 中。
+这里用 Connection.blobopen 分块读取每个值，在固定大小的缓冲区（memoryview）上用单个多模式正则
+查找所有标识符，报告键名和偏移；可选地在同一个事务内按原长度原地改写，不把整个值读入内存，
+100 MB 以上的数据库也只占用一个分块的内存。
+"""
+
+import json
+import re
+import secrets
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .common_utils import generate_new_device_id, generate_new_machine_id, print_info, print_warning
+from .db_access import DEFAULT_MAX_LOCK_WAIT
+
+# 每次从 BLOB 读取的字节数（即内存上限）
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+# 每个键最多记录的偏移数（计数不受限制）
+MAX_OFFSETS_PER_KEY = 100
+
+# 过短的值容易误匹配，不作为标识符
+MIN_IDENTIFIER_LENGTH = 8
+
+# storage.json 中的设备/机器标识（新版为扁平键名，旧版嵌套在 telemetry 下）
+STORAGE_ID_FIELDS = (
+    "machineId",
+    "telemetry.machineId",
+    "telemetry.macMachineId",
+    "telemetry.devDeviceId",
+    "telemetry.sqmId",
+    "storage.serviceMachineId",
+)
+
+# Connection.blobopen 需要 Python 3.11
+BLOB_IO_SUPPORTED = hasattr(sqlite3.Connection, "blobopen")
+BLOB_IO_UNSUPPORTED_MESSAGE = "值扫描需要 Python 3.11 或更高版本 (sqlite3 增量 BLOB 读写)"
+
+_UUID_RE = re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$")
+_HEX_RE = re.compile(r"^[0-9a-fA-F]+$")
+
+
+def load_storage_identifiers(storage_json_path: Path) -> List[str]:
+    """从 storage.json 读取设备/机器标识，文件不存在或无法解析时返回空列表"""
+    try:
+        with open(storage_json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print_warning(f"无法读取标识符 {storage_json_path}: {e}")
+        return []
+    if not isinstance(data, dict):
+        return []
+
+    identifiers = []
+    for field in STORAGE_ID_FIELDS:
+        value = data.get(field)
+        if value is None and "." in field:
+            parent, child = field.split(".", 1)
+            nested = data.get(parent)
+            value = nested.get(child) if isinstance(nested, dict) else None
+        if isinstance(value, str) and len(value) >= MIN_IDENTIFIER_LENGTH and value not in identifiers:
+            identifiers.append(value)
+    return identifiers
+
+
+def replacement_for(identifier: str) -> str:
+    """生成与原标识符格式、长度相同的新值（原地改写要求长度不变）"""
+    if _UUID_RE.match(identifier):
+        new = generate_new_device_id()
+    elif _HEX_RE.match(identifier) and len(identifier) == 64:
+        new = generate_new_machine_id()
+    elif _HEX_RE.match(identifier):
+        new = secrets.token_hex((len(identifier) + 1) // 2)[:len(identifier)]
+    else:
+        alphabet = "abcdefghijklmnopqrstuvwxyz0123456789"
+        new = "".join(secrets.choice(alphabet) for _ in identifier)
+    if identifier.isupper():
+        new = new.upper()
+    return new
+
+
+class MultiPatternMatcher:
+    """多个字面量标识符合并为一个不区分大小写的字节正则，一次扫描找出全部"""
+
+    def __init__(self, identifiers: Sequence[str]):
+        unique = {}
+        for identifier in identifiers:
+            unique.setdefault(identifier.lower(), identifier)
+        if not unique:
+            raise ValueError("没有可扫描的标识符")
+        self.identifiers = list(unique.values())
+        # 长的在前，避免前缀较短的标识符抢先匹配
+        encoded = sorted((key.encode('utf-8') for key in unique), key=len, reverse=True)
+        self.regex = re.compile(b"|".join(re.escape(item) for item in encoded), re.IGNORECASE)
+        self._by_lower = {key.encode('utf-8'): value for key, value in unique.items()}
+        self.max_length = max(len(item) for item in encoded)
+
+    def identifier_of(self, matched: bytes) -> str:
+        return self._by_lower[matched.lower()]
+
+    def scan(self, read, size: int, chunk_size: int = SCAN_CHUNK_SIZE) -> Iterator[Tuple[int, str]]:
+        """
+        分块扫描，产出 (偏移, 标识符)
+
+        read(n) 返回接下来的 n 个字节。相邻分块之间保留 max_length - 1 字节重叠，
+        跨越分块边界的匹配也能找到，且不会重复报告。
+        """
+        overlap = self.max_length - 1
+        buffer = bytearray(chunk_size + overlap)
+        carry = 0           # 缓冲区开头保留的上一块尾部字节数
+        base = 0            # 缓冲区第 0 字节在值中的偏移
+        remaining = size
+        while remaining > 0:
+            data = read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            end = carry + len(data)
+            buffer[carry:end] = data
+            with memoryview(buffer)[:end] as view:
+                for match in self.regex.finditer(view):
+                    # 完全落在重叠区内的匹配已在上一块报告过
+                    if match.end() > carry:
+                        yield base + match.start(), self.identifier_of(match.group())
+            keep = min(overlap, end)
+            buffer[:keep] = bytes(buffer[end - keep:end])
+            base += end - keep
+            carry = keep
+
+
+def _open_value(conn: sqlite3.Connection, rowid: int, readonly: bool):
+    try:
+        return conn.blobopen("ItemTable", "value", rowid, readonly=readonly)
+    except sqlite3.OperationalError:
+        # NULL 或数值类型的值
+        return None
+
+
+def scan_database_values(db_path: Path, identifiers: Sequence[str], rewrite: bool = False,
+                         replacements: Optional[Dict[str, str]] = None,
+                         chunk_size: int = SCAN_CHUNK_SIZE,
+                         max_lock_wait: float = DEFAULT_MAX_LOCK_WAIT) -> dict:
+    """
+    扫描（并可选地改写）state.vscdb 中所有值里出现的标识符
+
+    只读扫描以 mode=ro 打开数据库；改写时先做在线备份（备份失败时不改写，抛出 OSError），
+    再在一个 IMMEDIATE 事务中通过可写 BLOB 句柄按原长度覆盖每处匹配。
+
+    Args:
+        db_path: 数据库路径
+        identifiers: 要查找的标识符
+        rewrite: 是否原地改写
+        replacements: 标识符 -> 新值（长度须相同），未指定的用 replacement_for 生成
+        chunk_size: 分块大小
+        max_lock_wait: 改写前的备份等待数据库锁的最长秒数
+
+    Returns:
+        dict: rows_scanned / bytes_scanned / matches（key、rowid、size、count、offsets）/
+              rewritten / replacements / backup / seconds
+    """
+    from .database_manager import backup_sqlite_database, open_cleanup_connection
+
+    if not BLOB_IO_SUPPORTED:
+        raise RuntimeError(BLOB_IO_UNSUPPORTED_MESSAGE)
+
+    matcher = MultiPatternMatcher(identifiers)
+    new_values: Dict[str, bytes] = {}
+    if rewrite:
+        replacements = {key.lower(): value for key, value in (replacements or {}).items()}
+        for identifier in matcher.identifiers:
+            new = replacements.get(identifier.lower()) or replacement_for(identifier)
+            if len(new.encode('utf-8')) != len(identifier.encode('utf-8')):
+                raise ValueError(f"替换值长度与原标识符不同: {identifier}")
+            new_values[identifier] = new.encode('utf-8')
+
+    started = time.perf_counter()
+    result = {
+        'rows_scanned': 0,
+        'bytes_scanned': 0,
+        'matches': [],
+        'rewritten': 0,
+        'replacements': {key: value.decode('utf-8') for key, value in new_values.items()},
+        'backup': None,
+        'seconds': 0.0,
+    }
+
+    if rewrite:
+        backup_path = backup_sqlite_database(db_path, max_lock_wait=max_lock_wait)
+        if not backup_path:
+            raise OSError(f"数据库备份失败，未进行改写: {db_path}")
+        result['backup'] = str(backup_path)
+        conn = open_cleanup_connection(db_path)
+        conn.execute("BEGIN IMMEDIATE")
+    else:
+        conn = sqlite3.connect(f"{Path(db_path).as_uri()}?mode=ro", uri=True)
+
+    try:
+        rows = conn.execute("SELECT rowid, key FROM ItemTable").fetchall()
+        for rowid, key in rows:
+            blob = _open_value(conn, rowid, readonly=not rewrite)
+            if blob is None:
+                continue
+            with blob:
+                size = len(blob)
+                result['rows_scanned'] += 1
+                result['bytes_scanned'] += size
+                entry = None
+                for offset, identifier in matcher.scan(blob.read, size, chunk_size):
+                    if entry is None:
+                        entry = {'key': key, 'rowid': rowid, 'size': size, 'count': 0, 'offsets': []}
+                        result['matches'].append(entry)
+                    entry['count'] += 1
+                    if len(entry['offsets']) < MAX_OFFSETS_PER_KEY:
+                        entry['offsets'].append({'identifier': identifier, 'offset': offset})
+                    if rewrite:
+                        # 只覆盖已读过的位置，不影响后续分块
+                        position = blob.tell()
+                        blob.seek(offset)
+                        blob.write(new_values[identifier])
+                        blob.seek(position)
+                        result['rewritten'] += 1
+        if rewrite:
+            conn.execute("COMMIT")
+    except BaseException:
+        if rewrite and conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    print_info(f"扫描 {result['rows_scanned']} 个值 ({result['bytes_scanned'] / 1024 / 1024:.1f} MB)，"
+               f"{len(result['matches'])} 个键包含标识符" +
+               (f"，改写 {result['rewritten']} 处" if rewrite else ""))
+    return result
@@ -8,15 +8,36 @@
 import json
 import os
 import shutil
-from datetime import datetime
+import sys
+
+from augment_tools_core.backup_store import get_backup_store
+from augment_tools_core.patch_manager import PatchManager
+from augment_tools_core.patch_logging import generate_log_aggregator
+from augment_tools_core.js_sanity import check_fragment, check_splice
+from augment_tools_core.patch_planner import PatchPlanner, PLAN_ALREADY_PATCHED, PLAN_PATCHABLE
+
+# 补丁模式
+# full: 全局覆盖 JSON.stringify 等函数并记录每次拦截（便于调试，开销较大）
+# lean: 只在 callApi 和网络边界拦截，不输出逐次日志（适合日常使用）
+PATCH_MODES = ('full', 'lean')
+
+# 敏感ID字段（lean 模式预先构建为 Set）
+SENSITIVE_ID_FIELDS = ['userId', 'deviceId', 'machineId', 'clientId', 'sessionId']
+
+# 注入到 callApi 开头的钩子（lean 模式）：payload 参数 i 仅在含敏感字段时被替换为脱敏副本
+LEAN_CALLAPI_HOOK = (' if (typeof i === "object" && i !== null && globalThis.__augPrivacy) '
+                     '{ i = globalThis.__augPrivacy.scrub(i); }')
 
 class EvidenceBasedPatchGenerator:
     """基于证据的补丁生成器"""
     
-    def __init__(self, analysis_file: str = 'smart_analysis_report.json'):
+    def __init__(self, analysis_file: str = 'smart_analysis_report.json', patch_mode: str = 'full'):
+        if patch_mode not in PATCH_MODES:
+            raise ValueError(f"不支持的补丁模式: {patch_mode}")
         self.analysis_file = analysis_file
         self.analysis_data = None
         self.patch_rules = {}
+        self.patch_mode = patch_mode
         
     def load_analysis_data(self):
         """加载分析数据"""
@@ -80,11 +101,23 @@ class EvidenceBasedPatchGenerator:
         
         return self.patch_rules
     
-    def create_evidence_based_patch(self):
-        """创建基于证据的补丁"""
-        print("\n🛡️ 创建基于证据的精确补丁")
+    def create_evidence_based_patch(self, mode: str = None):
+        """
+        创建基于证据的补丁
+        
+        Args:
+            mode: 'full' 或 'lean'，默认使用实例的补丁模式
+        """
+        mode = mode or self.patch_mode
+        if mode not in PATCH_MODES:
+            raise ValueError(f"不支持的补丁模式: {mode}")
+        
+        print(f"\n🛡️ 创建基于证据的精确补丁 (模式: {mode})")
         print("-" * 60)
         
+        if mode == 'lean':
+            return self._create_lean_patch()
+        
         # 基于分析结果的精确补丁
         patch_code = '''
 // ========== 基于证据的精确隐私补丁 ==========
@@ -93,6 +126,9 @@ class EvidenceBasedPatchGenerator:
 (function() {
     "use strict";
     
+    // 聚合日志：按类别计数，定时输出一行 [AUG-PATCH-SUMMARY] 汇总
+    __AUG_PATCH_LOG__
+    
     console.log("[EVIDENCE-BASED PATCH] 精确隐私保护已激活");
     
     // === 1. 严重威胁完全拦截 ===
@@ -101,7 +137,7 @@ class EvidenceBasedPatchGenerator:
     const originalSegmentTrack = globalThis.analytics?.track;
     if (originalSegmentTrack) {
         globalThis.analytics.track = function(...args) {
-            console.log("[CRITICAL BLOCK] Segment.io 分析调用被拦截:", args[0]);
+            augPatchLog("CRITICAL BLOCK: Segment.io 分析调用被拦截", args[0]);
             return Promise.resolve({ success: true, blocked: true });
         };
     }
@@ -115,7 +151,7 @@ class EvidenceBasedPatchGenerator:
             sensitiveIdFields.forEach(field => {
                 if (cleaned[field]) {
                     cleaned[field] = '[REDACTED]';
-                    console.log(`[CRITICAL BLOCK] 敏感ID字段 ${field} 已脱敏`);
+                    augPatchLog("CRITICAL BLOCK: 敏感ID字段已脱敏", field);
                 }
             });
             return originalJSONStringify.call(this, cleaned, replacer, space);
@@ -128,7 +164,7 @@ class EvidenceBasedPatchGenerator:
         const originalUserAgent = navigator.userAgent;
         Object.defineProperty(navigator, 'userAgent', {
             get: function() {
-                console.log("[CRITICAL BLOCK] UserAgent 访问被拦截");
+                augPatchLog("CRITICAL BLOCK: UserAgent 访问被拦截");
                 return 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36';
             },
             configurable: true
@@ -137,7 +173,7 @@ class EvidenceBasedPatchGenerator:
         // 拦截平台信息
         Object.defineProperty(navigator, 'platform', {
             get: function() {
-                console.log("[CRITICAL BLOCK] Platform 访问被拦截");
+                augPatchLog("CRITICAL BLOCK: Platform 访问被拦截");
                 return 'Win32';
             },
             configurable: true
@@ -159,12 +195,12 @@ class EvidenceBasedPatchGenerator:
                     (eventName.includes('telemetry') || 
                      eventName.includes('analytics') || 
                      eventName.includes('track'))) {
-                    console.log(`[HIGH BLOCK] ${funcName} 遥测事件被拦截:`, eventName);
+                    augPatchLog(`HIGH BLOCK: ${funcName} 遥测事件被拦截`, eventName);
                     return { success: true, blocked: true };
                 }
                 
                 // 允许其他事件通过
-                console.log(`[HIGH MONITOR] ${funcName} 非遥测事件:`, eventName);
+                augPatchLog(`HIGH MONITOR: ${funcName} 非遥测事件`, eventName);
                 return original.apply(this, args);
             };
         }
@@ -181,7 +217,7 @@ class EvidenceBasedPatchGenerator:
                 urlStr.includes('analytics') || 
                 urlStr.includes('/track') ||
                 urlStr.includes('/collect')) {
-                console.log("[HIGH BLOCK] 分析服务请求被拦截:", urlStr);
+                augPatchLog("HIGH BLOCK: 分析服务请求被拦截", urlStr);
                 return Promise.resolve(new Response('{"success": true, "blocked": true}', {
                     status: 200,
                     headers: { 'Content-Type': 'application/json' }
@@ -190,7 +226,7 @@ class EvidenceBasedPatchGenerator:
             
             // 监控其他网络请求
             if (urlStr.startsWith('http')) {
-                console.log("[NETWORK MONITOR] 网络请求:", urlStr);
+                augPatchLog("NETWORK MONITOR: 网络请求", urlStr);
             }
             
             // 允许所有其他请求
@@ -203,7 +239,7 @@ class EvidenceBasedPatchGenerator:
     // 监控错误报告 (发现 50 个威胁点)
     const originalConsoleError = console.error;
     console.error = function(...args) {
-        console.log("[ERROR MONITOR] 错误报告被监控:", args[0]);
+        augPatchLog("ERROR MONITOR: 错误报告被监控", args[0]);
         // 仍然允许错误输出，但记录监控
         return originalConsoleError.apply(this, args);
     };
@@ -227,7 +263,121 @@ class EvidenceBasedPatchGenerator:
 // HIGH THREATS MONITORED: telemetry_reporting, usage_tracking
 // CORE FUNCTIONS PRESERVED: vscode_apis, file_operations, language_features
 
-'''
+'''.replace('__AUG_PATCH_LOG__', generate_log_aggregator(source="evidence:full"))
+        
+        return patch_code
+    
+    def _create_lean_patch(self):
+        """
+        低开销补丁：不覆盖 JSON.stringify，只在 callApi 和 fetch 处拦截；
+        敏感字段用预先构建的 Set 判断，无匹配时不复制对象，也不输出逐次日志
+        """
+        fields = json.dumps(SENSITIVE_ID_FIELDS)
+        patch_code = '''
+// ========== 基于证据的精确隐私补丁 (lean) ==========
+// 只在 callApi 与网络边界拦截，热路径不分配对象、不输出日志
+
+(function() {
+    "use strict";
+    
+    if (globalThis.__augPrivacy) {
+        return;
+    }
+    
+    // 聚合日志：只在拦截/脱敏时计数，定时输出一行 [AUG-PATCH-SUMMARY] 汇总
+    __AUG_PATCH_LOG__
+    
+    // 拦截用户身份识别：预先构建的敏感字段集合
+    const SENSITIVE_ID_FIELDS = new Set(__FIELDS__);
+    const SENSITIVE_BODY_PATTERN = new RegExp('"(' + [...SENSITIVE_ID_FIELDS].join('|') + ')"\\s*:');
+    const BLOCKED_URL_PATTERN = /segment\\.io|analytics|\\/track|\\/collect/;
+    const hasOwn = Object.prototype.hasOwnProperty;
+    const stats = { redacted: 0, blocked: 0 };
+    
+    // 无敏感字段时原样返回；有匹配时才复制一次并脱敏
+    function scrub(value) {
+        if (typeof value !== "object" || value === null) {
+            return value;
+        }
+        let cleaned = null;
+        for (const field of SENSITIVE_ID_FIELDS) {
+            if (hasOwn.call(value, field) && value[field]) {
+                if (cleaned === null) {
+                    cleaned = Array.isArray(value) ? value.slice() : { ...value };
+                }
+                cleaned[field] = "[REDACTED]";
+                stats.redacted++;
+                augPatchLog("CRITICAL BLOCK: 敏感ID字段已脱敏", field);
+            }
+        }
+        return cleaned === null ? value : cleaned;
+    }
+    
+    globalThis.__augPrivacy = { scrub: scrub, stats: stats };
+    
+    // 拦截 Segment.io 分析服务
+    if (globalThis.analytics && typeof globalThis.analytics.track === "function") {
+        globalThis.analytics.track = function(event) {
+            stats.blocked++;
+            augPatchLog("CRITICAL BLOCK: Segment.io 分析调用被拦截", event);
+            return Promise.resolve({ success: true, blocked: true });
+        };
+    }
+    
+    // 网络边界：拦截分析请求，请求体只有在包含敏感字段时才解析并脱敏
+    const originalFetch = globalThis.fetch;
+    if (typeof originalFetch === "function") {
+        globalThis.fetch = function(url, options) {
+            const urlStr = typeof url === "string" ? url : String(url && url.url || url);
+            if (BLOCKED_URL_PATTERN.test(urlStr)) {
+                stats.blocked++;
+                augPatchLog("HIGH BLOCK: 分析服务请求被拦截", urlStr);
+                return Promise.resolve(new Response('{"success": true, "blocked": true}', {
+                    status: 200,
+                    headers: { "Content-Type": "application/json" }
+                }));
+            }
+            const body = options && options.body;
+            if (typeof body === "string" && SENSITIVE_BODY_PATTERN.test(body)) {
+                try {
+                    const parsed = JSON.parse(body);
+                    const cleaned = scrub(parsed);
+                    if (cleaned !== parsed) {
+                        options = Object.assign({}, options, { body: JSON.stringify(cleaned) });
+                    }
+                } catch (e) {
+                    // 非 JSON 请求体保持原样
+                }
+            }
+            return originalFetch.call(this, url, options);
+        };
+    }
+    
+    // 拦截设备指纹采集（固定值，不记录访问日志）
+    if (typeof navigator !== "undefined") {
+        try {
+            Object.defineProperty(navigator, "userAgent", {
+                value: "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+                configurable: true
+            });
+            Object.defineProperty(navigator, "platform", { value: "Win32", configurable: true });
+        } catch (e) {
+            // 只读环境下忽略
+        }
+    }
+    
+    console.log("[EVIDENCE-BASED PATCH] 低开销隐私保护已激活 (lean)");
+    
+})();
+
+// ========== 补丁标识符 ==========
+// EVIDENCE-BASED PATCH APPLIED
+// PATCH MODE: lean
+// CRITICAL THREATS BLOCKED: segment_analytics, user_identification, device_fingerprinting
+// HIGH THREATS MONITORED: usage_tracking
+// CORE FUNCTIONS PRESERVED: vscode_apis, file_operations, language_features
+
+'''.replace('__FIELDS__', fields).replace('__AUG_PATCH_LOG__', generate_log_aggregator(source="evidence:lean"))
         
         return patch_code
     
@@ -236,10 +386,12 @@ class EvidenceBasedPatchGenerator:
         print("\n🔧 应用基于证据的补丁")
         print("-" * 60)
         
-        # 备份原文件
-        backup_name = f"extension_backup_evidence_{datetime.now().strftime('%Y%m%d_%H%M%S')}.js"
-        shutil.copy2("extension.js", backup_name)
-        print(f"✅ 原文件已备份: {backup_name}")
+        # 备份原文件到内容寻址仓库（内容未变化时只做一次哈希校验）
+        digest = get_backup_store().store_file("extension.js")
+        if not digest:
+            print("❌ 原文件备份失败")
+            return False
+        print(f"✅ 原文件已备份: sha256 {digest[:12]}")
         
         # 读取当前文件
         with open("extension.js", 'r', encoding='utf-8') as f:
@@ -248,7 +400,25 @@ class EvidenceBasedPatchGenerator:
         # 生成补丁代码
         patch_code = self.create_evidence_based_patch()
         
+        # 写入前检查补丁代码的括号和字符串配对
+        error = check_fragment(patch_code)
+        if error:
+            print(f"❌ 补丁代码语法检查失败: {error}")
+            return False
+        
         # 应用补丁
+        if self.patch_mode == 'lean':
+            # lean 模式在 callApi 开头注入脱敏钩子
+            match = PatchManager()._find_callapi_function(content)
+            if match:
+                error = check_splice(content, match.start(), match.end(), LEAN_CALLAPI_HOOK)
+                if error:
+                    print(f"❌ callApi 注入点检查失败: {error}")
+                    return False
+                content = content[:match.end()] + LEAN_CALLAPI_HOOK + content[match.end():]
+                print("✅ callApi 脱敏钩子已注入")
+            else:
+                print("⚠️ 未找到 async callApi 函数，仅启用网络边界拦截")
         patched_content = patch_code + "\n" + content
         
         # 写入补丁后的文件
@@ -262,6 +432,31 @@ class EvidenceBasedPatchGenerator:
         
         return True
     
+    def plan_evidence_based_patch(self, file_path: str = "extension.js"):
+        """预演基于证据的补丁：只输出将要插入的位置和 diff 片段，不修改文件"""
+        print("\n🔎 预演基于证据的补丁 (dry-run)")
+        print("-" * 60)
+        
+        patch_code = (self.create_evidence_based_patch() + "\n").encode('utf-8')
+        
+        def locate(buf, size):
+            if buf.find(b'EVIDENCE-BASED PATCH APPLIED') >= 0:
+                return PLAN_ALREADY_PATCHED, [], "文件已包含基于证据的补丁"
+            insertions = [(0, patch_code, None)]
+            if self.patch_mode == 'lean':
+                match = PatchManager()._find_callapi_function(buf)
+                if match:
+                    insertions.append((match.end(), LEAN_CALLAPI_HOOK.encode('utf-8'), match.start()))
+            return PLAN_PATCHABLE, insertions, ""
+        
+        plan = PatchPlanner().plan_insertions(file_path, locate)
+        diff = plan.format_diff(f"evidence-based, mode={self.patch_mode}")
+        if diff:
+            print(diff, end="")
+        print(f"📊 状态: {plan.status} {plan.message}".rstrip())
+        print(f"📈 将增加: {plan.added_bytes:,} 字节")
+        return plan
+    
     def verify_patch_effectiveness(self):
         """验证补丁有效性"""
         print("\n🧪 验证补丁有效性")
@@ -287,12 +482,20 @@ class EvidenceBasedPatchGenerator:
                 print(f"  ❌ 缺失标识: {signature}")
         
         # 检查关键拦截代码
-        critical_blocks = [
-            'Segment.io 分析调用被拦截',
-            '敏感ID字段',
-            'UserAgent 访问被拦截',
-            '遥测事件被拦截'
-        ]
+        if self.patch_mode == 'lean':
+            critical_blocks = [
+                'globalThis.__augPrivacy = { scrub',
+                'SENSITIVE_ID_FIELDS = new Set',
+                'BLOCKED_URL_PATTERN',
+                'globalThis.__augPrivacy.scrub(i)'
+            ]
+        else:
+            critical_blocks = [
+                'Segment.io 分析调用被拦截',
+                '敏感ID字段',
+                'UserAgent 访问被拦截',
+                '遥测事件被拦截'
+            ]
         
         blocks_found = 0
         for block in critical_blocks:
@@ -346,16 +549,25 @@ class EvidenceBasedPatchGenerator:
 
 def main():
     """主函数"""
+    # 可通过命令行参数选择 full / lean 模式，先校验再改动任何文件
+    patch_mode = sys.argv[1] if len(sys.argv) > 1 else 'full'
+    if len(sys.argv) > 2 or patch_mode not in PATCH_MODES:
+        print(f"用法: python {os.path.basename(sys.argv[0])} [{'|'.join(PATCH_MODES)}]")
+        print(f"❌ 不支持的补丁模式: {' '.join(sys.argv[1:])}")
+        sys.exit(2)
+    
     # 首先恢复到原始文件
     print("🔄 恢复到原始文件")
     backup_files = [f for f in os.listdir('.') if f.startswith('extension_backup_') and f.endswith('.js')]
-    if backup_files:
+    if get_backup_store().latest("extension.js"):
+        get_backup_store().restore("extension.js")
+    elif backup_files:
         latest_backup = max(backup_files, key=lambda x: os.path.getctime(x))
         shutil.copy2(latest_backup, "extension.js")
         print(f"✅ 已恢复到: {latest_backup}")
     
     # 运行基于证据的补丁
-    patcher = EvidenceBasedPatchGenerator()
+    patcher = EvidenceBasedPatchGenerator(patch_mode=patch_mode)
     success = patcher.run_evidence_based_patching()
     
     if success:
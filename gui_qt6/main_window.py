@@ -194,6 +194,13 @@ class AugmentCodeApp:
 
 def main():
     """主函数 - 启动PyQt6应用"""
+    # 回滚上次异常退出时未完成的补丁事务
+    try:
+        from augment_tools_core.patch_transaction import recover_pending_transactions
+        recover_pending_transactions()
+    except Exception as e:
+        print(f"恢复未完成的补丁事务失败: {e}")
+
     app = AugmentCodeApp()
     return app.run()
 
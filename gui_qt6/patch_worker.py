@@ -9,6 +9,9 @@ from typing import List, Optional, Dict
 from augment_tools_core.common_utils import IDEType, print_info, print_success, print_error, print_warning
 from augment_tools_core.patch_manager import PatchManager, PatchMode, PatchResult
 from augment_tools_core.extension_finder import ExtensionFinder
+from augment_tools_core.batch_patcher import (
+    BatchPatcher, EVENT_PROGRESS, EVENT_FILE_DONE, EVENT_IDE_DONE, EVENT_FINISHED
+)
 
 
 class PatchWorker(QThread):
@@ -32,40 +35,40 @@ class PatchWorker(QThread):
         try:
             self.progress_updated.emit("🔍 正在查找扩展文件...")
             
-            # 查找扩展文件
-            extension_files = self.extension_finder.find_extension_files(
-                self.ide_type, self.portable_root
-            )
+            # 查找扩展文件（只发现一次），交给并发补丁引擎处理
+            batch_patcher = BatchPatcher(self.patch_manager, self.extension_finder)
+            jobs, _ = batch_patcher.collect_jobs({
+                self.ide_type: {'patch_mode': self.patch_mode, 'portable_root': self.portable_root}
+            })
             
-            if not extension_files:
+            if not jobs:
                 self.patch_completed.emit(False, f"未找到 {self.ide_type.value} 的扩展文件")
                 return
             
-            self.progress_updated.emit(f"📁 找到 {len(extension_files)} 个扩展文件")
+            self.progress_updated.emit(f"📁 找到 {len(jobs)} 个扩展文件")
             
-            # 对每个文件应用补丁
+            # 并发补丁，在本线程中消费进度事件
             success_count = 0
-            total_files = len(extension_files)
+            total_files = len(jobs)
             
-            for i, file_path in enumerate(extension_files, 1):
-                self.progress_updated.emit(f"🔧 正在处理文件 {i}/{total_files}: {file_path}")
-                
-                # 检查文件状态
-                status = self.patch_manager.get_patch_status(file_path)
-                self.file_found.emit(file_path, status)
-                
-                if status == "已补丁":
-                    self.progress_updated.emit(f"⏭️ 文件已补丁，跳过: {file_path}")
-                    continue
-                
-                # 应用补丁
-                result = self.patch_manager.apply_patch(file_path, self.patch_mode)
-                
-                if result.success:
-                    success_count += 1
-                    self.progress_updated.emit(f"✅ 补丁成功: {file_path}")
-                else:
-                    self.progress_updated.emit(f"❌ 补丁失败: {result.message}")
+            batch_patcher.start(jobs)
+            for event in batch_patcher.iter_events():
+                if event[0] == EVENT_PROGRESS:
+                    self.progress_updated.emit(event[1])
+                elif event[0] == EVENT_FILE_DONE:
+                    file_result = event[2]
+                    file_path = file_result['path']
+                    
+                    if file_result['success']:
+                        success_count += 1
+                        self.file_found.emit(file_path, "已补丁")
+                        self.progress_updated.emit(f"✅ 补丁成功: {file_path}")
+                    elif file_result['already_patched']:
+                        self.file_found.emit(file_path, "已补丁")
+                        self.progress_updated.emit(f"⏭️ 文件已补丁，跳过: {file_path}")
+                    else:
+                        self.file_found.emit(file_path, "未补丁")
+                        self.progress_updated.emit(f"❌ 补丁失败: {file_result['message']}")
             
             # 完成总结
             if success_count > 0:
@@ -201,7 +204,7 @@ class BatchPatchWorker(QThread):
     batch_completed = pyqtSignal(bool, str, dict)  # 批量完成 (成功, 消息, 详细结果)
     ide_completed = pyqtSignal(str, bool, str)  # 单个IDE完成 (IDE类型, 成功, 消息)
     
-    def __init__(self, ide_configs: Dict[IDEType, Dict]):
+    def __init__(self, ide_configs: Dict[IDEType, Dict], transactional: bool = False):
         """
         ide_configs: {
             IDEType.VSCODE: {
@@ -210,9 +213,11 @@ class BatchPatchWorker(QThread):
             },
             ...
         }
+        transactional: 所有文件作为一个事务提交，任一失败则全部保持原样
         """
         super().__init__()
         self.ide_configs = ide_configs
+        self.transactional = transactional
         self.patch_manager = PatchManager()
         self.extension_finder = ExtensionFinder()
         
@@ -222,51 +227,37 @@ class BatchPatchWorker(QThread):
             self.progress_updated.emit("🚀 开始批量补丁操作...")
             
             total_ides = len(self.ide_configs)
-            results = {}
             overall_success = True
             
-            for i, (ide_type, config) in enumerate(self.ide_configs.items(), 1):
-                self.progress_updated.emit(f"🔧 正在处理 {ide_type.value} ({i}/{total_ides})...")
-                
-                patch_mode = config.get('patch_mode', PatchMode.RANDOM)
-                portable_root = config.get('portable_root')
-                
-                # 查找扩展文件
-                extension_files = self.extension_finder.find_extension_files(ide_type, portable_root)
-                
-                if not extension_files:
-                    message = f"未找到扩展文件"
-                    results[ide_type.value] = {'success': False, 'message': message, 'files': []}
-                    self.ide_completed.emit(ide_type.value, False, message)
-                    overall_success = False
-                    continue
-                
-                # 应用补丁
-                success_count = 0
-                file_results = []
-                
-                for file_path in extension_files:
-                    result = self.patch_manager.apply_patch(file_path, patch_mode)
-                    file_results.append({
-                        'path': file_path,
-                        'success': result.success,
-                        'message': result.message
-                    })
-                    if result.success:
-                        success_count += 1
-                
-                # 记录结果
-                ide_success = success_count > 0
-                message = f"成功补丁 {success_count}/{len(extension_files)} 个文件"
-                results[ide_type.value] = {
-                    'success': ide_success,
-                    'message': message,
-                    'files': file_results
-                }
-                
-                self.ide_completed.emit(ide_type.value, ide_success, message)
-                if not ide_success:
-                    overall_success = False
+            # 所有IDE只做一次发现，然后所有文件一起进入有界线程池
+            batch_patcher = BatchPatcher(self.patch_manager, self.extension_finder,
+                                         transactional=self.transactional)
+            jobs, missing = batch_patcher.collect_jobs(self.ide_configs)
+            
+            for ide_type in missing:
+                message = f"未找到扩展文件"
+                self.ide_completed.emit(ide_type.value, False, message)
+                overall_success = False
+            
+            results = {}
+            batch_patcher.start(jobs)
+            for event in batch_patcher.iter_events():
+                if event[0] == EVENT_PROGRESS:
+                    self.progress_updated.emit(event[1])
+                elif event[0] == EVENT_FILE_DONE:
+                    file_result = event[2]
+                    status = "✅" if file_result['success'] else "❌"
+                    self.progress_updated.emit(f"{status} [{event[1]}] {file_result['path']}")
+                elif event[0] == EVENT_IDE_DONE:
+                    _, ide_value, ide_success, message = event
+                    self.ide_completed.emit(ide_value, ide_success, message)
+                    if not ide_success:
+                        overall_success = False
+                elif event[0] == EVENT_FINISHED:
+                    results = event[1]
+            
+            for ide_type in missing:
+                results[ide_type.value] = {'success': False, 'message': "未找到扩展文件", 'files': []}
             
             # 完成总结
             if overall_success:
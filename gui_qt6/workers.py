@@ -9,8 +9,9 @@ from PyQt6.QtCore import QThread, pyqtSignal
 from augment_tools_core.common_utils import (
     IDEType, get_ide_display_name, get_ide_process_names
 )
-from augment_tools_core.database_manager import clean_ide_database, clean_ide_database_enhanced
+from augment_tools_core.database_manager import BackupCancelled, clean_ide_database_enhanced
 from augment_tools_core.telemetry_manager import modify_ide_telemetry_ids
+from augment_tools_core.session import MaintenanceSession
 
 
 class BaseWorker(QThread):
@@ -95,6 +96,17 @@ class CleanDatabaseWorker(BaseWorker):
         self.ide_type = ide_type
         self.keyword = keyword
         self.ide_name = get_ide_display_name(ide_type)
+        self._last_backup_percent = -1
+
+    def _on_backup_progress(self, copied: int, total: int):
+        """备份进度回调（在工作线程中调用），每 10% 报告一次；取消时中止备份"""
+        if self.is_cancelled:
+            raise BackupCancelled()
+        percent = copied * 100 // total if total else 100
+        if percent >= self._last_backup_percent + 10 or (percent == 100 and self._last_backup_percent < 100):
+            self._last_backup_percent = percent
+            self.emit_progress(f"正在备份数据库: {percent}% "
+                               f"({copied / 1048576:.1f} MB / {total / 1048576:.1f} MB)")
     
     def run(self):
         """执行清理数据库任务（增强版）"""
@@ -103,7 +115,9 @@ class CleanDatabaseWorker(BaseWorker):
             self.emit_status(f"正在清理 {self.ide_name} 数据库...", "info")
 
             # 使用增强版数据库清理，获取详细结果
-            result = clean_ide_database_enhanced(self.ide_type, self.keyword)
+            result = clean_ide_database_enhanced(self.ide_type, self.keyword,
+                                                 backup_progress=self._on_backup_progress,
+                                                 wait_for_exit=True)
 
             if self.is_cancelled:
                 return
@@ -118,6 +132,9 @@ class CleanDatabaseWorker(BaseWorker):
                 if result["backup_created"]:
                     self.emit_progress("已自动创建数据库备份")
 
+                if result.get("lock_wait_seconds"):
+                    self.emit_progress(f"等待数据库锁 {result['lock_wait_seconds']:.1f} 秒")
+
                 self.emit_progress("数据库清理过程完成。")
                 self.emit_status("数据库清理完成", "success")
                 self.task_completed.emit(True)
@@ -190,24 +207,29 @@ class RunAllWorker(BaseWorker):
             if self.is_cancelled:
                 return
             
-            # 步骤2: 清理数据库
-            self.emit_progress(f"步骤 2: 清理 {self.ide_name} 数据库")
-            db_success = clean_ide_database(self.ide_type, self.keyword)
-            
-            if self.is_cancelled:
-                return
-            
-            if db_success:
-                self.emit_progress("数据库清理完成")
-            else:
-                self.emit_progress("数据库清理失败")
-            
-            # 步骤3: 修改遥测ID
-            self.emit_progress(f"步骤 3: 修改 {self.ide_name} 遥测ID")
-            id_success = modify_ide_telemetry_ids(self.ide_type)
-            
-            if self.is_cancelled:
-                return
+            # 后续步骤共用一个会话：路径只解析一次、修改前统一备份、共享数据库连接
+            with MaintenanceSession(self.ide_type, self.keyword, wait_for_exit=True) as session:
+                session.snapshot()
+
+                # 步骤2: 清理数据库
+                self.emit_progress(f"步骤 2: 清理 {self.ide_name} 数据库")
+                db_result = session.clean_database()
+                db_success = db_result["success"]
+
+                if self.is_cancelled:
+                    return
+
+                if db_success:
+                    self.emit_progress(f"数据库清理完成，删除 {db_result['entries_removed']} 个条目")
+                else:
+                    self.emit_progress(f"数据库清理失败: {db_result['error_message']}")
+
+                # 步骤3: 修改遥测ID
+                self.emit_progress(f"步骤 3: 修改 {self.ide_name} 遥测ID")
+                id_success = session.modify_telemetry_ids()
+
+                if self.is_cancelled:
+                    return
             
             if id_success:
                 self.emit_progress("遥测ID修改完成")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+注入补丁开销微基准
+在本地 Node.js 中分别加载 无补丁 / full / lean 三种运行时代码，
+测量 JSON.stringify、callApi 和 fetch 每次调用的耗时（纳秒）
+
+用法: python patch_overhead_benchmark.py [迭代次数]
+"""
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from evidence_based_patch_generator import EvidenceBasedPatchGenerator, LEAN_CALLAPI_HOOK
+
+DEFAULT_ITERATIONS = 200000
+
+# 每个模式在独立的 Node 进程中运行（补丁会修改全局对象）
+# __RUNTIME__ 为补丁代码，__HOOK__ 为注入 callApi 的代码，__ITERATIONS__ / __OUTPUT__ 由脚本替换
+HARNESS_TEMPLATE = r'''
+"use strict";
+const fs = require("fs");
+
+// 模拟扩展宿主中的网络层：补丁加载前定义，补丁会包装它
+globalThis.fetch = function(url, options) { return Promise.resolve(null); };
+
+__RUNTIME__
+
+class ApiClient {
+    async callApi(s, n, r, i) {__HOOK__
+        return i;
+    }
+}
+
+const plainPayload = { model: "default", prompt: "function add(a, b) {", path: "src/util.js", lang: "javascript", blobs: [1, 2, 3] };
+const sensitivePayload = Object.assign({ userId: "u-123", sessionId: "s-456" }, plainPayload);
+const plainBody = JSON.stringify(plainPayload);
+const api = new ApiClient();
+const iterations = __ITERATIONS__;
+
+function bench(fn) {
+    for (let k = 0; k < Math.min(iterations, 20000); k++) fn(k);
+    const start = process.hrtime.bigint();
+    for (let k = 0; k < iterations; k++) fn(k);
+    return Number(process.hrtime.bigint() - start) / iterations;
+}
+
+const results = {
+    "JSON.stringify(plain)": bench(() => JSON.stringify(plainPayload)),
+    "JSON.stringify(sensitive)": bench(() => JSON.stringify(sensitivePayload)),
+    "callApi(plain)": bench(() => api.callApi("chat-stream", null, null, plainPayload)),
+    "callApi(sensitive)": bench(() => api.callApi("chat-stream", null, null, sensitivePayload)),
+    "fetch(plain body)": bench(() => globalThis.fetch("https://api.example.com/chat-stream", { method: "POST", body: plainBody })),
+};
+
+fs.writeFileSync(__OUTPUT__, JSON.stringify(results));
+'''
+
+
+class PatchOverheadBenchmark:
+    """补丁开销基准测试"""
+
+    def __init__(self, iterations: int = DEFAULT_ITERATIONS, node_path: str = None):
+        self.iterations = iterations
+        self.node_path = node_path or shutil.which("node")
+        self.generator = EvidenceBasedPatchGenerator()
+        self.results = {}
+
+    def build_harness(self, mode: str, output_path: str) -> str:
+        """生成指定模式的基准脚本"""
+        if mode == 'baseline':
+            runtime, hook = "", ""
+        else:
+            with contextlib.redirect_stdout(io.StringIO()):
+                runtime = self.generator.create_evidence_based_patch(mode)
+            hook = LEAN_CALLAPI_HOOK if mode == 'lean' else ""
+
+        return (HARNESS_TEMPLATE
+                .replace("__RUNTIME__", runtime)
+                .replace("__HOOK__", hook)
+                .replace("__ITERATIONS__", str(self.iterations))
+                .replace("__OUTPUT__", json.dumps(output_path)))
+
+    def run_mode(self, mode: str) -> dict:
+        """在独立的 Node 进程中运行一个模式"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            script_path = os.path.join(temp_dir, f"bench_{mode}.js")
+            output_path = os.path.join(temp_dir, f"bench_{mode}.json")
+            with open(script_path, 'w', encoding='utf-8') as f:
+                f.write(self.build_harness(mode, output_path))
+
+            # 补丁的控制台日志属于被测开销的一部分，输出丢弃到 devnull
+            subprocess.run([self.node_path, script_path], check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            with open(output_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+    def run(self) -> dict:
+        """运行全部模式并打印对比结果"""
+        if not self.node_path:
+            print("⚠️ 未找到 Node.js，跳过基准测试")
+            return {}
+
+        print(f"⏱️ 补丁开销基准测试 (Node: {self.node_path}, 每项 {self.iterations:,} 次)")
+        print("=" * 80)
+
+        for mode in ('baseline', 'full', 'lean'):
+            try:
+                self.results[mode] = self.run_mode(mode)
+                print(f"  ✅ {mode} 完成")
+            except subprocess.CalledProcessError as e:
+                print(f"  ❌ {mode} 运行失败: {e.stderr.decode('utf-8', 'replace').strip()}")
+                return {}
+
+        baseline = self.results['baseline']
+        print(f"\n{'场景':<28}{'无补丁':>12}{'full':>12}{'lean':>12}{'full 开销':>14}{'lean 开销':>14}")
+        print("-" * 92)
+        for name, base_ns in baseline.items():
+            full_ns = self.results['full'][name]
+            lean_ns = self.results['lean'][name]
+            print(f"{name:<28}{base_ns:>10.1f}ns{full_ns:>10.1f}ns{lean_ns:>10.1f}ns"
+                  f"{full_ns - base_ns:>12.1f}ns{lean_ns - base_ns:>12.1f}ns")
+
+        return self.results
+
+
+def main():
+    """主函数"""
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ITERATIONS
+    PatchOverheadBenchmark(iterations).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,8 @@ import json
 from datetime import datetime
 from pathlib import Path
 
+from augment_tools_core.patch_logging import SUMMARY_PREFIX, parse_summary_lines
+
 class SimplePatchMonitor:
     """简单补丁监控器"""
     
@@ -21,7 +23,8 @@ class SimplePatchMonitor:
             'patch_status': 'unknown',
             'last_check': None,
             'issues_found': [],
-            'recommendations': []
+            'recommendations': [],
+            'patch_counters': {}
         }
     
     def check_patch_integrity(self):
@@ -78,9 +81,9 @@ class SimplePatchMonitor:
             
             # 查找日志输出代码
             log_patterns = [
-                r'console\.log.*CRITICAL BLOCK',
-                r'console\.log.*HIGH BLOCK', 
-                r'console\.log.*NETWORK MONITOR',
+                r'(console\.log|augPatchLog)\(.*CRITICAL BLOCK',
+                r'(console\.log|augPatchLog)\(.*HIGH BLOCK', 
+                r'(console\.log|augPatchLog)\(.*NETWORK MONITOR',
                 r'console\.log.*EVIDENCE-BASED PATCH'
             ]
             
@@ -102,6 +105,40 @@ class SimplePatchMonitor:
             print(f"  ❌ 检查日志代码失败: {e}")
             return False
     
+    def check_patch_summaries(self, log_dirs=None):
+        """读取扩展宿主日志中的补丁汇总行，直接累加计数器"""
+        print("🔍 读取补丁拦截汇总...")
+        
+        if log_dirs is None:
+            log_dirs = [
+                os.path.expanduser("~/.config/Code/logs"),
+                os.path.expanduser("~/AppData/Roaming/Code/logs"),
+                os.path.expanduser("~/Library/Application Support/Code/logs"),
+            ]
+        
+        lines = []
+        for log_dir in log_dirs:
+            if not os.path.isdir(log_dir):
+                continue
+            for log_file in Path(log_dir).rglob("exthost*.log"):
+                try:
+                    with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
+                        lines.extend(line for line in f if SUMMARY_PREFIX in line)
+                except OSError:
+                    continue
+        
+        summary = parse_summary_lines(lines)
+        self.monitoring_data['patch_counters'] = summary['counts']
+        
+        if summary['summaries'] == 0:
+            print("  ℹ️ 暂无补丁汇总日志（补丁每分钟或累计一定事件后输出一次）")
+            return summary
+        
+        print(f"  ✅ 解析 {summary['summaries']} 条汇总，共 {summary['events']} 个拦截事件")
+        for category, count in sorted(summary['counts'].items(), key=lambda item: -item[1]):
+            print(f"    • {category}: {count}")
+        return summary
+    
     def check_extension_functionality(self):
         """检查扩展功能完整性"""
         print("🔍 检查扩展功能完整性...")
@@ -212,6 +249,7 @@ class SimplePatchMonitor:
         # 执行检查
         integrity_ok = self.check_patch_integrity()
         logs_ok = self.check_vscode_console_logs()
+        self.check_patch_summaries()
         functionality_ok = self.check_extension_functionality()
         
         # 生成建议
@@ -289,7 +327,7 @@ def main():
             print("\n💡 下一步:")
             print("• 重启 VSCode 测试扩展功能")
             print("• 打开开发者控制台 (Ctrl+Shift+I)")
-            print("• 查看是否有 [CRITICAL BLOCK] 等日志")
+            print("• 查看是否有 [AUG-PATCH-SUMMARY] 拦截汇总日志")
         else:
             print("\n🔧 需要处理的问题:")
             for issue in monitor.monitoring_data['issues_found']: